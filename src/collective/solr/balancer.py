@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+from collective.solr.timeout import HTTPConnectionWithTimeout
+from httplib import HTTPException
+from logging import getLogger
+from socket import error
+from threading import Event
+from threading import Lock
+from threading import Thread
+from time import time
+
+logger = getLogger('collective.solr.balancer')
+
+ALPHA = 0.3             # weight of the latest sample in moving averages
+MAX_ERROR_RATE = 0.5    # nodes failing more often than this get ejected
+PING_INTERVAL = 10      # seconds between background health checks
+PING_TIMEOUT = 5
+
+
+def parseNode(spec, base='/solr'):
+    """ split a "host:port/base" replica specification into host and base;
+        the base defaults to the given one if not specified """
+    spec = spec.strip()
+    if '://' in spec:
+        spec = spec.split('://', 1)[1]
+    if '/' in spec:
+        host, path = spec.split('/', 1)
+        base = '/' + path.rstrip('/')
+    else:
+        host = spec
+    return host, base
+
+
+def pingNode(node, timeout=PING_TIMEOUT):
+    """ check a node's health using solr's ping handler """
+    conn = HTTPConnectionWithTimeout(node.host, timeout=timeout)
+    try:
+        conn.request('GET', '%s/admin/ping' % node.base)
+        response = conn.getresponse()
+        response.read()
+        return response.status == 200
+    except (error, HTTPException):
+        return False
+    finally:
+        conn.close()
+
+
+class SolrNode(object):
+    """ a solr server answering search requests, along with exponentially
+        weighted moving averages of its search latency, ping round-trip
+        time and error rate """
+
+    def __init__(self, host, base):
+        self.host = host
+        self.base = base
+        self.latency = 0.0
+        self.rtt = 0.0
+        self.errors = 0.0
+        self.healthy = True
+        self.requests = 0       # searches since the last health check
+
+    def __repr__(self):
+        return '<SolrNode %s%s latency=%.3fs rtt=%.3fs errors=%.2f%s>' % (
+            self.host, self.base, self.latency, self.rtt, self.errors,
+            not self.healthy and ' (ejected)' or '')
+
+    def succeeded(self, elapsed):
+        self.latency += ALPHA * (elapsed - self.latency)
+        self.errors -= ALPHA * self.errors
+        self.requests += 1
+
+    def pinged(self, elapsed):
+        self.rtt += ALPHA * (elapsed - self.rtt)
+
+    def failed(self):
+        self.errors += ALPHA * (1 - self.errors)
+        if self.errors > MAX_ERROR_RATE:
+            self.healthy = False
+
+
+class LoadBalancer(object):
+    """ route search requests to the fastest healthy node;  nodes failing
+        too often get ejected and are re-admitted by a background thread
+        once they answer pings again """
+
+    def __init__(self, nodes, ping=pingNode, interval=PING_INTERVAL):
+        self.config = tuple(nodes)
+        self.nodes = [SolrNode(host, base) for host, base in nodes]
+        self.ping = ping
+        self.interval = interval
+        self.lock = Lock()
+        self.stopped = Event()
+        self.thread = None
+
+    def __repr__(self):
+        return '<LoadBalancer %r>' % self.nodes
+
+    def choose(self, exclude=()):
+        """ return the healthy node with the lowest average latency; if all
+            nodes have been ejected the least failing one is tried anyway """
+        with self.lock:
+            nodes = [n for n in self.nodes if n not in exclude]
+            healthy = [n for n in nodes if n.healthy]
+            if healthy:
+                return min(healthy, key=lambda n: n.latency)
+            elif nodes:
+                return min(nodes, key=lambda n: n.errors)
+
+    def succeeded(self, node, elapsed):
+        with self.lock:
+            node.succeeded(elapsed)
+
+    def failed(self, node):
+        with self.lock:
+            node.failed()
+            if not node.healthy:
+                logger.warning('ejecting unresponsive solr node %r', node)
+
+    def check(self):
+        """ ping all nodes to eject failing and re-admit recovered ones;
+            the round-trip times are only kept as a health metric, since
+            pings say little about search latency;  instead, the latency of
+            nodes not searched since the last check decays towards the
+            average of all healthy nodes, so a node avoided after a few
+            slow responses (e.g. during a gc pause) gets chosen again once
+            the others get slower than that """
+        for node in self.nodes:
+            start = time()
+            alive = self.ping(node)
+            elapsed = time() - start
+            with self.lock:
+                if alive:
+                    if not node.healthy:
+                        logger.info('re-admitting solr node %r', node)
+                        node.errors = 0.0
+                        node.healthy = True
+                    node.pinged(elapsed)
+                elif node.healthy:
+                    logger.warning('ejecting solr node %r', node)
+                    node.healthy = False
+        with self.lock:
+            healthy = [node for node in self.nodes if node.healthy]
+            if healthy:
+                mean = sum(node.latency for node in healthy) / len(healthy)
+                for node in healthy:
+                    if not node.requests:
+                        node.latency += ALPHA * (mean - node.latency)
+                    node.requests = 0
+
+    def run(self):
+        while True:
+            self.stopped.wait(self.interval)
+            if self.stopped.isSet():
+                break
+            try:
+                self.check()
+            except Exception:
+                logger.exception('error while checking solr nodes')
+
+    def start(self):
+        """ start the background health checks """
+        if self.thread is None and self.nodes:
+            self.thread = Thread(target=self.run,
+                                 name='collective.solr.balancer')
+            self.thread.setDaemon(True)
+            self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+
+balancer = None
+balancerLock = Lock()
+
+
+def getBalancer(nodes):
+    """ return the process-wide balancer for the given (host, base) pairs,
+        replacing the current one if the configured nodes have changed """
+    global balancer
+    nodes = tuple(nodes)
+    with balancerLock:
+        if balancer is None or balancer.config != nodes:
+            if balancer is not None:
+                balancer.stop()
+            balancer = LoadBalancer(nodes)
+            balancer.start()
+        return balancer
+
+
+def clearBalancer():
+    """ stop and forget the current balancer """
+    global balancer
+    with balancerLock:
+        if balancer is not None:
+            balancer.stop()
+        balancer = None
@@ -59,6 +59,18 @@ def notimeout(func):
     return wrapper
 
 
+def sending(proc, func):
+    """ wrap a function sending updates to solr, so that the documents
+        deferred until their digests are checked get sent first """
+    def wrapper(*args, **kw):
+        try:
+            proc.sendDeferred()
+            return func(*args, **kw)
+        finally:
+            proc.clearDigests()
+    return wrapper
+
+
 class SolrMaintenanceView(BrowserView):
     """ helper view for indexing all portal content in Solr """
     implements(ISolrMaintenanceView)
@@ -119,8 +131,7 @@ class SolrMaintenanceView(BrowserView):
         schema = manager.getSchema()
         key = schema.uniqueKey
         updates = {}            # list to hold data to be updated
-        flush = lambda: conn.flush()
-        flush = notimeout(flush)
+        flush = notimeout(sending(proc, conn.flush))
 
         def checkPoint():
             for my_boost_values, data in updates.values():
@@ -154,13 +165,16 @@ class SolrMaintenanceView(BrowserView):
                 if not missing:
                     value = data.get(key, None)
                     if value is not None:
-                        log('indexing %r\n' % obj)
                         pt = data.get('portal_type', 'default')
                         adder = queryAdapter(obj, ISolrAddHandler, name=pt)
                         if adder is None:
                             adder = DefaultAdder(obj)
-                        data['_solr_adder'] = adder
-                        updates[value] = (boost_values(obj, data), data)
+                        boost = boost_values(obj, data)
+                        log('indexing %r\n' % obj)
+                        # documents with digests are checked in batches
+                        if not proc.defer(obj, adder, data, boost, key):
+                            data['_solr_adder'] = adder
+                            updates[value] = (boost, data)
                         processed += 1
                         cpi.next()
                 else:
@@ -169,8 +183,10 @@ class SolrMaintenanceView(BrowserView):
                     break
 
         checkPoint()
-        conn.commit()
+        sending(proc, conn.commit)()
         log('solr index rebuilt.\n')
+        if proc.skipped:
+            log('skipped %d unchanged item(s).\n' % proc.skipped)
         msg = 'processed %d items in %s (%s cpu time).'
         msg = msg % (processed, real.next(), cpu.next())
         log(msg)
@@ -194,16 +210,10 @@ class SolrMaintenanceView(BrowserView):
         real = timer()          # real time
         lap = timer()           # real lap time (for intermediate commits)
         cpu = timer(clock)      # cpu time
-        # get Solr status
-        response = conn.search(
-            q=preImportDeleteQuery,
-            rows=MAX_ROWS,
-            fl='%s modified' % key)
         # avoid creating DateTime instances
         simple_unmarshallers = unmarshallers.copy()
         simple_unmarshallers['date'] = parse_date_as_datetime
-        flares = SolrResponse(response, simple_unmarshallers)
-        response.close()
+        flares = SolrResponse(None, simple_unmarshallers)
         solr_results = {}
         solr_uids = set()
 
@@ -211,10 +221,22 @@ class SolrMaintenanceView(BrowserView):
             t_tup = value.utctimetuple()
             return ((((t_tup[0] * 12 + t_tup[1]) * 31 + t_tup[2])
                     * 24 + t_tup[3]) * 60 + t_tup[4])
-        for flare in flares:
-            uid = flare[key]
-            solr_uids.add(uid)
-            solr_results[uid] = _utc_convert(flare['modified'])
+        # get Solr status
+        response = None
+        try:
+            response = conn.search(
+                q=preImportDeleteQuery,
+                rows=MAX_ROWS,
+                fl='%s modified' % key,
+                wt='javabin')       # compact & fast to decode for all items
+            for flare in flares.streamJavabin(response):    # constant memory
+                uid = flare[key]
+                solr_uids.add(uid)
+                solr_results[uid] = _utc_convert(flare['modified'])
+        finally:
+            if response is not None:
+                response.close()
+            conn.release()      # hand the http connection back
         # get catalog status
         cat_results = {}
         cat_uids = set()
@@ -226,7 +248,7 @@ class SolrMaintenanceView(BrowserView):
         solr_uids.difference_update(cat_uids)
         unindex = solr_uids
         processed = 0
-        flush = notimeout(lambda: conn.flush())
+        flush = notimeout(sending(proc, conn.flush))
 
         def checkPoint():
             msg = 'intermediate commit (%d items processed, ' \
@@ -259,7 +281,11 @@ class SolrMaintenanceView(BrowserView):
                 return None
             return obj
         log('processing %d "unindex" operations next...\n' % len(unindex))
-        op = notimeout(lambda uid: conn.delete(id=uid))
+
+        def delete(uid):
+            proc.forget(uid)
+            conn.delete(id=uid)
+        op = notimeout(delete)
         for uid in unindex:
             obj = lookup(uid)
             if obj is None:
@@ -269,11 +295,15 @@ class SolrMaintenanceView(BrowserView):
             else:
                 log('not unindexing existing object %r.\n' % uid)
         log('processing %d "index" operations next...\n' % len(index))
-        op = notimeout(lambda obj: proc.index(obj))
+
+        def add(obj, uid):
+            proc.forget(uid)        # missing in solr, no need to look it up
+            proc.index(obj)
+        op = notimeout(add)
         for uid in index:
             obj = lookup(uid)
             if ICheckIndexable(obj)():
-                op(obj)
+                op(obj, uid)
                 processed += 1
                 cpi.next()
             else:
@@ -300,8 +330,10 @@ class SolrMaintenanceView(BrowserView):
                     log('not reindexing unindexable object %r.\n' % uid)
                 if obj is not None:
                     obj._p_deactivate()
-        conn.commit()
+        sending(proc, conn.commit)()
         log('solr index synced.\n')
+        if proc.skipped > 0:
+            log('skipped %d unchanged object(s).\n' % proc.skipped)
         msg = 'processed %d object(s) in %s (%s cpu time).'
         msg = msg % (processed, real.next(), cpu.next())
         log(msg)
@@ -317,8 +349,18 @@ class SolrMaintenanceView(BrowserView):
         log('cleaning up solr index...\n')
         key = manager.getSchema().uniqueKey
 
+        def search(**params):
+            try:
+                response = conn.search(**params)
+                try:
+                    return SolrResponse(response)
+                finally:
+                    response.close()
+            finally:
+                conn.release()      # hand the http connection back
+
         start = 0
-        resp = SolrResponse(conn.search(q='*:*', rows=batch, start=start))
+        resp = search(q='*:*', rows=batch, start=start)
         res = resp.results()
         log('%s items in solr catalog\n' % resp.response.numFound)
         deleted = 0
@@ -330,6 +372,7 @@ class SolrMaintenanceView(BrowserView):
                 except Exception as err:
                     log('Error getting object, removing: %s (%s)\n' % (
                         flare['path_string'], err))
+                    proc.forget(flare[key])
                     conn.delete(flare[key])
                     deleted += 1
                     continue
@@ -345,10 +388,10 @@ class SolrMaintenanceView(BrowserView):
                 if uuid != flare[key]:
                     log('indexed under wrong UID, removing: %s\n' %
                         flare['path_string'])
+                    proc.forget(flare[key], uuid)
                     conn.delete(flare[key])
                     deleted += 1
-                    realob_res = SolrResponse(conn.search(q='%s:%s' %
-                                              (key, uuid))).results()
+                    realob_res = search(q='%s:%s' % (key, uuid)).results()
                     if len(realob_res) == 0:
                         log('no sane entry for last object, reindexing\n')
                         data, missing = proc.getData(ob)
@@ -362,7 +405,7 @@ class SolrMaintenanceView(BrowserView):
             log('handled batch of %d items, commiting\n' % len(res))
             conn.commit()
             start += batch
-            resp = SolrResponse(conn.search(q='*:*', rows=batch, start=start))
+            resp = search(q='*:*', rows=batch, start=start)
             res = resp.results()
         finished_msg = 'solr cleanup finished, %s item(s) removed, ' + \
             '%s item(s) reindexed\n'
@@ -15,7 +15,7 @@ class SuggestView(BrowserView):
         if not term:
             return json.dumps(suggestions)
         manager = getUtility(ISolrConnectionManager)
-        connection = manager.getConnection()
+        connection = manager.getSearchConnection()
 
         if connection is None:
             return json.dumps(suggestions)
@@ -25,9 +25,12 @@ class SuggestView(BrowserView):
         params['wt'] = 'json'
 
         params = urllib.urlencode(params, doseq=True)
-        response = connection.doGet(
-            connection.solrBase + '/spell?' + params, {})
-        results = json.loads(response.read())
+        try:
+            response = connection.doGet(
+                connection.solrBase + '/spell?' + params, {})
+            results = json.loads(response.read())
+        finally:
+            connection.release()
 
         # Check for spellcheck
         spellcheck = results.get('spellcheck', None)
@@ -62,7 +65,7 @@ class AutocompleteView(BrowserView):
         if not term:
             return json.dumps([])
         manager = getUtility(ISolrConnectionManager)
-        connection = manager.getConnection()
+        connection = manager.getSearchConnection()
 
         if connection is None:
             return json.dumps([])
@@ -72,9 +75,12 @@ class AutocompleteView(BrowserView):
         params['wt'] = 'json'
 
         params = urllib.urlencode(params, doseq=True)
-        response = connection.doPost(
-            connection.solrBase + '/autocomplete?' + params, '', {})
-        results = json.loads(response.read())
+        try:
+            response = connection.doPost(
+                connection.solrBase + '/autocomplete?' + params, '', {})
+            results = json.loads(response.read())
+        finally:
+            connection.release()
 
         if 'grouped' not in results:
             return json.dumps([])
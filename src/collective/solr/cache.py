@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict
+from hashlib import sha1
+from threading import Lock
+from time import time
+
+SEARCHER_DELAY = 10     # seconds until a new searcher is expected to be used
+AUTOCOMMIT_DELAY = 60   # seconds until solr is expected to commit by itself
+
+
+class LRUCache(object):
+    """ a bounded mapping shared between threads, which discards the least
+        recently used entries once it's full """
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return '<LRUCache size=%d, maxsize=%d, hits=%d, misses=%d>' % (
+            len(self.data), self.maxsize, self.hits, self.misses)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def get(self, key, default=None):
+        """ return the cached value, marking it as recently used """
+        with self.lock:
+            try:
+                value = self.data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self.data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """ store a value, discarding the oldest entries if needed """
+        with self.lock:
+            self.data.pop(key, None)
+            self.data[key] = value
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+def normalize(value):
+    """ return a version of the given value with a stable representation,
+        i.e. with the items of dictionaries and sets sorted """
+    if isinstance(value, dict):
+        return sorted((key, normalize(item)) for key, item in value.items())
+    elif isinstance(value, (set, frozenset)):
+        return sorted(normalize(item) for item in value)
+    elif isinstance(value, (list, tuple)):
+        return [normalize(item) for item in value]
+    return value
+
+
+def documentDigest(data, boost=None):
+    """ return a digest of the given (prepared) index data and boost
+        values, which only changes along with the document sent to solr """
+    return sha1(repr((normalize(data), normalize(boost or {})))).hexdigest()
+
+
+def visibilityDelay(config, wait=True):
+    """ return the number of seconds until updates sent using the given
+        configuration can be expected to show up in search results, i.e.
+        after `commitWithin`, solr's own automatic commits or a commit not
+        waiting for the new searcher """
+    if getattr(config, 'commit_within', 0):
+        return config.commit_within / 1000.0 + SEARCHER_DELAY
+    elif not getattr(config, 'auto_commit', True):
+        return AUTOCOMMIT_DELAY + SEARCHER_DELAY
+    elif not wait:
+        return SEARCHER_DELAY
+    return 0
+
+
+class ResultCache(object):
+    """ a cache for raw search responses shared between threads, limited
+        by the total size of the cached data and the age of the entries;
+        committing changes to the index increases its generation and drops
+        all entries, and responses fetched for an older generation won't
+        be stored, so outdated results are never handed out again;  as long
+        as changes might still become visible later on, e.g. when using
+        "commitWithin", no responses are stored at all """
+
+    def __init__(self, maxbytes=0, ttl=0):
+        self.maxbytes = maxbytes
+        self.ttl = ttl
+        self.data = OrderedDict()   # key -> (expiry time or `None`, response)
+        self.size = 0
+        self.generation = 0
+        self.pending = 0            # time until changes might show up
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self):
+        return ('<ResultCache size=%d, bytes=%d, maxbytes=%d, generation=%d, '
+                'hits=%d, misses=%d>') % (len(self.data), self.size,
+                                          self.maxbytes, self.generation,
+                                          self.hits, self.misses)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def invalidate(self, delay=0):
+        """ mark all cached responses as outdated, i.e. after a commit;
+            if the changes might only become visible within `delay`
+            seconds, nothing is cached until then, after which the cache
+            gets invalidated once more """
+        with self.lock:
+            self.generation += 1
+            self.data.clear()
+            self.size = 0
+            if delay:
+                self.pending = max(self.pending, time() + delay)
+
+    def expire(self):
+        """ start a new generation once pending changes have become
+            visible;  the caller is expected to hold the lock """
+        if self.pending and self.pending <= time():
+            self.generation += 1
+            self.data.clear()
+            self.size = 0
+            self.pending = 0
+
+    def get(self, key, default=None):
+        """ return the cached response unless it has expired """
+        with self.lock:
+            self.expire()
+            entry = self.data.pop(key, None)
+            if entry is not None:
+                expires, response = entry
+                if expires is None or expires > time():
+                    self.data[key] = entry
+                    self.hits += 1
+                    return response
+                self.size -= len(response)
+            self.misses += 1
+            return default
+
+    def set(self, key, response, generation):
+        """ store a response fetched for the given generation, which should
+            be looked up before sending the request;  responses are dropped
+            if a commit has happened in the meantime or they don't fit """
+        size = len(response)
+        with self.lock:
+            self.expire()
+            if generation != self.generation or self.pending or \
+                    size > self.maxbytes:
+                return response
+            entry = self.data.pop(key, None)
+            if entry is not None:
+                self.size -= len(entry[1])
+            expires = self.ttl and time() + self.ttl or None
+            self.data[key] = (expires, response)
+            self.size += size
+            while self.size > self.maxbytes:
+                expires, old = self.data.popitem(last=False)[1]
+                self.size -= len(old)
+        return response
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+            self.size = 0
+            self.pending = 0
+            self.hits = 0
+            self.misses = 0
+
+
+resultCache = ResultCache()
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+from threading import Event, Lock
+
+logger = getLogger('collective.solr.coalesce')
+
+
+class Flight(object):
+    """ a call in progress, which other threads can wait for """
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """ coalesce identical calls made concurrently by several threads:
+        the first thread performs the call while the others wait for it
+        to finish and share its result (or exception) instead of making
+        their own;  threads that wait longer than the given timeout give
+        up and make the call themselves """
+
+    def __init__(self):
+        self.flights = {}       # key -> flight
+        self.lock = Lock()
+        self.calls = 0
+        self.shared = 0
+
+    def __repr__(self):
+        return '<SingleFlight pending=%d, calls=%d, shared=%d>' % (
+            len(self.flights), self.calls, self.shared)
+
+    def __call__(self, key, func, timeout=None):
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                self.calls += 1
+                leader = True
+            else:
+                leader = False
+        if leader:
+            try:
+                flight.result = func()
+            except BaseException, e:
+                flight.error = e
+                raise
+            finally:
+                with self.lock:
+                    del self.flights[key]
+                flight.done.set()
+            return flight.result
+        flight.done.wait(timeout)
+        if not flight.done.is_set():
+            logger.warning('giving up waiting for identical call: %r', key)
+            return func()
+        with self.lock:
+            self.shared += 1
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+
+searches = SingleFlight()
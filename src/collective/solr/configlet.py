@@ -67,6 +67,17 @@ class SolrControlPanelAdapter(SchemaAdapterBase):
 
     base = property(getBase, setBase)
 
+    def getReplicas(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'replicas', '')
+
+    def setReplicas(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.replicas = value
+
+    replicas = property(getReplicas, setReplicas)
+
     def getAsync(self):
         util = queryUtility(ISolrConnectionConfig)
         return getattr(util, 'async', '')
@@ -122,6 +133,95 @@ class SolrControlPanelAdapter(SchemaAdapterBase):
 
     search_timeout = property(getSearchTimeout, setSearchTimeout)
 
+    def getPoolSize(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'pool_size', '')
+
+    def setPoolSize(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.pool_size = value
+
+    pool_size = property(getPoolSize, setPoolSize)
+
+    def getCompressionThreshold(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'compression_threshold', '')
+
+    def setCompressionThreshold(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.compression_threshold = value
+
+    compression_threshold = property(getCompressionThreshold,
+                                     setCompressionThreshold)
+
+    def getUpdateBatchSize(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'update_batch_size', '')
+
+    def setUpdateBatchSize(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.update_batch_size = value
+
+    update_batch_size = property(getUpdateBatchSize, setUpdateBatchSize)
+
+    def getAtomicUpdates(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'atomic_updates', '')
+
+    def setAtomicUpdates(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.atomic_updates = value
+
+    atomic_updates = property(getAtomicUpdates, setAtomicUpdates)
+
+    def getSkipUnchanged(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'skip_unchanged', '')
+
+    def setSkipUnchanged(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.skip_unchanged = value
+
+    skip_unchanged = property(getSkipUnchanged, setSkipUnchanged)
+
+    def getCacheSize(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'cache_size', '')
+
+    def setCacheSize(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.cache_size = value
+
+    cache_size = property(getCacheSize, setCacheSize)
+
+    def getCacheTTL(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'cache_ttl', '')
+
+    def setCacheTTL(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.cache_ttl = value
+
+    cache_ttl = property(getCacheTTL, setCacheTTL)
+
+    def getCoalesceTimeout(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'coalesce_timeout', '')
+
+    def setCoalesceTimeout(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.coalesce_timeout = value
+
+    coalesce_timeout = property(getCoalesceTimeout, setCoalesceTimeout)
+
     def getMaxResults(self):
         util = queryUtility(ISolrConnectionConfig)
         return getattr(util, 'max_results', '')
@@ -178,6 +278,29 @@ class SolrControlPanelAdapter(SchemaAdapterBase):
     filter_queries = property(
         getFilterQueryParameters, setFilterQueryParameters)
 
+    def getAutoFilterQueries(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'auto_filter_queries', '')
+
+    def setAutoFilterQueries(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.auto_filter_queries = value
+
+    auto_filter_queries = property(getAutoFilterQueries,
+                                   setAutoFilterQueries)
+
+    def getTermsThreshold(self):
+        util = queryUtility(ISolrConnectionConfig)
+        return getattr(util, 'terms_threshold', '')
+
+    def setTermsThreshold(self, value):
+        util = queryUtility(ISolrConnectionConfig)
+        if util is not None:
+            util.terms_threshold = value
+
+    terms_threshold = property(getTermsThreshold, setTermsThreshold)
+
     def getSlowQueryThreshold(self):
         util = queryUtility(ISolrConnectionConfig)
         return getattr(util, 'slow_query_threshold', '')
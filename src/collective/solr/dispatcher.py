@@ -8,19 +8,24 @@ from collective.solr.interfaces import ISearchDispatcher
 from collective.solr.interfaces import ISolrConnectionConfig
 from collective.solr.monkey import patchCatalogTool
 from collective.solr.monkey import patchLazy
+from collective.solr.parser import SolrFlare
 from collective.solr.parser import SolrResponse
+from collective.solr.paging import PAGE_SIZE
+from collective.solr.paging import PagedResults
 from collective.solr.utils import isActive
-from collective.solr.utils import padResults
 from copy import deepcopy
-from zope.component import queryMultiAdapter
+from zope.component import getSiteManager
 from zope.component import queryUtility
 from zope.component.hooks import getSite
 from zope.interface import implements
+from zope.interface import providedBy
 from zope.publisher.interfaces.http import IHTTPRequest
 
 patchCatalogTool()  # patch catalog tool to use the dispatcher...
 patchLazy()  # ...as well as ZCatalog's Lazy class
 
+marker = object()
+
 
 class FallBackException(Exception):
     """ exception indicating the dispatcher should fall back to searching
@@ -85,24 +90,58 @@ def solrSearchResults(request=None, **keywords):
             raise FallBackException
 
     query, params = search.buildQueryAndParameters(**args)
-
-    if query != {}:
-        __traceback_info__ = (query, params, args)
-        response = search(query, **params)
-    else:
+    if query == {}:
         return SolrResponse()
 
+    # only the requested batch, or the first page of results, is fetched
+    # right away;  other rows are fetched once they're accessed, but not
+    # beyond `sort_limit` or the configured maximum number of results
+    limit = args.get('sort_limit', args.get('sort-limit'))
+    limit = limit and int(limit) or config.max_results or None
+    start = params.get('start', 0)
+    if 'rows' not in params:
+        params['rows'] = PAGE_SIZE
+        if limit is not None:
+            params['rows'] = max(min(PAGE_SIZE, limit - start), 0)
+
+    __traceback_info__ = (query, params, args)
+    response = search(query, **params)
+
+    schema = search.getManager().getSchema()
+    stored = schema is not None and schema.stored or frozenset()
+    adapters = getSiteManager().adapters
+    factories = {}              # adapter factories by provided interfaces
+
     def wrap(flare):
-        """ wrap a flare object with a helper class """
-        adapter = queryMultiAdapter((flare, request), IFlare)
+        """ fill in missing metadata and wrap a flare object with a helper
+            class;  this happens once a result is accessed """
+        if isinstance(flare, SolrFlare):
+            flare.fill(stored, MV)      # shared by all flares of a response
+        else:
+            for missing in stored.difference(flare):
+                flare[missing] = MV
+        provided = providedBy(flare)
+        factory = factories.get(provided, marker)
+        if factory is marker:
+            factory = factories[provided] = adapters.lookup(
+                (provided, providedBy(request)), IFlare)
+        adapter = factory is not None and factory(flare, request) or None
         return adapter is not None and adapter or flare
 
-    schema = search.getManager().getSchema() or {}
+    def fetch(start, rows):
+        """ fetch more results for the same query """
+        page = dict(params, start=start, rows=rows)
+        for key in page.keys():         # facets aren't needed again
+            if key.split('.')[0] in ('facet', 'stats'):
+                del page[key]
+        more = search(query, **page)
+        highlighting = getattr(more, 'highlighting', None)
+        if highlighting:
+            response.highlighting.update(highlighting)
+        return more.results()
+
     results = response.results()
-    for idx, flare in enumerate(results):
-        flare = wrap(flare)
-        for missing in set(schema.stored).difference(flare):
-            flare[missing] = MV
-        results[idx] = wrap(flare)
-    padResults(results, **params)           # pad the batch
+    if hasattr(results, 'numFound'):
+        response.response = PagedResults(fetch, results, start, limit,
+                                         params['rows'], wrap)
     return response
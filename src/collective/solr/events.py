@@ -1,16 +1,80 @@
 # -*- coding: utf-8 -*-
+from httplib import HTTPException
+from logging import getLogger
+from socket import error
+from zope.component import queryUtility
 from Products.CMFCore.utils import getToolByName
 from Products.CMFDefault.permissions import ModifyPortalContent
 
 from Products.CMFCore.CMFCatalogAware import CMFCatalogAware
 from Products.Archetypes.CatalogMultiplex import CatalogMultiplex
 
+from collective.solr.cache import visibilityDelay
+from collective.solr.interfaces import ISearch
+from collective.solr.parser import SolrResponse
+from collective.solr.solr import SolrException
+
+logger = getLogger('collective.solr.events')
+
+
+def indexedPositions(parent, count):
+    """ return the positions of the given folder's children as indexed in
+        solr mapped by their ids or `None` if they can't be looked up, e.g.
+        because the fields aren't stored or because updates might not be
+        visible yet;  the master is asked directly, so that neither lagging
+        replicas nor the result cache can get in the way """
+    search = queryUtility(ISearch)
+    if search is None:
+        return None
+    config = search.getConfig()
+    manager = search.getManager()
+    if config is None or visibilityDelay(config, wait=not config.async) or \
+            manager.getJournal() is not None:
+        return None     # other updates might still be on their way
+    schema = manager.getSchema()
+    if schema is None or 'path' not in schema.epiIndexes or \
+            not schema.stored.issuperset(['id', 'getObjPositionInParent']):
+        return None
+    connection = manager.getConnection()
+    if connection is None:
+        return None
+    path = '/'.join(parent.getPhysicalPath())
+    query, params = search.buildQueryAndParameters(
+        path=dict(query=path, depth=1))
+    if isinstance(query, dict):
+        query = ' '.join(query.values())
+    params.update(fl='id getObjPositionInParent', rows=count)
+    manager.setSearchTimeout()
+    try:
+        response = connection.search(q=query, **params)
+        try:
+            results = SolrResponse(response).results()
+        finally:
+            response.close()
+    except (SolrException, HTTPException, error):
+        logger.exception('exception while looking up positions in %r', path)
+        return None
+    finally:
+        connection.release()        # hand the http connection back
+        manager.setTimeout(None)
+    return dict((flare.get('id'), flare.get('getObjPositionInParent'))
+                for flare in results)
+
 
 def reorderedEvent(event):
+    """ reindex the positions of a folder's children after reordering it;
+        the new positions are computed from the order of ids, so that only
+        children whose position actually changed (or couldn't be looked
+        up) need to be loaded and reindexed """
     parent = event.object
     mtool = getToolByName(parent, 'portal_membership')
     if mtool.checkPermission(ModifyPortalContent, parent):
-        for child in parent.objectValues():
+        ids = parent.objectIds()
+        indexed = indexedPositions(parent, len(ids)) or {}
+        for position, id in enumerate(ids):
+            if indexed.get(id) == position:
+                continue
+            child = parent._getOb(id)
             if isinstance(child, CatalogMultiplex) or \
                     isinstance(child, CMFCatalogAware):
                 child.reindexObject(['getObjPositionInParent'])
@@ -30,16 +30,27 @@ class SolrConfigXMLAdapter(XMLAdapterBase):
         self.context.host = ''
         self.context.port = 0
         self.context.base = ''
+        self.context.replicas = []
         self.context.async = False
         self.context.auto_commit = True
         self.context.commit_within = 0
         self.context.index_timeout = 0
         self.context.search_timeout = 0
+        self.context.pool_size = 0
+        self.context.compression_threshold = 0
+        self.context.update_batch_size = 0
+        self.context.atomic_updates = False
+        self.context.skip_unchanged = False
+        self.context.cache_size = 0
+        self.context.cache_ttl = 60
+        self.context.coalesce_timeout = 0.0
         self.context.max_results = 10000000
         self.context.required = []
         self.context.search_pattern = ''
         self.context.facets = []
         self.context.filter_queries = []
+        self.context.auto_filter_queries = False
+        self.context.terms_threshold = 0
         self.context.slow_query_threshold = 0
         self.context.effective_steps = 1
         self.context.exclude_user = False
@@ -65,6 +76,11 @@ class SolrConfigXMLAdapter(XMLAdapterBase):
                     self.context.host = str(child.getAttribute('value'))
                 elif child.nodeName == 'base':
                     self.context.base = str(child.getAttribute('value'))
+                elif child.nodeName == 'replicas':
+                    value = []
+                    for elem in child.getElementsByTagName('parameter'):
+                        value.append(elem.getAttribute('name'))
+                    self.context.replicas = tuple(map(str, value))
         elems = node.getElementsByTagName('settings')
         if elems:
             assert len(elems) == 1
@@ -85,6 +101,32 @@ class SolrConfigXMLAdapter(XMLAdapterBase):
                 elif child.nodeName == 'search-timeout':
                     value = float(str(child.getAttribute('value')))
                     self.context.search_timeout = value
+                elif child.nodeName == 'pool-size':
+                    value = int(str(child.getAttribute('value')))
+                    self.context.pool_size = value
+                elif child.nodeName == 'compression-threshold':
+                    value = int(str(child.getAttribute('value')))
+                    self.context.compression_threshold = value
+                elif child.nodeName == 'update-batch-size':
+                    value = int(str(child.getAttribute('value')))
+                    self.context.update_batch_size = value
+                elif child.nodeName == 'atomic-updates':
+                    value = str(child.getAttribute('value'))
+                    self.context.atomic_updates = \
+                        self._convertToBoolean(value)
+                elif child.nodeName == 'skip-unchanged':
+                    value = str(child.getAttribute('value'))
+                    self.context.skip_unchanged = \
+                        self._convertToBoolean(value)
+                elif child.nodeName == 'cache-size':
+                    value = int(str(child.getAttribute('value')))
+                    self.context.cache_size = value
+                elif child.nodeName == 'cache-ttl':
+                    value = int(str(child.getAttribute('value')))
+                    self.context.cache_ttl = value
+                elif child.nodeName == 'coalesce-timeout':
+                    value = float(str(child.getAttribute('value')))
+                    self.context.coalesce_timeout = value
                 elif child.nodeName == 'max-results':
                     value = int(str(child.getAttribute('value')))
                     self.context.max_results = value
@@ -106,6 +148,13 @@ class SolrConfigXMLAdapter(XMLAdapterBase):
                     for elem in child.getElementsByTagName('parameter'):
                         value.append(elem.getAttribute('name'))
                     self.context.filter_queries = tuple(map(str, value))
+                elif child.nodeName == 'auto-filter-queries':
+                    value = str(child.getAttribute('value'))
+                    self.context.auto_filter_queries = \
+                        self._convertToBoolean(value)
+                elif child.nodeName == 'terms-threshold':
+                    value = int(str(child.getAttribute('value')))
+                    self.context.terms_threshold = value
                 elif child.nodeName == 'slow-query-threshold':
                     value = int(str(child.getAttribute('value')))
                     self.context.slow_query_threshold = value
@@ -153,6 +202,12 @@ class SolrConfigXMLAdapter(XMLAdapterBase):
         conn.appendChild(create('host', self.context.host))
         conn.appendChild(create('port', str(self.context.port)))
         conn.appendChild(create('base', self.context.base))
+        replicas = self._doc.createElement('replicas')
+        conn.appendChild(replicas)
+        for name in self.context.replicas:
+            param = self._doc.createElement('parameter')
+            param.setAttribute('name', name)
+            replicas.appendChild(param)
         settings = self._doc.createElement('settings')
         node.appendChild(settings)
         append = settings.appendChild
@@ -161,6 +216,19 @@ class SolrConfigXMLAdapter(XMLAdapterBase):
         append(create('commit-within', str(self.context.commit_within)))
         append(create('index-timeout', str(self.context.index_timeout)))
         append(create('search-timeout', str(self.context.search_timeout)))
+        append(create('pool-size', str(self.context.pool_size)))
+        append(create('compression-threshold',
+                      str(self.context.compression_threshold)))
+        append(create('update-batch-size',
+                      str(self.context.update_batch_size)))
+        append(create('atomic-updates',
+                      str(bool(self.context.atomic_updates))))
+        append(create('skip-unchanged',
+                      str(bool(self.context.skip_unchanged))))
+        append(create('cache-size', str(self.context.cache_size)))
+        append(create('cache-ttl', str(self.context.cache_ttl)))
+        append(create('coalesce-timeout',
+                      str(self.context.coalesce_timeout)))
         append(create('max-results', str(self.context.max_results)))
         required = self._doc.createElement('required-query-parameters')
         append(required)
@@ -181,6 +249,9 @@ class SolrConfigXMLAdapter(XMLAdapterBase):
             param = self._doc.createElement('parameter')
             param.setAttribute('name', name)
             filter_queries.appendChild(param)
+        append(create('auto-filter-queries',
+                      str(bool(self.context.auto_filter_queries))))
+        append(create('terms-threshold', str(self.context.terms_threshold)))
         append(
             create(
                 'slow-query-threshold',
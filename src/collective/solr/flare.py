@@ -10,22 +10,27 @@ from DateTime import DateTime
 
 from collective.solr.interfaces import ISolrFlare
 from collective.solr.interfaces import IFlare
-from collective.solr.parser import AttrDict
+from collective.solr.parser import SolrFlare
 
 timezone = DateTime().timezone()
 
 
-class PloneFlare(AttrDict):
+class PloneFlare(SolrFlare):
     """ a sol(a)r brain, i.e. a data container for search results """
     implements(IFlare)
     adapts(ISolrFlare, IHTTPRequest)
+    __slots__ = ('context', 'request')
 
     __allow_access_to_unprotected_subobjects__ = True
 
     def __init__(self, context, request=None):
         self.context = context
         self.request = request
-        self.update(context)        # copy data
+        if isinstance(context, SolrFlare):
+            self._fields = context._fields      # share the data...
+            self._values = context._values
+        else:
+            SolrFlare.__init__(self, context)   # ...or copy it
 
     @property
     def id(self):
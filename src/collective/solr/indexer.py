@@ -4,6 +4,7 @@ import os
 from logging import getLogger
 from Acquisition import aq_get
 from DateTime import DateTime
+from collections import OrderedDict
 from datetime import date, datetime
 from zope.component import getUtility, queryUtility, queryMultiAdapter
 from zope.component import queryAdapter, adapts
@@ -21,19 +22,29 @@ except ImportError:
     from plone.indexer.interfaces import IIndexableObjectWrapper
 from plone.indexer.interfaces import IIndexableObject
 
+from collective.solr.cache import documentDigest
+from collective.solr.cache import resultCache
+from collective.solr.cache import visibilityDelay
 from collective.solr.interfaces import ISolrConnectionConfig
 from collective.solr.interfaces import ISolrConnectionManager
 from collective.solr.interfaces import ISolrIndexQueueProcessor
 from collective.solr.interfaces import ICheckIndexable
 from collective.solr.interfaces import ISolrAddHandler
+from collective.solr.local import getLocal
+from collective.solr.mangler import scoring_classes
+from collective.solr.parser import SolrResponse
 from collective.solr.solr import SolrException
 from collective.solr.utils import prepareData
+from httplib import HTTPException
 from socket import error
 from urllib import urlencode
 
 
 logger = getLogger('collective.solr.indexer')
 
+DIGEST_FIELD = '_digest_'   # stored field for the digests of documents
+DIGEST_BATCH = 1000         # digests looked up at once at most
+
 
 class BaseIndexable(object):
 
@@ -157,6 +168,18 @@ class BinaryAdder(DefaultAdder):
             conn.reset()
 
 
+def partialUpdate(schema, attributes):
+    """ check if the given attributes can be updated on their own using
+        atomic updates, i.e. if the schema allows it and none of them are
+        text fields, which are usually expensive to extract anyway """
+    if attributes is None or not getattr(schema, 'atomic', False):
+        return False
+    for class_ in scoring_classes:
+        if attributes.intersection(schema.classes.get(class_, ())):
+            return False
+    return True
+
+
 def boost_values(obj, data):
     """ calculate boost values using a method or skin script;  returns
         a dictionary with the values or `None` """
@@ -171,15 +194,17 @@ class SolrIndexProcessor(object):
 
     def __init__(self, manager=None):
         self.manager = manager
+        self.skipped = 0
+        self.lookups = True     # unset when digests can't be looked up
 
     def index(self, obj, attributes=None):
         conn = self.getConnection()
         if conn is not None and ICheckIndexable(obj)():
-            # unfortunately with current versions of solr we need to provide
-            # data for _all_ fields during an <add> -- partial updates aren't
-            # supported (see https://issues.apache.org/jira/browse/SOLR-139)
-            # however, the reindexing can be skipped if none of the given
-            # attributes match existing solr indexes...
+            # solr versions before 4.0 need data for _all_ fields during an
+            # <add> -- partial updates aren't supported there (see
+            # https://issues.apache.org/jira/browse/SOLR-139), so they're
+            # only used if enabled;  however, the reindexing can be skipped
+            # if none of the given attributes match existing solr indexes...
             schema = self.manager.getSchema()
             if schema is None:
                 msg = 'unable to fetch schema, skipping indexing of %r'
@@ -190,36 +215,77 @@ class SolrIndexProcessor(object):
                 msg = 'schema is missing unique key, skipping indexing of %r'
                 logger.warning(msg, obj)
                 return
+            config = getUtility(ISolrConnectionConfig)
             if attributes is not None:
-                attributes = set(schema.keys()).intersection(attributes)
+                attributes = schema.names.intersection(attributes)
                 if not attributes:
                     return
+            if getattr(config, 'atomic_updates', False) and \
+                    partialUpdate(schema, attributes):
+                return self.update(obj, attributes, uniqueKey)
             data, missing = self.getData(obj)
             if not data:
                 return          # don't index with no data...
             prepareData(data)
             if data.get(uniqueKey, None) is not None and not missing:
-                config = getUtility(ISolrConnectionConfig)
-                if config.commit_within:
-                    data['commitWithin'] = config.commit_within
-                try:
-                    logger.debug('indexing %r (%r)', obj, data)
-                    pt = data.get('portal_type', 'default')
-                    logger.debug(
-                        'indexing %r with %r adder (%r)', obj, pt, data
-                    )
-
-                    adder = queryAdapter(obj, ISolrAddHandler, name=pt)
+                pt = data.get('portal_type', 'default')
+                adder = queryAdapter(obj, ISolrAddHandler, name=pt)
+                if adder is None:
+                    adder = DefaultAdder(obj)
+                boost = boost_values(obj, data)
+                if self.defer(obj, adder, data, boost, uniqueKey):
+                    logger.debug('deferring %r until its digest is '
+                                 'checked', obj)
+                    return
+                self.add(obj, adder, data, boost, uniqueKey)
 
-                    if adder is None:
-                        adder = DefaultAdder(obj)
-                    adder(conn, boost_values=boost_values(obj, data), **data)
-                except (SolrException, error):
-                    logger.exception('exception during indexing %r', obj)
+    def add(self, obj, adder, data, boost, uniqueKey):
+        """ add the given document using the given adder """
+        conn = self.getConnection()
+        config = getUtility(ISolrConnectionConfig)
+        if config.commit_within:
+            data['commitWithin'] = config.commit_within
+        try:
+            logger.debug('indexing %r with %r adder (%r)', obj, adder, data)
+            adder(conn, boost_values=boost, **data)
+        except (SolrException, error):
+            logger.exception('exception during indexing %r', obj)
+            self.forget(data[uniqueKey])
 
     def reindex(self, obj, attributes=None):
         self.index(obj, attributes)
 
+    def update(self, obj, attributes, uniqueKey):
+        """ send only the given attributes of an already indexed object
+            using an atomic update """
+        conn = self.getConnection()
+        names = attributes.union([uniqueKey])
+        data, missing = self.getData(obj, attributes=names)
+        prepareData(data)
+        key = data.pop(uniqueKey, None)
+        if key is None:
+            return
+        for name in attributes.difference([uniqueKey]):
+            data.setdefault(name, [])   # like they'd be missing in an <add>
+        if not data:
+            return
+        deferred = getLocal('deferred', OrderedDict).pop(key, None)
+        if deferred is not None:
+            self.add(*deferred)         # it has to be sent first
+        data[uniqueKey] = key
+        data['_version_'] = 1           # only update existing documents
+        if DIGEST_FIELD in self.manager.getSchema().stored:
+            data[DIGEST_FIELD] = []     # the document differs now
+        config = getUtility(ISolrConnectionConfig)
+        if config.commit_within:
+            data['commitWithin'] = config.commit_within
+        try:
+            logger.debug('updating %r (%r)', obj, data)
+            conn.update(uniqueKey, **data)
+        except (SolrException, error):
+            logger.exception('exception during updating %r', obj)
+        self.forget(key)
+
     def unindex(self, obj):
         conn = self.getConnection()
         if conn is not None:
@@ -256,6 +322,7 @@ class SolrIndexProcessor(object):
                 conn.delete(id=data_key)
             except (SolrException, error):
                 logger.exception('exception during unindexing %r', obj)
+            self.forget(data_key)
 
     def begin(self):
         pass
@@ -263,9 +330,27 @@ class SolrIndexProcessor(object):
     def commit(self, wait=None):
         conn = self.getConnection()
         if conn is not None:
+            self.sendDeferred()
             config = getUtility(ISolrConnectionConfig)
             if not isinstance(wait, bool):
                 wait = not config.async
+            journal = getattr(self.manager, 'getJournal', lambda: None)()
+            if journal is not None:
+                # the updates are sent by a background thread instead...
+                journal.configure(
+                    batchSize=getattr(config, 'update_batch_size', 0),
+                    compressThreshold=getattr(
+                        config, 'compression_threshold', 0),
+                    timeout=config.index_timeout or None,
+                    commit=config.auto_commit and not config.commit_within,
+                    delay=visibilityDelay(config, wait=False))
+                try:
+                    journal.append(conn.popUpdates())
+                except (IOError, OSError):
+                    logger.exception('exception while journaling updates')
+                self.clearDigests()
+                self.manager.closeConnection()
+                return
             try:
                 logger.debug('committing')
                 if not config.auto_commit or config.commit_within:
@@ -277,6 +362,10 @@ class SolrIndexProcessor(object):
                     conn.commit(waitFlush=wait, waitSearcher=wait)
             except (SolrException, error):
                 logger.exception('exception during commit')
+            self.clearDigests()
+            # cached results might be outdated, also once the changes
+            # become visible if solr doesn't commit them right away
+            resultCache.invalidate(visibilityDelay(config, wait))
             self.manager.closeConnection()
 
     def abort(self):
@@ -284,10 +373,102 @@ class SolrIndexProcessor(object):
         if conn is not None:
             logger.debug('aborting')
             conn.abort()
+            self.clearDigests()
             self.manager.closeConnection()
 
     # helper methods
 
+    def defer(self, obj, adder, data, boost, uniqueKey):
+        """ add the digest of the given document to its data, provided
+            skipping unchanged documents is enabled and the schema has a
+            stored field for the digests, so that it gets stored along with
+            the document;  unless the digests can't be looked up, sending
+            the document is then deferred to `sendDeferred`, which checks
+            all of them at once """
+        config = getUtility(ISolrConnectionConfig)
+        schema = self.manager.getSchema()
+        if not getattr(config, 'skip_unchanged', False) or \
+                DIGEST_FIELD not in schema.stored or \
+                adder.__class__ is not DefaultAdder:
+            return False    # other adders might send more than the data
+        data.pop(DIGEST_FIELD, None)
+        data[DIGEST_FIELD] = documentDigest(data, boost)
+        if not self.lookups:
+            return False
+        deferred = getLocal('deferred', OrderedDict)
+        key = data[uniqueKey]
+        deferred.pop(key, None)     # keep the order of the updates
+        deferred[key] = obj, adder, data, boost, uniqueKey
+        return True
+
+    def sendDeferred(self):
+        """ send the deferred documents unless solr already has them, i.e.
+            the digests stored there are the same;  documents changed by
+            other updates since aren't looked up """
+        deferred = getLocal('deferred', OrderedDict)
+        if not deferred:
+            return
+        changed = getLocal('changed', set)
+        indexed = self.indexedDigests([key for key in deferred
+                                       if key not in changed])
+        for key, (obj, adder, data, boost, uniqueKey) in deferred.items():
+            if indexed.get(key) == data[DIGEST_FIELD]:
+                logger.debug('skipping unchanged %r', obj)
+                self.skipped += 1
+            else:
+                self.add(obj, adder, data, boost, uniqueKey)
+        deferred.clear()
+        changed.clear()
+
+    def indexedDigests(self, keys):
+        """ return the digests stored along with the documents with the
+            given unique keys in solr mapped by key;  they're looked up on
+            the master in batches using the real-time get handler, so that
+            updates from all clients count, including uncommitted ones;
+            if that fails, e.g. because solr doesn't support it, skipping
+            documents is turned off """
+        journal = getattr(self.manager, 'getJournal', lambda: None)()
+        if not keys or journal is not None and journal.backlog():
+            return {}       # other updates might still be on their way
+        uniqueKey = self.manager.getSchema().uniqueKey
+        fields = '%s %s' % (uniqueKey, DIGEST_FIELD)
+        conn = self.getConnection()
+        digests = {}
+        try:
+            for pos in xrange(0, len(keys), DIGEST_BATCH):
+                batch = keys[pos:pos + DIGEST_BATCH]
+                response = conn.get(*batch, fl=fields)
+                try:
+                    results = SolrResponse(response).results()
+                finally:
+                    response.close()
+                for flare in results:
+                    digests[flare.get(uniqueKey)] = flare.get(DIGEST_FIELD)
+        except (SolrException, HTTPException, error), e:
+            logger.warning('unable to look up digests, not skipping '
+                           'unchanged documents anymore: %s', e)
+            self.lookups = False
+            return {}
+        finally:
+            conn.release()      # the updates are sent later on
+        return digests
+
+    def forget(self, *values):
+        """ drop deferred documents with the given unique keys and mark
+            them as changed, e.g. by updates that don't store a digest, so
+            that they aren't looked up later on in this transaction """
+        deferred = getLocal('deferred', OrderedDict)
+        changed = getLocal('changed', set)
+        for value in values:
+            deferred.pop(value, None)
+            changed.add(value)
+
+    def clearDigests(self):
+        """ forget about deferred and changed documents, e.g. once all
+            updates have been sent or aborted """
+        getLocal('deferred', OrderedDict).clear()
+        getLocal('changed', set).clear()
+
     def getConnection(self):
         if self.manager is None:
             self.manager = queryUtility(ISolrConnectionManager)
@@ -323,7 +504,7 @@ class SolrIndexProcessor(object):
         if schema is None:
             return {}, ()
         if attributes is None:
-            attributes = schema.keys()
+            attributes = schema.names
         obj = self.wrapObject(obj)
         data = {}
         for name in attributes:
@@ -352,5 +533,5 @@ class SolrIndexProcessor(object):
             if isinstance(value, str):
                 value = unicode(value, 'utf-8', 'ignore').encode('utf-8')
             data[name] = value
-        missing = set(schema.requiredFields) - set(data.keys())
+        missing = schema.required.difference(data)
         return data, missing
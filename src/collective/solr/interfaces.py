@@ -47,6 +47,22 @@ class ISolrSchema(Interface):
         )
     )
 
+    replicas = List(
+        title=_('label_replicas', default=u'Search replicas'),
+        description=_(
+            'help_replicas',
+            default=u'Specify Solr servers replicating the above one, '
+                    u'which should be used for searching instead, one per '
+                    u'line in the form "host:port/base". Index updates will '
+                    u'still be sent to the above server only. Search '
+                    u'requests will be sent to the fastest replica available, '
+                    u'unresponsive ones are skipped until they recover.'
+        ),
+        value_type=TextLine(),
+        default=[],
+        required=False
+    )
+
     async = Bool(
         title=_('label_async', default=u'Asynchronous indexing'),
         default=False,
@@ -105,6 +121,119 @@ class ISolrSchema(Interface):
         )
     )
 
+    pool_size = Int(
+        title=_('label_pool_size', default=u'Connection pool size'),
+        default=0,
+        description=_(
+            'help_pool_size',
+            default=u'Maximum number of connections to Solr shared by all '
+                    u'threads of this Zope instance. Requests will wait for '
+                    u'a free connection once the limit has been reached. '
+                    u'Set to "0" to not limit the number of connections.'
+        ),
+        required=False,
+    )
+
+    compression_threshold = Int(
+        title=_('label_compression_threshold',
+                default=u'Compression threshold'),
+        default=0,
+        description=_(
+            'help_compression_threshold',
+            default=u'Index updates larger than this number of bytes will '
+                    u'be sent gzip-compressed. Solr (or a proxy in front '
+                    u'of it) needs to be set up to accept compressed '
+                    u'requests. Set to "0" to disable compression.'
+        ),
+        required=False,
+    )
+
+    update_batch_size = Int(
+        title=_('label_update_batch_size',
+                default=u'Update batch size'),
+        default=0,
+        description=_(
+            'help_update_batch_size',
+            default=u'Maximum number of documents sent to Solr in a single '
+                    u'update request at the end of a transaction. Only the '
+                    u'last update of every object is sent. Set to "0" to '
+                    u'send a separate request per object.'
+        ),
+        required=False,
+    )
+
+    atomic_updates = Bool(
+        title=_('label_atomic_updates', default=u'Use atomic updates'),
+        description=_(
+            'help_atomic_updates',
+            default=u'Check this to only send the changed fields when '
+                    u'objects are reindexed partially, e.g. after workflow '
+                    u'transitions, instead of the whole document. This '
+                    u'requires Solr 4.0 or later with the update log '
+                    u'enabled and all fields except for copy field targets '
+                    u'being stored. Changes to text fields are always sent '
+                    u'in full.'
+        ),
+        default=False,
+        required=False,
+    )
+
+    skip_unchanged = Bool(
+        title=_('label_skip_unchanged',
+                default=u'Skip unchanged documents'),
+        description=_(
+            'help_skip_unchanged',
+            default=u'Check this to not send documents to Solr again when '
+                    u'reindexing an object yields the same data that was '
+                    u'sent last time. This requires a stored "_digest_" '
+                    u'field in the Solr schema and the real-time get '
+                    u'handler, which are used to keep the digests of the '
+                    u'documents in Solr itself, so that all ZEO clients '
+                    u'see them. Without the field, nothing is skipped.'
+        ),
+        default=False,
+        required=False,
+    )
+
+    cache_size = Int(
+        title=_('label_cache_size', default=u'Search result cache size'),
+        default=0,
+        description=_(
+            'help_cache_size',
+            default=u'Maximum size in kilobytes of the search responses '
+                    u'cached by this Zope instance. Cached results are '
+                    u'discarded once changes are committed to the index. '
+                    u'Set to "0" to disable caching.'
+        ),
+        required=False,
+    )
+
+    cache_ttl = Int(
+        title=_('label_cache_ttl', default=u'Search result cache lifetime'),
+        default=60,
+        description=_(
+            'help_cache_ttl',
+            default=u'Number of seconds cached search results are used '
+                    u'for. This limits how long changes made by other Zope '
+                    u'instances may take to show up in search results.'
+        ),
+        required=False,
+    )
+
+    coalesce_timeout = Float(
+        title=_('label_coalesce_timeout',
+                default=u'Search coalescing timeout'),
+        default=0.0,
+        description=_(
+            'help_coalesce_timeout',
+            default=u'Number of seconds a search waits for the response '
+                    u'to an identical search already sent by another '
+                    u'thread instead of sending its own request. Set to '
+                    u'"0" to disable coalescing of searches.'
+        ),
+        required=False,
+    )
+
     max_results = Int(
         title=_('label_max_results',
                 default=u'Maximum search results'),
@@ -172,6 +301,34 @@ class ISolrSchema(Interface):
         required=False
     )
 
+    auto_filter_queries = Bool(
+        title=_('label_auto_filter_queries',
+                default=u'Automatic filter queries'),
+        description=_(
+            'help_auto_filter_queries',
+            default=u'Specify whether all query parameters not affecting '
+                    u'the relevance of results, i.e. the ones for indexed '
+                    u'fields other than text fields, should be sent as '
+                    u'separate filter queries. Parameters listed above are '
+                    u'still combined as configured.'),
+        default=False
+    )
+
+    terms_threshold = Int(
+        title=_('label_terms_threshold',
+                default=u'Terms query threshold'),
+        default=0,
+        description=_(
+            'help_terms_threshold',
+            default=u'Filter queries for string fields with more values '
+                    u'than this are sent using the terms query parser, '
+                    u'which is faster for long lists like many groups or '
+                    u'UIDs. This requires Solr 4.10 or later. Set to "0" '
+                    u'to disable.'
+        ),
+        required=False,
+    )
+
     slow_query_threshold = Int(
         title=_('label_slow_query_threshold',
                 default=u'Slow query threshold'),
@@ -282,12 +439,26 @@ class ISolrConnectionManager(Interface):
         """ close the current connection, if any """
 
     def getConnection():
-        """ returns an existing connection or opens one """
+        """ returns an existing connection or opens one;  this connection
+            goes to the master server and should be used for updates """
+
+    def getSearchConnection(exclude=()):
+        """ returns a connection to the solr server that should handle
+            the next search request, skipping the nodes given in `exclude`;
+            without configured replicas this is the regular connection """
+
+    def getBalancer():
+        """ returns the load balancer keeping track of the search replicas
+            or `None` if no replicas have been configured """
 
     def getSchema():
         """ returns the currently used schema or fetches it.
             If the schema cannot be fetched None is returned. """
 
+    def getJournal():
+        """ returns the journal index updates should be written to instead
+            of sending them to solr directly or `None` if none is used """
+
     def setTimeout(timeout, lock=object()):
         """ set the timeout on the current (or to be opened) connection
             to the given value and optionally lock it until explicitly
@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+# durable, asynchronous index updates:  instead of sending them to solr at
+# the end of each transaction, the update requests are appended to a local
+# journal file, which a background thread sends to solr in batches;  the
+# offset up to which updates have been sent is kept in a second file, so
+# that a backlog left by solr being unreachable, or by a restart, is sent
+# once solr is available again.  several processes, e.g. zeo clients, may
+# share a journal:  appending and compacting it is serialized using a lock
+# file, and so is sending, so that only one of them sends each update.
+
+from collective.solr.cache import SEARCHER_DELAY
+from collective.solr.cache import resultCache
+from collective.solr.solr import SolrConnection
+from collective.solr.solr import SolrException
+from contextlib import contextmanager
+from json import dumps, loads
+from logging import getLogger
+from os import fsync, rename
+from os.path import exists, getsize
+from threading import Event, Lock, Thread
+from time import sleep
+
+try:
+    from fcntl import flock, LOCK_EX
+except ImportError:             # i.e. on windows, see `locked`
+    flock = None
+
+logger = getLogger('collective.solr.journal')
+
+RETRY_INTERVAL = 10     # seconds until sending is retried after a failure
+BATCH_ENTRIES = 1000    # maximum number of updates read in one go
+
+
+@contextmanager
+def locked(path):
+    """ hold an exclusive lock on the given file while running the block;
+        locks taken via `flock` exclude other threads as well as other
+        processes;  where it isn't available each process needs to use
+        a journal of its own """
+    with open(path, 'ab') as lock:
+        if flock is not None:
+            flock(lock.fileno(), LOCK_EX)
+        yield                   # closing the file releases the lock
+
+
+def encode(entry):
+    """ encode a journal entry as a single line;  requests are byte
+        strings that aren't necessarily valid utf-8, so they're decoded
+        as latin-1 for json, which maps all bytes losslessly """
+    return dumps(entry, encoding='latin-1') + '\n'
+
+
+def decode(line):
+    """ decode a journal entry written using `encode` """
+    return [value.encode('latin-1') if isinstance(value, unicode) else value
+            for value in loads(line)]
+
+
+class Journal(object):
+    """ an append-only file of pending update requests for the given solr
+        endpoint, which are sent by a background thread;  updates are
+        sent in the order they were added, so that the last update per
+        unique key wins, and retried until solr accepts or rejects them """
+
+    def __init__(self, path, host, base):
+        self.path = path
+        self.host = host
+        self.base = base
+        self.batchSize = 100
+        self.compressThreshold = 0
+        self.timeout = None
+        self.commit = True
+        self.delay = SEARCHER_DELAY
+        self.lock = Lock()
+        self.pending = Event()
+        self.thread = None
+        self.sent = self.dropped = self.failures = 0
+        self.offset = self.recover()
+
+    def __repr__(self):
+        return '<Journal %s backlog=%d, sent=%d, dropped=%d, failures=%d>' % (
+            self.path, self.backlog(), self.sent, self.dropped,
+            self.failures)
+
+    def recover(self):
+        """ return the offset of the first update not sent yet, dropping
+            an incomplete entry left over by a crash while appending """
+        with locked(self.path + '.lock'):
+            size = exists(self.path) and getsize(self.path) or 0
+            if size:
+                with open(self.path, 'rb+') as journal:
+                    journal.seek(max(size - 1, 0))
+                    if journal.read(1) != '\n':
+                        journal.seek(0)
+                        data = journal.read()
+                        size = data.rfind('\n') + 1
+                        logger.warning('dropping incomplete entry in %s',
+                                       self.path)
+                        journal.truncate(size)
+        return self.getOffset()
+
+    def getOffset(self):
+        """ return the offset of the first update not sent yet as stored
+            by whichever process sent updates last """
+        size = exists(self.path) and getsize(self.path) or 0
+        try:
+            with open(self.path + '.offset', 'rb') as offset:
+                offset = int(offset.read())
+        except (IOError, OSError, ValueError):
+            offset = 0
+        return offset <= size and offset or 0
+
+    def setOffset(self, offset):
+        """ remember the offset of the first update not sent yet """
+        temp = self.path + '.offset.tmp'
+        with open(temp, 'wb') as data:
+            data.write(str(offset))
+            data.flush()
+            fsync(data.fileno())
+        rename(temp, self.path + '.offset')
+        self.offset = offset
+
+    def backlog(self):
+        """ return the number of bytes of updates not sent yet """
+        size = exists(self.path) and getsize(self.path) or 0
+        return max(size - self.getOffset(), 0)
+
+    def configure(self, batchSize=100, compressThreshold=0, timeout=None,
+                  commit=True, delay=SEARCHER_DELAY):
+        """ update the settings used for sending the updates;  `delay` is
+            the time until sent updates are expected to become visible """
+        self.batchSize = batchSize
+        self.compressThreshold = compressThreshold
+        self.timeout = timeout
+        self.commit = commit
+        self.delay = delay
+
+    def append(self, entries):
+        """ durably add update requests, given as `(request, head, key)`
+            tuples like stored by `SolrConnection.doUpdateXML` """
+        lines = ''.join(encode(entry) for entry in entries)
+        if not lines:
+            return
+        with locked(self.path + '.lock'):
+            with open(self.path, 'ab') as journal:
+                journal.write(lines)
+                journal.flush()
+                fsync(journal.fileno())
+        self.start()
+
+    def start(self):
+        """ wake up the background thread sending the updates, starting
+            it if needed """
+        self.pending.set()
+        with self.lock:
+            if self.thread is None or not self.thread.isAlive():
+                self.thread = Thread(target=self.run,
+                                     name='solr journal %s' % self.path)
+                self.thread.setDaemon(True)
+                self.thread.start()
+
+    def run(self):
+        while True:
+            self.pending.wait(RETRY_INTERVAL)
+            self.pending.clear()
+            try:
+                while self.drain():
+                    pass
+            except Exception:
+                self.failures += 1
+                logger.exception('unable to send %d bytes of updates from '
+                                 '%s, retrying in %d seconds', self.backlog(),
+                                 self.path, RETRY_INTERVAL)
+                sleep(RETRY_INTERVAL)
+
+    def read(self):
+        """ return the next batch of updates along with the offset after
+            them """
+        entries = []
+        with open(self.path, 'rb') as journal:
+            journal.seek(self.offset)
+            offset = self.offset
+            while len(entries) < BATCH_ENTRIES:
+                line = journal.readline()
+                if not line.endswith('\n'):
+                    break           # incomplete or end of file
+                offset += len(line)
+                try:
+                    entries.append(decode(line))
+                except ValueError:
+                    logger.error('skipping broken entry in %s: %r',
+                                 self.path, line)
+        return entries, offset
+
+    def drain(self):
+        """ send the next batch of updates to solr, returning `False` when
+            there are none left;  errors reaching solr are raised, so that
+            the updates are retried later """
+        if not exists(self.path):
+            return False
+        with locked(self.path + '.send'):
+            self.offset = self.getOffset()  # others might have sent some
+            entries, offset = self.read()
+            if offset == self.offset:
+                with locked(self.path + '.lock'):
+                    if self.offset and self.backlog() == 0:
+                        # all sent, so start a new file
+                        open(self.path, 'wb').close()
+                        self.setOffset(0)
+                return False
+            if entries:
+                self.send(entries)
+                # cached results are outdated once the updates are visible
+                resultCache.invalidate(self.delay)
+            self.setOffset(offset)
+        return True
+
+    def connect(self):
+        """ return a connection for sending the updates """
+        return SolrConnection(host=self.host, solrBase=self.base,
+                              persistent=True, timeout=self.timeout,
+                              compressThreshold=self.compressThreshold,
+                              batchSize=self.batchSize)
+
+    def send(self, entries):
+        conn = self.connect()
+        try:
+            for request, head, key in entries:
+                conn.doUpdateXML(request, head=head, key=key)
+            for request, originals in conn.batches():
+                self.post(conn, request, originals)
+            if self.commit:
+                self.post(conn, '<commit waitSearcher="false"/>', None)
+            logger.debug('sent %d updates from %s', len(entries), self.path)
+        finally:
+            del conn.xmlbody[:]
+            del conn.xmlparts[:]
+            conn.close()
+
+    def post(self, conn, request, originals):
+        """ send a request, retrying merged ones separately if solr
+            rejects them;  requests rejected on their own are dropped """
+        try:
+            conn.doSendXML(request)
+        except SolrException, e:
+            if not str(e.httpcode).startswith('4'):
+                raise               # solr has problems, so try again later
+            if originals is None:
+                self.dropped += 1
+                logger.error('dropping update rejected by solr (%s): %r',
+                             e, request)
+            else:
+                for original in originals:
+                    self.post(conn, original, None)
+        else:
+            self.sent += len(originals or (request,))
+
+
+journals = {}           # path -> journal
+journalsLock = Lock()
+
+
+def getJournal(path, host, base):
+    """ return the process-wide journal for the given path, starting to
+        send any updates left over from previous runs """
+    with journalsLock:
+        journal = journals.get(path)
+        if journal is None:
+            journal = journals[path] = Journal(path, host, base)
+            if journal.backlog():
+                journal.start()
+        return journal
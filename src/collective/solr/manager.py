@@ -1,9 +1,16 @@
 # -*- coding: utf-8 -*-
+from collective.solr.balancer import getBalancer
+from collective.solr.balancer import parseNode
 from collective.solr.interfaces import ISolrConnectionConfig
 from collective.solr.interfaces import ISolrConnectionManager
 from collective.solr.interfaces import IZCMLSolrConnectionConfig
+from collective.solr.journal import getJournal
 from collective.solr.local import getLocal
 from collective.solr.local import setLocal
+from collective.solr.pool import getPool
+from collective.solr.schemas import SCHEMA_TTL
+from collective.solr.schemas import clearSchemas
+from collective.solr.schemas import getSchema
 from collective.solr.solr import SolrConnection
 from httplib import CannotSendRequest
 from httplib import ResponseNotReady
@@ -37,10 +44,21 @@ class BaseSolrConnectionConfig(object):
         self.search_pattern = None
         self.facets = []
         self.filter_queries = []
+        self.auto_filter_queries = False
+        self.terms_threshold = 0
         self.slow_query_threshold = 0
         self.effective_steps = 1
         self.exclude_user = False
         self.field_list = []
+        self.pool_size = 0
+        self.compression_threshold = 0
+        self.update_batch_size = 0
+        self.atomic_updates = False
+        self.skip_unchanged = False
+        self.cache_size = 0
+        self.cache_ttl = 60
+        self.coalesce_timeout = 0.0
+        self.replicas = []
 
 
 class SolrConnectionConfig(BaseSolrConnectionConfig, Persistent):
@@ -52,10 +70,21 @@ class SolrConnectionConfig(BaseSolrConnectionConfig, Persistent):
     search_pattern = None
     facets = ()
     filter_queries = ()
+    auto_filter_queries = False
+    terms_threshold = 0
     slow_query_threshold = 0
     effective_steps = 1
     exclude_user = False
     field_list = []
+    pool_size = 0
+    compression_threshold = 0
+    update_batch_size = 0
+    atomic_updates = False
+    skip_unchanged = False
+    cache_size = 0
+    cache_ttl = 60
+    coalesce_timeout = 0.0
+    replicas = ()
 
     def getId(self):
         """ return a unique id to be used with GenericSetup """
@@ -66,13 +95,19 @@ class ZCMLSolrConnectionConfig(object):
     '''Connection values that can be configured through zcml'''
     implements(IZCMLSolrConnectionConfig)
 
-    def __init__(self, host, port, base):
+    def __init__(self, host, port, base, replicas=(), schema_ttl=SCHEMA_TTL,
+                 schema_snapshot=None, journal=None):
         self.host = '%s:%d' % (host, port)
         self.base = base
+        self.replicas = tuple(replicas)
+        self.schema_ttl = schema_ttl
+        self.schema_snapshot = schema_snapshot
+        self.journal = journal
 
 
 class SolrConnectionManager(object):
-    """ a thread-local connection manager for solr """
+    """ a thread-local connection manager for solr;  the underlying http
+        connections are shared via a process-wide pool per host """
     implements(ISolrConnectionManager)
 
     lock = False
@@ -97,8 +132,25 @@ class SolrConnectionManager(object):
         if conn is not None:
             conn.close()
             setLocal('connection', None)
+        connections = getLocal('searchConnections')
+        if connections:
+            for conn in connections.values():
+                conn.close()
+            setLocal('searchConnections', None)
         if clearSchema:
-            setLocal('schema', None)
+            clearSchemas()
+
+    def getEndpoint(self):
+        """ returns host and base of the solr server to be used for
+            index updates """
+        zcmlconfig = queryUtility(IZCMLSolrConnectionConfig)
+        if zcmlconfig is not None:
+            # use connection parameters defined in zcml...
+            return zcmlconfig.host, zcmlconfig.base
+        config = getUtility(ISolrConnectionConfig)
+        if config.host is not None:
+            # otherwise use connection parameters defined in control panel...
+            return '%s:%d' % (config.host, config.port), config.base
 
     def getConnection(self):
         """ returns an existing connection or opens one """
@@ -108,37 +160,104 @@ class SolrConnectionManager(object):
         conn = getLocal('connection')
         if conn is not None:
             return conn
-
-        zcmlconfig = queryUtility(IZCMLSolrConnectionConfig)
-        if zcmlconfig is not None:
-            # use connection parameters defined in zcml...
-            logger.debug('opening connection to %s', zcmlconfig.host)
-            conn = SolrConnection(host=zcmlconfig.host,
-                                  solrBase=zcmlconfig.base,
-                                  persistent=True)
-            setLocal('connection', conn)
-        elif config.host is not None:
-            # otherwise use connection parameters defined in control panel...
-            host = '%s:%d' % (config.host, config.port)
+        endpoint = self.getEndpoint()
+        if endpoint is not None:
+            host, base = endpoint
             logger.debug('opening connection to %s', host)
-            conn = SolrConnection(host=host, solrBase=config.base,
-                                  persistent=True)
+            pool = getPool(host, getattr(config, 'pool_size', 0))
+            conn = SolrConnection(
+                host=host, solrBase=base, persistent=True, pool=pool,
+                compressThreshold=getattr(config, 'compression_threshold', 0),
+                batchSize=getattr(config, 'update_batch_size', 0))
             setLocal('connection', conn)
         return conn
 
+    def getJournal(self):
+        """ returns the journal index updates should be written to instead
+            of sending them to solr directly or `None` if none has been
+            configured """
+        zcmlconfig = queryUtility(IZCMLSolrConnectionConfig)
+        path = getattr(zcmlconfig, 'journal', None)
+        if path is None:
+            return None
+        return getJournal(path, zcmlconfig.host, zcmlconfig.base)
+
+    def getReplicas(self):
+        """ returns host and base of the solr servers to be used for
+            search requests instead of the master """
+        endpoint = self.getEndpoint()
+        if endpoint is None:
+            return []
+        zcmlconfig = queryUtility(IZCMLSolrConnectionConfig)
+        replicas = getattr(zcmlconfig, 'replicas', None)
+        if not replicas:
+            config = getUtility(ISolrConnectionConfig)
+            replicas = getattr(config, 'replicas', None) or ()
+        host, base = endpoint
+        return [parseNode(spec, base) for spec in replicas]
+
+    def getBalancer(self):
+        """ returns the load balancer for search requests or `None` if no
+            replicas have been configured """
+        config = getUtility(ISolrConnectionConfig)
+        if not config.active:
+            return None
+        replicas = self.getReplicas()
+        if not replicas:
+            return None
+        return getBalancer(replicas)
+
+    def getSearchConnection(self, exclude=()):
+        """ returns a connection to the solr server that should handle the
+            next search request, i.e. the fastest healthy one of the
+            configured replicas not given in `exclude`;  the master is
+            only used without replicas or once all of them have failed """
+        balancer = self.getBalancer()
+        if balancer is None:
+            return self.getConnection()
+        node = balancer.choose(exclude)
+        if node is None:
+            logger.warning('no search replica left, falling back to master')
+            return self.getConnection()
+        connections = getLocal('searchConnections', dict)
+        if connections is None:
+            connections = {}
+            setLocal('searchConnections', connections)
+        key = node.host + node.base
+        conn = connections.get(key)
+        config = getUtility(ISolrConnectionConfig)
+        if conn is None:
+            logger.debug('opening search connection to %s', key)
+            pool = getPool(node.host, getattr(config, 'pool_size', 0))
+            conn = connections[key] = SolrConnection(
+                host=node.host, solrBase=node.base, persistent=True,
+                pool=pool)
+        conn.node = node
+        conn.setTimeout(config.search_timeout or None)
+        return conn
+
     def getSchema(self):
-        """ returns the currently used schema or fetches it """
-        schema = getLocal('schema')
-        if schema is None:
-            conn = self.getConnection()
-            if conn is not None:
-                logger.debug('getting schema from solr')
-                self.setSearchTimeout()
-                try:
-                    schema = conn.getSchema()
-                    setLocal('schema', schema)
-                except (error, CannotSendRequest, ResponseNotReady):
-                    logger.exception('exception while getting schema')
+        """ returns the currently used schema or fetches it;  the schema
+            is shared by all threads and refreshed periodically """
+        conn = self.getConnection()
+        if conn is None:
+            return None
+
+        def fetch():
+            logger.debug('getting schema from solr')
+            self.setSearchTimeout()
+            try:
+                return conn.getSchema()
+            except (error, CannotSendRequest, ResponseNotReady):
+                logger.exception('exception while getting schema')
+
+        zcmlconfig = queryUtility(IZCMLSolrConnectionConfig)
+        schema = getSchema(conn.host + conn.solrBase, fetch,
+                           ttl=getattr(zcmlconfig, 'schema_ttl', SCHEMA_TTL),
+                           snapshot=getattr(zcmlconfig, 'schema_snapshot',
+                                            None))
+        if schema is not None:      # needed for batching updates
+            conn.uniqueKey = schema.get('uniqueKey', None)
         return schema
 
     def setTimeout(self, timeout, lock=marker):
@@ -16,6 +16,13 @@ ranges = {
     'min:max': '[%s TO %s]',
 }
 
+# field types affecting the relevance of results, which is why they're
+# kept in the main query when using filter queries automatically
+scoring_classes = (
+    'solr.TextField',
+    'solr.SortableTextField',
+)
+
 sort_aliases = {
     'sortable_title': 'Title',
 }
@@ -38,6 +45,21 @@ def iso8601date(value):
     return value
 
 
+def effectiveDate(value, config):
+    """ round the given `DateTime` to the configured "effective steps"
+        and convert it to iso 8601 format """
+    steps = getattr(config, 'effective_steps', 1)
+    if steps > 1:
+        value = DateTime(value.timeTime() // steps * steps)
+    return iso8601date(value)
+
+
+def userToken():
+    """ return the "allowedRolesAndUsers" token of the current user """
+    userid = getSecurityManager().getUser().getId()
+    return userid and 'user$' + userid or None
+
+
 def makeSimpleExpressions(term, levenstein_distance):
     '''Return a search expression for part of the query that
     includes the levenstein distance and wildcards where appropriate.
@@ -119,13 +141,7 @@ def mangleQuery(keywords, config, schema):
 
     # find EPI indexes
     if schema:
-        epi_indexes = {}
-        for name in schema.keys():
-            parts = name.split('_')
-            if parts[-1] in ['string', 'depth', 'parents']:
-                count = epi_indexes.get(parts[0], 0)
-                epi_indexes[parts[0]] = count + 1
-        epi_indexes = [k for k, v in epi_indexes.items() if v == 3]
+        epi_indexes = schema.epiIndexes
     else:
         epi_indexes = ['path']
 
@@ -162,10 +178,7 @@ def mangleQuery(keywords, config, schema):
                 del args['depth']
         elif key == 'effectiveRange':
             if isinstance(value, DateTime):
-                steps = getattr(config, 'effective_steps', 1)
-                if steps > 1:
-                    value = DateTime(value.timeTime() // steps * steps)
-                value = iso8601date(value)
+                value = effectiveDate(value, config)
             del keywords[key]
             keywords['effective'] = '[* TO %s]' % value
             keywords['expires'] = '[%s TO *]' % value
@@ -184,10 +197,14 @@ def mangleQuery(keywords, config, schema):
                 keywords[key] = '(%s)' % value
             del args['operator']
         elif key == 'allowedRolesAndUsers':
+            token = userToken()
             if getattr(config, 'exclude_user', False):
-                token = 'user$' + getSecurityManager().getUser().getId()
                 if token in value:
                     value.remove(token)
+            if isinstance(value, (list, tuple)):
+                # sorted for stable queries, but with the current user's
+                # token first so that it can be replaced in cached queries
+                keywords[key] = sorted(value, key=lambda v: (v != token, v))
         elif isinstance(value, DateTime):
             keywords[key] = iso8601date(value)
         elif not isinstance(value, basestring):
@@ -215,8 +232,6 @@ def subtractQueryParameters(args, request_keywords=None):
         params['sort'] = '%s %s' % (index, order)
 
     limit = get('limit')
-    if limit:
-        params['rows'] = int(limit)
 
     for key, value in args.items():
         if key in ('fq', 'fl', 'facet', 'hl'):
@@ -239,6 +254,9 @@ def subtractQueryParameters(args, request_keywords=None):
             params['rows'] = int(value)
             del args[key]
 
+    if limit:       # the batch mustn't extend beyond the limit
+        limit = int(limit) - params.get('start', 0)
+        params['rows'] = max(min(params.get('rows', limit), limit), 0)
     return params
 
 
@@ -260,16 +278,58 @@ def cleanupQueryParameters(args, schema):
     return args
 
 
-def optimizeQueryParameters(query, params):
+def isFilter(name, schema):
+    """ check if a query parameter can be used as a filter query, i.e.
+        is one for an indexed field that doesn't affect scoring """
+    field = name is not None and schema.get(name, None) or None
+    return field is not None and field.get('indexed', False) and \
+        field.get('class_', None) not in scoring_classes
+
+
+def termsQuery(name, values):
+    """ return a filter query matching any of the given values using
+        solr's terms query parser, or `None` if the values can't be
+        separated by commas """
+    try:
+        terms = ','.join(values)
+    except (TypeError, UnicodeDecodeError):
+        return None
+    if '' in values or terms.count(',') != len(values) - 1:
+        return None
+    if isinstance(terms, unicode):
+        terms = terms.encode('utf-8')
+    return '{!terms f=%s}%s' % (name, terms)
+
+
+def optimizeQueryParameters(query, params, schema=None, terms=None):
     """ optimize query parameters by using filter queries for
-        configured indexes """
+        configured indexes and, if enabled and the schema is given, all
+        other parameters not affecting the scoring of results, which are
+        added in order of their names;  `terms` maps names of parameters
+        to lists of values, which are passed using solr's terms query
+        parser when they become a filter query on their own """
     config = queryUtility(ISolrConnectionConfig)
+    terms = terms or {}
     fq = []
+
+    def pop(name):
+        clause = query.pop(name)
+        if name in terms:
+            return termsQuery(name, terms[name]) or clause
+        return clause
     if config is not None:
         for idxs in config.filter_queries:
             idxs = set(idxs.split(' '))
             if idxs.issubset(query.keys()):
-                fq.append(' '.join([query.pop(idx) for idx in idxs]))
+                if len(idxs) == 1:
+                    fq.append(pop(idxs.pop()))
+                else:
+                    fq.append(' '.join([query.pop(idx)
+                                        for idx in sorted(idxs)]))
+        if getattr(config, 'auto_filter_queries', False) and schema:
+            for name in sorted(query):
+                if isFilter(name, schema):
+                    fq.append(pop(name))
     if 'fq' in params:
         if isinstance(params['fq'], list):
             params['fq'].extend(fq)
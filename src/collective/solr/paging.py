@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from logging import getLogger
+
+logger = getLogger('collective.solr.paging')
+
+PAGE_SIZE = 100         # rows fetched at once when no batch size is given
+MAX_PAGE_SIZE = 10000   # rows fetched at once at most while iterating
+
+
+class PagedResults(object):
+    """ a sequence of search results as long as the number of documents
+        found, but only holding the rows fetched so far;  accessing rows
+        outside of these makes it fetch them from solr (page by page) using
+        `fetch(start, rows)`, which should return a list of results;  rows
+        beyond the given limit, i.e. `sort_limit` or "max_results", are
+        never fetched and show up as `None` like with `padResults`;  rows
+        are passed through `wrap(row)` when they're first accessed """
+
+    def __init__(self, fetch, results, start=0, limit=None,
+                 page_size=PAGE_SIZE, wrap=None):
+        self.fetch = fetch
+        self.wrap = wrap
+        self.numFound = getattr(results, 'numFound', str(len(results)))
+        self.start = getattr(results, 'start', str(start))
+        self.maxScore = getattr(results, 'maxScore', None)
+        self.length = int(self.numFound)
+        self.limit = self.length if limit is None else min(limit, self.length)
+        self.page_size = page_size or PAGE_SIZE
+        self.size = self.page_size          # rows fetched with the next page
+        self.next = start + len(results)    # position after the last page
+        self.sources = {}   # position -> (results, index) of fetched rows
+        self.rows = {}      # position -> row (wrapped) once accessed
+        self.store(start, results)
+
+    def __repr__(self):
+        return '<PagedResults numFound=%d, loaded=%d, limit=%d>' % (
+            self.length, len(self.sources) + len(self.rows), self.limit)
+
+    def store(self, start, results):
+        for idx in xrange(len(results)):
+            self.sources[start + idx] = results, idx
+
+    def load(self, start, stop):
+        """ make sure the given rows are available, fetching the missing
+            ones within the limit in one go """
+        missing = [pos for pos in xrange(start, min(stop, self.limit))
+                   if pos not in self.rows and pos not in self.sources]
+        if missing:
+            start = missing[0]
+            rows = missing[-1] + 1 - start
+            logger.debug('fetching %d rows at %d', rows, start)
+            results = self.fetch(start, rows)
+            self.store(start, results)
+            for pos in missing[len(results):]:
+                self.rows.setdefault(pos, None)    # the index has changed...
+
+    def get(self, pos):
+        """ return the row at the given position, wrapping it on first
+            access;  the row has to be loaded already """
+        try:
+            return self.rows[pos]
+        except KeyError:
+            pass
+        source = self.sources.pop(pos, None)
+        if source is None:
+            return None
+        results, idx = source
+        row = results[idx]
+        if self.wrap is not None:
+            row = self.wrap(row)
+        self.rows[pos] = row
+        return row
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.length)
+            if start < stop:
+                self.load(start, stop)
+            return [self.get(pos) for pos in xrange(start, stop, step)]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('list index out of range')
+        if index < self.limit and index not in self.rows and \
+                index not in self.sources:
+            if index == self.next:      # sequential access, so grow pages
+                self.size = min(self.size * 2,
+                                max(MAX_PAGE_SIZE, self.page_size))
+                page = index
+            else:
+                self.size = self.page_size
+                page = index - index % self.page_size
+            self.load(page, page + self.size)
+            self.next = page + self.size
+        return self.get(index)
+
+    def __getslice__(self, start, stop):
+        return self.__getitem__(slice(max(start, 0), max(stop, 0)))
+
+    def __iter__(self):
+        """ iterate over all rows, fetching them in pages growing in size,
+            since iterating usually means most of them are needed """
+        pos, size = 0, self.page_size
+        while pos < self.length:
+            for row in self[pos:pos + size]:
+                yield row
+            pos += size
+            size = min(size * 2, max(MAX_PAGE_SIZE, self.page_size))
+
+    def __add__(self, other):
+        return list(self) + list(other)
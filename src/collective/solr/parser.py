@@ -1,12 +1,18 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime
+from hashlib import md5
+from json import loads
+from re import compile
 from StringIO import StringIO
 
 from DateTime import DateTime
 from zope.interface import implements
 
+from collective.solr.cache import LRUCache
 from collective.solr.interfaces import ISolrFlare
 from collective.solr.iterparse import iterparse
+from collective.solr.javabin import JavabinDecoder
+from collective.solr.javabin import formatDate
 
 
 class AttrDict(dict):
@@ -22,27 +28,240 @@ class AttrDict(dict):
             raise AttributeError(name)
 
 
-class SolrFlare(AttrDict):
-    """ a sol(a)r brain, i.e. a data container for search results """
+missing = object()      # marker for fields a document doesn't have
+deleted = object()      # marker for fields removed from a document
+
+
+class Fields(object):
+    """ the field names of the documents in a response, i.e. their
+        positions in the documents' value lists;  the names are shared
+        by all documents of a response, so they only get stored once,
+        along with default values for fields missing in a document """
+    __slots__ = ('names', 'positions', 'defaults', 'filled')
+
+    def __init__(self):
+        self.names = []
+        self.positions = {}
+        self.defaults = {}
+        self.filled = None
+
+    def position(self, name):
+        """ return the position of the given field, adding it if needed """
+        pos = self.positions.get(name)
+        if pos is None:
+            pos = self.positions[name] = len(self.names)
+            self.names.append(name)
+        return pos
+
+    def fill(self, names, value):
+        """ use the given value for the named fields in all documents
+            not having them, e.g. `Missing.Value` for metadata """
+        if self.filled is names:
+            return      # already done for another document...
+        for name in names:
+            self.defaults.setdefault(self.position(name), value)
+        self.filled = names
+
+
+class SolrFlare(object):
+    """ a sol(a)r brain, i.e. a data container for search results;  flares
+        behave like dictionaries allowing attribute access, but only hold
+        a list of values, with the field names being shared by all flares
+        created for a response """
     implements(ISolrFlare)
+    __slots__ = ('_fields', '_values')
 
     __allow_access_to_unprotected_subobjects__ = True
 
+    def __init__(self, *args, **kw):
+        self._fields = Fields()
+        self._values = []
+        self.update(*args, **kw)
+
+    @classmethod
+    def create(cls, fields, items=()):
+        """ create a flare sharing the given field names """
+        flare = cls.__new__(cls)
+        flare._fields = fields
+        flare._values = []
+        for name, value in items:
+            flare[name] = value
+        return flare
+
+    def fill(self, names, value):
+        """ use the given value for all named fields not set in this or
+            any other flare of the same response """
+        self._fields.fill(names, value)
+
+    def __getattr__(self, name):
+        """ look up attributes in the fields """
+        if name in SolrFlare.__slots__ or name.startswith('__'):
+            raise AttributeError(name)
+        value = self.get(name, missing)
+        if value is missing:
+            raise AttributeError(name)
+        return value
+
+    def _lookup(self, pos):
+        values = self._values
+        if pos < len(values):
+            value = values[pos]
+            if value is deleted:
+                return missing
+            elif value is not missing:
+                return value
+        return self._fields.defaults.get(pos, missing)
+
+    def __getitem__(self, name):
+        pos = self._fields.positions.get(name)
+        if pos is not None:
+            value = self._lookup(pos)
+            if value is not missing:
+                return value
+        raise KeyError(name)
+
+    def get(self, name, default=None):
+        pos = self._fields.positions.get(name)
+        if pos is not None:
+            value = self._lookup(pos)
+            if value is not missing:
+                return value
+        return default
+
+    def __contains__(self, name):
+        return self.get(name, missing) is not missing
+
+    has_key = __contains__
+
+    def __setitem__(self, name, value):
+        pos = self._fields.position(name)
+        values = self._values
+        if pos < len(values):
+            values[pos] = value
+        else:
+            values.extend([missing] * (pos - len(values)))
+            values.append(value)
+
+    def __delitem__(self, name):
+        if name not in self:
+            raise KeyError(name)
+        self[name] = deleted
+
+    def iteritems(self):
+        lookup = self._lookup
+        for pos, name in enumerate(self._fields.names):
+            value = lookup(pos)
+            if value is not missing:
+                yield name, value
+
+    def iterkeys(self):
+        for name, value in self.iteritems():
+            yield name
+
+    def itervalues(self):
+        for name, value in self.iteritems():
+            yield value
+
+    __iter__ = iterkeys
+
+    def items(self):
+        return list(self.iteritems())
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return list(self.itervalues())
+
+    def __len__(self):
+        return len(self.items())
+
+    def update(self, *args, **kw):
+        for data in args + (kw,):
+            if hasattr(data, 'keys'):
+                data = [(key, data[key]) for key in data.keys()]
+            for name, value in data:
+                self[name] = value
+
+    def setdefault(self, name, value=None):
+        if name not in self:
+            self[name] = value
+        return self[name]
+
+    def pop(self, name, *default):
+        if name in self or not default:
+            value = self[name]
+            del self[name]
+            return value
+        return default[0]
+
+    def copy(self):
+        flare = SolrFlare.create(self._fields)
+        flare._values = list(self._values)
+        return flare
+
+    def __eq__(self, other):
+        if isinstance(other, (SolrFlare, dict)):
+            return dict(self.iteritems()) == dict(other.iteritems())
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(dict(self.iteritems()))
+
+    def __reduce__(self):
+        return SolrFlare, (dict(self.iteritems()),)
+
 
 class SolrResults(list):
     """ a list of results returned from solr, i.e. sol(a)r flares """
 
 
+# solr's date format, i.e. `YYYY-MM-DDThh:mm:ss(.fff)Z`
+solrDate = compile(r'^(\d+)-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(\.\d+)?Z$')
+solrDate = solrDate.match
+
+# the same dates (e.g. for `expires` or `effective`) tend to show up in
+# many results, so already built `DateTime` objects get reused
+dateCache = LRUCache(maxsize=10000)
+
+
 def parseDate(value):
     """ use `DateTime` to parse a date, but take care of solr 1.4
-        stripping away leading zeros for the year representation """
-    if value.find('-') < 4:
-        year, rest = value.split('-', 1)
-        value = '%04d-%s' % (int(year), rest)
-    return DateTime(value)
+        stripping away leading zeros for the year representation;
+        dates in solr's format are converted numerically, which is a lot
+        faster than having `DateTime` guess the format """
+    key = value
+    date = dateCache.get(key)
+    if date is not None:
+        return date
+    match = solrDate(value)
+    if match is not None and int(match.group(1)) >= 100:
+        # `DateTime` would treat two-digit years as 19xx or 20xx
+        year, month, day, hour, minute, second, fraction = match.groups()
+        date = DateTime(int(year), int(month), int(day), int(hour),
+                        int(minute), int(second) + float(fraction or 0),
+                        'GMT+0')
+    else:
+        if value.find('-') < 4:
+            year, rest = value.split('-', 1)
+            value = '%04d-%s' % (int(year), rest)
+        date = DateTime(value)
+    return dateCache.set(key, date)
 
 
 def parse_date_as_datetime(value):
+    match = solrDate(value)
+    if match is not None:
+        year, month, day, hour, minute, second, fraction = match.groups()
+        return datetime(int(year), int(month), int(day), int(hour),
+                        int(minute), int(second),
+                        int(round(float(fraction or 0) * 1000000)))
     if value.find('-') < 4:
         year, rest = value.split('-', 1)
         value = '%04d-%s' % (int(year), rest)
@@ -75,37 +294,156 @@ nested = {
 }
 
 
+# solr's canonical date representation, as found in json responses
+isDate = compile(r'^\d+-\d\d-\d\dT\d\d:\d\d:\d\d(\.\d+)?Z$').match
+
+
+def dateFields(schema):
+    """ return a mapping telling which of the fields defined in the given
+        schema are date fields;  fields not listed are dynamic ones """
+    dates = {}
+    for class_, names in getattr(schema, 'classes', {}).items():
+        for name in names:
+            dates[name] = 'Date' in (class_ or '')
+    return dates
+
+
 def setter(item, name, value):
     """ sets the named value on item respecting its type """
     if isinstance(item, list):
         item.append(value)      # name is ignored for lists
-    elif isinstance(item, dict):
+    elif isinstance(item, (dict, SolrFlare)):
         item[name] = value
     else:                       # object is assumed...
         setattr(item, name, value)
 
 
+def convert(elem, unmarshallers, factories=nested):
+    """ convert an already parsed element (and its children) the same
+        way `SolrResponse.parse` does;  unknown elements give `None` """
+    tag = elem.tag
+    if tag in factories:
+        data = factories[tag]()
+        for key, value in elem.attrib.items():
+            if not key == 'name':   # set extra attributes
+                setattr(data, key, value)
+        for child in elem:
+            if child.tag in factories or child.tag in unmarshallers:
+                value = convert(child, unmarshallers, factories)
+                setter(data, child.get('name'), value)
+        return data
+    elif tag in unmarshallers:
+        return unmarshallers[tag](elem.text)
+
+
+class Unparsed(object):
+    """ a document element that hasn't been converted into a flare yet """
+    __slots__ = ('elem',)
+
+    def __init__(self, elem):
+        self.elem = elem
+
+
+class LazySolrResults(SolrResults):
+    """ a list of results, which are only converted to flares when they
+        are accessed, i.e. fields values get unmarshalled (and `DateTime`
+        instances get created) only for the documents actually used """
+
+    def __init__(self, *args):
+        super(LazySolrResults, self).__init__(*args)
+        self.unmarshallers = unmarshallers
+        self.factories = nested
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in xrange(*index.indices(len(self)))]
+        item = list.__getitem__(self, index)
+        if isinstance(item, Unparsed):
+            item = convert(item.elem, self.unmarshallers, self.factories)
+            list.__setitem__(self, index, item)
+        return item
+
+    def __getslice__(self, start, stop):
+        return self[max(0, start):max(0, stop):]
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def __reversed__(self):
+        for index in xrange(len(self) - 1, -1, -1):
+            yield self[index]
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __reduce__(self):
+        state = self.__dict__.copy()
+        del state['unmarshallers']
+        del state['factories']
+        return SolrResults, (list(self),), state
+
+
+lazynested = dict(nested, result=LazySolrResults)
+
+
 class SolrResponse(object):
     """ a solr search response; TODO: this should get an interface!! """
 
     __allow_access_to_unprotected_subobjects__ = True
 
-    def __init__(self, data=None, unmarshallers=unmarshallers):
+    def __init__(self, data=None, unmarshallers=unmarshallers, lazy=False):
         self.unmarshallers = unmarshallers
         if data is not None:
-            self.parse(data)
+            self.parse(data, lazy)
 
-    def parse(self, data):
-        """ parse a solr response contained in a string or file-like object """
+    def parse(self, data, lazy=False):
+        """ parse a solr response contained in a string or file-like object;
+            in lazy mode documents are converted only once accessed """
+        for flare in self.process(data, lazy=lazy):
+            pass
+        return self
+
+    def stream(self, data):
+        """ parse a solr response contained in a string or file-like object,
+            yielding the documents of its result set(s) one by one instead
+            of collecting them, so that arbitrarily large responses can be
+            processed with constant memory;  all other data, like the
+            header or facet information, is set on the response object
+            as usual and becomes available while iterating """
+        return self.process(data, stream=True)
+
+    def process(self, data, lazy=False, stream=False):
+        """ helper doing the actual parsing;  elements are discarded as
+            soon as they've been unmarshalled in order to not keep the
+            whole element tree alive alongside the created objects """
         if isinstance(data, basestring):
             data = StringIO(data)
         stack = [self]      # the response object is the outmost container
+        factories = dict(lazy and lazynested or nested)
+        fields = Fields()   # field names shared by all documents
+        factories['doc'] = lambda: SolrFlare.create(fields)
+        skip = None         # the document element currently being skipped
+        parents = []        # currently open elements
         elements = iterparse(data, events=('start', 'end'))
         for action, elem in elements:
+            if skip is not None:
+                if elem is skip and action == 'end':
+                    parents.pop()
+                    del parents[-1][-1]     # detach from the tree
+                    stack[-1].append(Unparsed(elem))
+                    skip = None
+                continue
             tag = elem.tag
             if action == 'start':
-                if tag in nested:
-                    data = nested[tag]()
+                parents.append(elem)
+                if tag == 'doc' and isinstance(stack[-1], LazySolrResults):
+                    skip = elem
+                elif tag in nested:
+                    data = factories[tag]()
+                    if lazy and tag == 'result':
+                        data.unmarshallers = self.unmarshallers
+                        data.factories = factories
                     for key, value in elem.attrib.items():
                         if not key == 'name':   # set extra attributes
                             setattr(data, key, value)
@@ -113,12 +451,94 @@ class SolrResponse(object):
             elif action == 'end':
                 if tag in nested:
                     data = stack.pop()
-                    setter(stack[-1], elem.get('name'), data)
+                    if stream and tag == 'doc' and \
+                            isinstance(stack[-1], SolrResults):
+                        yield data
+                    else:
+                        setter(stack[-1], elem.get('name'), data)
                 elif tag in self.unmarshallers:
                     data = self.unmarshallers[tag](elem.text)
                     setter(stack[-1], elem.get('name'), data)
+                parents.pop()
+                elem.clear()
+                if parents:
+                    del parents[-1][-1]     # the element is the last child
+
+    def parseJSON(self, data, schema=None):
+        """ parse a solr response in json format (as requested using
+            `wt=json` and `json.nl=map`) contained in a string or file-like
+            object;  the resulting structure is the same as for xml, but
+            as json doesn't have a date type, only string values of fields
+            defined as dates in the given schema are unmarshalled as such,
+            or values looking like dates if the field isn't known at all """
+        if not isinstance(data, basestring):
+            data = data.read()
+        date = self.unmarshallers['date']
+        dates = dateFields(schema)
+        fields = Fields()   # field names shared by all documents
+
+        def convert(value, name=None):
+            if isinstance(value, basestring):
+                if dates.get(name, True) and isDate(value):
+                    return date(value)
+            elif isinstance(value, list):
+                return [convert(item, name) for item in value]
+            elif isinstance(value, dict):
+                if 'docs' in value and 'numFound' in value:
+                    results = SolrResults(map(flare, value.pop('docs')))
+                    for key, item in value.items():
+                        setattr(results, key, str(item))
+                    return results
+                for key, item in value.items():
+                    value[key] = convert(item, key)
+            return value
+
+        def flare(doc):
+            for name, value in doc.items():
+                if dates.get(name) is False:
+                    continue        # known non-date field
+                doc[name] = convert(value, name)
+            return SolrFlare.create(fields, doc.iteritems())
+
+        for name, value in loads(data).items():
+            if name != 'responseHeader':
+                value = convert(value)
+            setattr(self, name, value)
+        return self
+
+    def javabin(self):
+        """ return a javabin decoder creating the same objects as the
+            xml parser """
+        date = self.unmarshallers['date']
+
+        def doclist(info, docs):
+            results = SolrResults(docs)
+            for name, value in zip(('numFound', 'start', 'maxScore'), info):
+                if value is not None:
+                    setattr(results, name, str(value))
+            return results
+
+        def doc(items):
+            return SolrFlare.create(fields, items)
+
+        fields = Fields()   # field names shared by all documents
+        return JavabinDecoder(doc=doc, doclist=doclist,
+                              date=lambda millis: date(formatDate(millis)))
+
+    def parseJavabin(self, data):
+        """ parse a solr response in javabin format (as requested using
+            `wt=javabin`) contained in a string or file-like object;  the
+            resulting structure is the same as for xml """
+        for name, value in self.javabin().decode(data).items():
+            setattr(self, name, value)
         return self
 
+    def streamJavabin(self, data):
+        """ like `stream`, but for responses in javabin format """
+        def setter(name, value):
+            setattr(self, name, value)
+        return self.javabin().stream(data, setter)
+
     def results(self):
         """ return only the list of results, i.e. a `SolrResults` instance """
         return getattr(self, 'response', [])
@@ -128,9 +548,8 @@ class SolrResponse(object):
         """
         return the actual_result_count
         """
-        if getattr(self, 'response', None):
-            return int(self.response.numFound)
-        return 0
+        response = getattr(self, 'response', None)
+        return int(getattr(response, 'numFound', 0))
 
     def __len__(self):
         return len(self.results())
@@ -138,6 +557,9 @@ class SolrResponse(object):
     def __getitem__(self, index):
         return self.results()[index]
 
+    def __iter__(self):
+        return iter(self.results())
+
 
 class SolrField(AttrDict):
     """ a schema field representation """
@@ -169,17 +591,26 @@ class SolrSchema(AttrDict):
         parsed and provided, all others are ignored """
 
     def __init__(self, data=None):
+        self.source = self.digest = None
         if data is not None:
             self.parse(data)
+        else:
+            self.prepare()
 
     def parse(self, data):
         """ parse a solr schema to collect information for building
-            search and indexing queries later on """
-        if isinstance(data, basestring):
-            data = StringIO(data)
+            search and indexing queries later on;  the source data is
+            kept along with its digest, so that changes can be detected """
+        if not isinstance(data, basestring):
+            data = data.read()
+        self.source = data
+        self.digest = md5(data).hexdigest()
+        if data.lstrip().startswith('{'):
+            return self.parseJSON(data)
         self['requiredFields'] = required = []
+        self['copyFields'] = copies = []
         types = {}
-        for action, elem in iterparse(data):
+        for action, elem in iterparse(StringIO(data)):
             name = elem.get('name')
             if elem.tag == 'fieldType':
                 types[name] = elem.attrib
@@ -193,10 +624,76 @@ class SolrSchema(AttrDict):
                 self[name] = field
                 if field.get('required', False):
                     required.append(name)
+            elif elem.tag == 'copyField':
+                copies.append(elem.get('dest'))
             elif elem.tag in ('uniqueKey', 'defaultSearchField'):
                 self[elem.tag] = elem.text
             elif elem.tag == 'solrQueryParser':
                 self[elem.tag] = AttrStr(elem.text, **elem.attrib)
+        self.prepare()
+
+    def parseJSON(self, data):
+        """ parse a schema as returned by solr's schema api, i.e. in json
+            format, collecting the same information as `parse` """
+        def attributes(info):           # like the attributes in xml
+            attrs = {}
+            for key, value in info.items():
+                if isinstance(value, unicode):
+                    value = value.encode('utf-8')
+                if not isinstance(value, (dict, list)):
+                    attrs[str(key)] = value
+            return attrs
+        schema = loads(data)
+        schema = schema.get('schema', schema)
+        self['requiredFields'] = required = []
+        types = {}
+        for info in schema.get('fieldTypes', ()):
+            types[info['name']] = attributes(info)
+        for info in schema.get('fields', ()):
+            field = SolrField(types[info['type']])
+            field.update(attributes(info))
+            field['class_'] = field['class']
+            self[field.name] = field
+            if field.get('required', False):
+                required.append(field.name)
+        self['copyFields'] = [info['dest'].encode('utf-8')
+                              for info in schema.get('copyFields', ())]
+        for key in 'uniqueKey', 'defaultSearchField':
+            if key in schema:
+                self[key] = schema[key].encode('utf-8')
+        if 'solrQueryParser' in schema:
+            self['solrQueryParser'] = AttrStr(
+                '', **attributes(schema['solrQueryParser']))
+        self.prepare()
+
+    def prepare(self):
+        """ compute the lookup structures used when indexing, searching
+            and handling results;  fields added after parsing the schema
+            are not reflected, so `prepare` needs to be called again then """
+        fields = list(self.fields)
+        self.names = frozenset(field.name for field in fields)
+        self.stored = frozenset(f.name for f in fields if f.get('stored'))
+        self.indexed = frozenset(f.name for f in fields if f.get('indexed'))
+        self.required = frozenset(self.get('requiredFields', ()))
+        self.copied = frozenset(self.get('copyFields', ()))
+        # atomic updates rebuild documents from their stored fields, so
+        # all fields except for the targets of `<copyField>` need to be
+        # stored;  the update log and therefore `_version_` is needed, too
+        self.atomic = '_version_' in self.names and \
+            not self.names - self.stored - self.copied
+        classes = {}
+        for field in fields:
+            classes.setdefault(field.get('class_'), set()).add(field.name)
+        self.classes = dict((class_, frozenset(names))
+                            for class_, names in classes.items())
+        # "extended path indexes" are made up of three fields, i.e.
+        # `<name>_string`, `<name>_depth` and `<name>_parents`
+        counts = {}
+        for name in self.names:
+            parts = name.split('_')
+            if parts[-1] in ('string', 'depth', 'parents'):
+                counts[parts[0]] = counts.get(parts[0], 0) + 1
+        self.epiIndexes = frozenset(k for k, v in counts.items() if v == 3)
 
     @property
     def fields(self):
@@ -204,10 +701,3 @@ class SolrSchema(AttrDict):
         for name, field in self.items():
             if isinstance(field, SolrField):
                 yield field
-
-    @property
-    def stored(self):
-        """ return names of all stored fields, a.k.a. metadata """
-        for field in self.fields:
-            if field.stored:
-                yield field.name
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+from collective.solr.timeout import HTTPConnectionWithTimeout
+from httplib import _CS_IDLE
+from logging import getLogger
+from select import error as select_error
+from select import select
+from socket import error
+from threading import Condition
+from threading import Lock
+from time import time
+
+logger = getLogger('collective.solr.pool')
+
+WAIT_TIMEOUT = 30       # seconds to wait for a connection without a timeout
+
+
+class PoolExhausted(error):
+    """ no pooled connection became available within the given time """
+
+
+def isUsable(conn):
+    """ check if a previously used http connection can be handed out again,
+        i.e. it has no pending response and the server hasn't closed the
+        socket in the meantime (which would make it readable) """
+    response = getattr(conn, '_HTTPConnection__response', None)
+    if response is not None and not response.isclosed():
+        return False
+    if getattr(conn, '_HTTPConnection__state', _CS_IDLE) != _CS_IDLE:
+        return False
+    sock = getattr(conn, 'sock', None)
+    if sock is None:
+        return True         # not connected yet, or cleanly closed
+    try:
+        readable, writable, failed = select([sock], [], [], 0)
+    except (select_error, error, TypeError, ValueError):
+        return False
+    return not readable
+
+
+class ConnectionPool(object):
+    """ a process-wide pool of persistent http connections to one solr
+        host;  connections are checked out by a `SolrConnection` when it
+        first needs to talk to solr and checked in again when it's done,
+        so sockets get reused across requests and threads """
+
+    def __init__(self, host, maxsize=0, idle_timeout=60,
+                 factory=HTTPConnectionWithTimeout,
+                 wait_timeout=WAIT_TIMEOUT):
+        self.host = host
+        self.maxsize = maxsize              # 0 means "unbounded"
+        self.idle_timeout = idle_timeout
+        self.wait_timeout = wait_timeout
+        self.factory = factory
+        self.idle = []                      # (connection, time of checkin)
+        self.active = 0
+        self.cond = Condition(Lock())
+
+    def __repr__(self):
+        return '<ConnectionPool host=%s, active=%d, idle=%d, maxsize=%s>' % (
+            self.host, self.active, len(self.idle), self.maxsize)
+
+    def evict(self):
+        """ close idle connections that haven't been used for too long;
+            the caller is expected to hold the lock """
+        if not self.idle_timeout:
+            return
+        expired = time() - self.idle_timeout
+        while self.idle and self.idle[0][1] < expired:
+            conn, last = self.idle.pop(0)
+            logger.debug('evicting idle connection %r', conn)
+            conn.close()
+
+    def checkout(self, timeout=None):
+        """ hand out an idle connection that passes the health check or
+            open a new one;  if the pool is at its maximum size wait for
+            up to `timeout` seconds (or `wait_timeout` without one) for
+            another thread to check one in, raising `PoolExhausted` if
+            none becomes available, so leaked connections can't make
+            requests block forever """
+        wait = timeout or self.wait_timeout
+        deadline = time() + wait
+        with self.cond:
+            while True:
+                self.evict()
+                while self.idle:
+                    conn, last = self.idle.pop()    # most recently used
+                    if isUsable(conn):
+                        self.active += 1
+                        conn.setTimeout(timeout)
+                        return conn
+                    logger.debug('dropping unusable connection %r', conn)
+                    conn.close()
+                if not self.maxsize or self.active < self.maxsize:
+                    self.active += 1
+                    break
+                remaining = deadline - time()
+                if remaining <= 0:
+                    raise PoolExhausted(
+                        'no connection to %s available after %ss' % (
+                            self.host, wait))
+                self.cond.wait(remaining)
+        logger.debug('opening new connection to %s', self.host)
+        return self.factory(self.host, timeout=timeout)
+
+    def checkin(self, conn):
+        """ return a connection to the pool, keeping it open for reuse
+            unless its state doesn't allow that anymore """
+        with self.cond:
+            self.active -= 1
+            if isUsable(conn):
+                self.idle.append((conn, time()))
+            else:
+                logger.debug('closing unusable connection %r', conn)
+                conn.close()
+            self.cond.notify()
+
+    def clear(self):
+        """ close all idle connections """
+        with self.cond:
+            for conn, last in self.idle:
+                conn.close()
+            del self.idle[:]
+
+
+pools = {}
+poolsLock = Lock()
+
+
+def getPool(host, maxsize=0):
+    """ return the process-wide connection pool for the given host,
+        creating it on first use """
+    with poolsLock:
+        pool = pools.get(host)
+        if pool is None:
+            pool = pools[host] = ConnectionPool(host, maxsize=maxsize)
+        elif pool.maxsize != maxsize:
+            with pool.cond:
+                pool.maxsize = maxsize
+                pool.cond.notify_all()
+        return pool
+
+
+def clearPools():
+    """ close all idle connections and forget all pools """
+    with poolsLock:
+        for pool in pools.values():
+            pool.clear()
+        pools.clear()
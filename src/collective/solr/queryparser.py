@@ -17,196 +17,170 @@ query_tokenizer = compile(
     r'([(){}\[\]"])|'
     r'([-+!^~*?:\\/]))'
 )
+# terms consisting of normal text only, which need no quoting at all
+plain_text = compile(r'[^-(){}\[\]+!^\"~*?:\\/\&\|\s]+$')
 
 
-class Whitespace(object):
+# Kinds of groups, which are kept on a stack while quoting;  each group is a
+# list of `[kind, start, end, items]`, with the items being plain strings,
+# `None` for whitespace or `(text, truthy)` tuples for groups already closed
+# (a group is "truthy" if it contains anything, even if only whitespace).
+TOP, GROUP, QUOTE, RANGE = range(4)
 
-    def __nonzero__(self):
-        return False
 
-    def __str__(self):
+def text(item):
+    """ return the string for an item of a group """
+    if item is None:
         return ' '
-
-
-class Group(list):
-
-    def __init__(self, start=None, end=None):
-        self.start = start
-        self.end = end
-        self.isgroup = False  # Set on pop
-
-    def __str__(self):
-        res = [x for x in self if x]
-        lenres = len(res)
-        if lenres == 0:
+    if item.__class__ is tuple:
+        return item[0]
+    return item
+
+
+def render(group):
+    """ return the string for a group;  groups with only one non-empty
+        item are reduced to that item, invalid ranges get escaped and
+        unfinished quotes containing whitespace are grouped """
+    kind, start, end, items = group
+    if kind == GROUP:
+        single = None
+        for item in items:
+            if item is None or item.__class__ is tuple and not item[1]:
+                continue
+            if single is not None:
+                return '%s%s%s' % (start, ''.join(map(text, items)), end)
+            single = item
+        if single is None:
             return ''
-        elif lenres == 1:
-            return str(res[0])
-        # Otherwise, also print whitespace
-        return '%s%s%s' % (
-            self.start,
-            ''.join([str(x) for x in self]),
-            self.end)
-
-
-class Quote(Group):
-
-    def __str__(self):
-        if not self.end:
-            # No finishing quote, we have to add new group if there is
-            # whitespace
-            if [x for x in self if isinstance(x, Whitespace)]:
-                self.start = '(%s' % self.start
-                self.end = ')'
-        return '%s%s%s' % (
-            self.start,
-            ''.join([str(x) for x in self]),
-            self.end)
-
-
-class Range(Group):
-
-    def __str__(self):
-        first = last = '*'
-        if len(self) == 0:
+        return text(single)
+    elif kind == QUOTE:
+        if not end and None in items:
+            start = '(%s' % start
+            end = ')'
+    elif kind == RANGE:
+        if not items:
             return ''
-        if 'TO' not in self:
-            # Not valid range, quote
-            return '\\%s%s\\%s' % (
-                self.start,
-                ''.join([str(x) for x in self]),
-                self.end)
-        else:
-            # split on 'TO'
-            split = self.index('TO')
-            if split > 0:
-                first = ''.join([
-                    str(x) for x in self[:split]
-                    if not isinstance(x, Whitespace)])
-            if split < (len(self) - 1):
-                last = ''.join([
-                    str(x) for x in self[split + 1:]
-                    if not isinstance(x, Whitespace)])
-        return '%s%s TO %s%s' % (self.start, first, last, self.end)
-
-
-class Stack(list):
-
-    def __init__(self):
-        self.append([])
-
-    def add(self, item):
-        self.current.append(item)
-        self.append(item)
+        if 'TO' not in items:       # not a valid range, quote
+            return '\\%s%s\\%s' % (start, ''.join(map(text, items)), end)
+        split = items.index('TO')
+        first = last = '*'
+        if split > 0:
+            first = ''.join([text(x) for x in items[:split] if x is not None])
+        if split < len(items) - 1:
+            last = ''.join([text(x) for x in items[split + 1:]
+                            if x is not None])
+        return '%s%s TO %s%s' % (start, first, last, end)
+    return '%s%s%s' % (start, ''.join(map(text, items)), end)
 
-    @property
-    def current(self):
-        return self[-1]
 
-    def __str__(self):
-        return ''.join([str(x) for x in self[0]])
+closing = {'[': ']', '{': '}'}
 
 
 def quote(term, textfield=False):
+    """ quote the given term so that it can be used in a query, escaping
+        (or dropping) special characters unless they're used correctly """
     if isinstance(term, unicode):
         term = term.encode('utf-8')
-    stack = Stack()
-    tokens = query_tokenizer.findall(term.strip())
+    term = term.strip()
+    if plain_text.match(term):
+        return term     # nothing to quote
+    top = [TOP, '', '', []]
+    stack = [top]
+    current = top
+    items = current[3]
+    tokens = query_tokenizer.findall(term)
     # Counter enables lookahead
     i = 0
     stop = len(tokens)
     while i < stop:
-        whitespace, boolean, text, grouping, special = tokens[i]
+        whitespace, boolean, word, grouping, special = tokens[i]
 
         if whitespace:
             # Add whitespace if group text, range and group filter on display
-            if isinstance(stack.current, Group):
-                stack.current.append(Whitespace())
-            elif isinstance(stack.current, list):
+            if current is top:
                 # We have whitespace with no grouping, insert group
-                new = Group('(', ')')
-                new.extend(stack.current)
-                new.append(Whitespace())
-                stack.current[:] = []
-                stack.add(new)
+                current = [GROUP, '(', ')', items + [None]]
+                top[3] = []
+                stack.append(current)
+                items = current[3]
+            else:
+                items.append(None)
 
         elif boolean:
             # It's an operator if the following token is the same...
-            if i < stop - 1 and boolean == tokens[i + 1][1]:
-                # Add operator if we're inside a group
-                if isinstance(stack.current, Group):
-                    stack.current.append(boolean)
-                elif isinstance(stack.current, list):
-                    # We have an operator with no grouping, insert group
-                    new = Group('(', ')')
-                    new.extend(stack.current)
-                    new.append(boolean)
-                    stack.current[:] = []
-                    stack.add(new)
+            if i < stop - 1 and boolean == tokens[i + 1][1] and \
+                    current is top:
+                # We have an operator with no grouping, insert group
+                current = [GROUP, '(', ')', items + [boolean]]
+                top[3] = []
+                stack.append(current)
+                items = current[3]
             else:
-                stack.current.append(boolean)
+                items.append(boolean)
 
         elif grouping:
             # [] (inclusive range), {} (exclusive range), always with TO inside
             # () group
             # "" for quotes
+            kind = current[0]
             if grouping == '"':
-                if isinstance(stack.current, Quote):
+                if kind == QUOTE:
                     # Handle empty double quote
-                    if not stack.current:
-                        stack.current.end = '\\"'
+                    if not items:
+                        current[2] = '\\"'
                     else:
-                        stack.current.start = stack.current.end = '"'
-                        stack.current.isgroup = True
+                        current[1] = current[2] = '"'
                     stack.pop()
+                    closed = render(current), bool(items)
+                    current = stack[-1]
+                    items = current[3]
+                    items.append(closed)
                 else:
                     # Right now this is just a single quote,
-                    # we set proper start and end before popping
-                    new = Quote(start='\\"', end='')
-                    stack.add(new)
-            elif isinstance(stack.current, Quote):
+                    # we set proper start and end before closing
+                    current = [QUOTE, '\\"', '', []]
+                    stack.append(current)
+                    items = current[3]
+            elif kind == QUOTE:
                 # If we're in a quote, escape and print
-                stack.current.append('\\%s' % grouping)
+                items.append('\\%s' % grouping)
             elif grouping in '[{':
-                new = Range(start=grouping, end={'[': ']', '{': '}'}[grouping])
-                stack.add(new)
+                current = [RANGE, grouping, closing[grouping], []]
+                stack.append(current)
+                items = current[3]
             elif grouping == '(':
-                new = Group(start='(', end=')')
-                stack.add(new)
-            elif grouping in ']})':
-                if (
-                    isinstance(stack.current, Group) and
-                    stack.current.end == grouping
-                ):
-                    stack.current.isgroup = True
-                    stack.pop()
-                else:
-                    stack.current.append('\\%s' % grouping)
+                current = [GROUP, '(', ')', []]
+                stack.append(current)
+                items = current[3]
+            elif current is not top and current[2] == grouping:
+                stack.pop()
+                closed = render(current), bool(items)
+                current = stack[-1]
+                items = current[3]
+                items.append(closed)
+            else:
+                items.append('\\%s' % grouping)
 
-        elif text:
-            stack.current.append(text)
+        elif word:
+            items.append(word)
 
         elif special:
             if special == '\\':
                 # Inspect next to see if it's quoted special or quoted group
                 if (i + 1) < stop:
                     _, _, _, g2, s2 = tokens[i + 1]
-                    if s2:
-                        stack.current.append('%s%s' % (special, s2))
-                        # Jump ahead
-                        i += 1
-                    elif g2:
-                        stack.current.append('%s%s' % (special, g2))
+                    if s2 or g2:
+                        items.append('\\%s' % (s2 or g2))
                         # Jump ahead
                         i += 1
                     else:
                         # Quote it
-                        stack.current.append('\\%s' % special)
+                        items.append('\\\\')
                 else:
                     # Quote it
-                    stack.current.append('\\\\')
-            elif isinstance(stack.current, Quote):
-                stack.current.append('\\%s' % special)
+                    items.append('\\\\')
+            elif current[0] == QUOTE:
+                items.append('\\%s' % special)
             elif special in '+-':
                 if (i + 1) < stop:
                     _, _, t2, g2, _ = tokens[i + 1]
@@ -215,57 +189,54 @@ def quote(term, textfield=False):
                         if textfield and i > 0 and tokens[i - 1][2]:
                             # Quote intra-word hyphens, so they are normal text
                             # and not syntax
-                            stack.current.append('\\%s' % special)
+                            items.append('\\%s' % special)
                         else:
-                            stack.current.append(special)
+                            items.append(special)
                     else:
                         # Quote it
-                        stack.current.append('\\%s' % special)
+                        items.append('\\%s' % special)
             elif special in '~^':
                 # Fuzzy or proximity is always after a term or phrase, and
                 # sometimes before int or float like roam~0.8 or
                 # "jakarta apache"~10
-                if i > 0:
-                    _, _, t0, g0, _ = tokens[i - 1]
-                    if t0 or g0 == '"':
-                        # Look ahead to check for integer or float
-
-                        if (i + 1) < stop:
-                            _, _, t2, _, _ = tokens[i + 1]
-                            try:  # float(t2) might fail
-                                if t2 and float(t2):
-                                    stack.current.append(
-                                        '%s%s' % (special, t2))
-                                    # Jump ahead
-                                    i += 1
-                                else:
-                                    stack.current.append(special)
-                            except ValueError:
-                                stack.current.append(special)
-                        else:  # (i+1)<stop
-                            stack.current.append(special)
-                    else:  # t0 or g0 == '"'
-                        stack.current.append('\\%s' % special)
-                else:  # i>0
-                    stack.current.append('\\%s' % special)
+                if i > 0 and (tokens[i - 1][2] or tokens[i - 1][3] == '"'):
+                    # Look ahead to check for integer or float
+                    t2 = (i + 1) < stop and tokens[i + 1][2]
+                    try:  # float(t2) might fail
+                        if t2 and float(t2):
+                            items.append('%s%s' % (special, t2))
+                            # Jump ahead
+                            i += 1
+                        else:
+                            items.append(special)
+                    except ValueError:
+                        items.append(special)
+                else:
+                    items.append('\\%s' % special)
             elif special in '?*':
                 # ? and * can not be the first characters of a search
-                if (
-                    stack.current and
-                    not getattr(stack.current[-1], 'isgroup', False) and
-                    (
-                        isinstance(stack.current[-1], str) and
-                        not stack.current[-1] in special
-                    )
-                ) or isinstance(stack.current, Range):
-                    stack.current.append(special)
-            elif special in '/':
-                stack.current.append('\\%s' % special)
-            elif isinstance(stack.current, Range):
-                stack.current.append(special)
-            elif isinstance(stack.current, Group):
-                stack.current.append('\\%s' % special)
-            elif isinstance(stack.current, list):
-                stack.current.append('\\%s' % special)
+                if current[0] == RANGE or items and \
+                        items[-1].__class__ is str and \
+                        items[-1] not in special:
+                    items.append(special)
+            elif special == '/' or current[0] != RANGE:
+                items.append('\\%s' % special)
+            else:
+                items.append(special)
         i += 1
-    return str(stack)
+    # unfinished groups are closed implicitly
+    while len(stack) > 1:
+        group = stack.pop()
+        stack[-1][3].append((render(group), bool(group[3])))
+    return ''.join(map(text, top[3]))
+
+
+def quoteItem(term):
+    """ quote a list item, which should be treated as a literal, but
+        nevertheless only gets quoted when necessary """
+    if isinstance(term, unicode):
+        term = term.encode('utf-8')
+    quoted = quote(term)
+    if not quoted.startswith('"') and not quoted == term:
+        quoted = quote('"' + term + '"')
+    return quoted
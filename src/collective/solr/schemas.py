@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from collective.solr.parser import SolrSchema
+from logging import getLogger
+from os import rename
+from threading import Lock
+from time import time
+
+logger = getLogger('collective.solr.schemas')
+
+SCHEMA_TTL = 3600       # seconds until a schema gets fetched again
+RETRY_INTERVAL = 60     # seconds until failed fetches are retried
+
+
+def loadSnapshot(path):
+    """ read a previously saved schema;  `None` is returned if there's
+        no usable snapshot """
+    try:
+        with open(path, 'rb') as snapshot:
+            return SolrSchema(snapshot.read())
+    except (IOError, OSError):
+        return None
+    except Exception:
+        logger.exception('ignoring broken schema snapshot %s', path)
+        return None
+
+
+def saveSnapshot(path, schema):
+    """ save the schema's source so it can be used on the next startup;
+        the file is replaced atomically to not leave partial data """
+    temp = '%s.tmp' % path
+    try:
+        with open(temp, 'wb') as snapshot:
+            snapshot.write(schema.source)
+        rename(temp, path)
+    except (IOError, OSError):
+        logger.exception('unable to save schema snapshot %s', path)
+
+
+schemas = {}            # endpoint -> (schema, expiry time or `None`)
+schemasLock = Lock()
+
+
+def getSchema(key, fetch, ttl=SCHEMA_TTL, snapshot=None):
+    """ return the process-wide schema for the given endpoint, using
+        `fetch()` to get it from solr;  an expired schema is refetched by
+        the first thread noticing while other threads continue to use it
+        in the meantime, but it's only replaced if it has changed;  if a
+        snapshot file is given, it is used until solr has been reached """
+    entry = schemas.get(key)
+    if entry is not None:
+        schema, expires = entry
+        if expires is None or expires > time():
+            return schema
+        if not schemasLock.acquire(False):
+            return schema               # another thread is refreshing it
+    else:
+        schemasLock.acquire()           # wait for other threads fetching it
+    try:
+        schema = None
+        entry = schemas.get(key)
+        if entry is not None:
+            schema, expires = entry
+            if expires is None or expires > time():
+                return schema
+        elif snapshot is not None:
+            schema = loadSnapshot(snapshot)
+            if schema is not None:
+                logger.info('using schema snapshot %s', snapshot)
+                schemas[key] = (schema, time() + RETRY_INTERVAL)
+                return schema
+        current = fetch()
+        if current is None:             # solr can't be reached...
+            if schema is not None:
+                schemas[key] = (schema, time() + RETRY_INTERVAL)
+            return schema
+        if schema is not None and schema.digest == current.digest:
+            current = schema            # unchanged, so keep the old one
+        elif snapshot is not None:
+            saveSnapshot(snapshot, current)
+        schemas[key] = (current, ttl and time() + ttl or None)
+        return current
+    finally:
+        schemasLock.release()
+
+
+def clearSchemas():
+    """ forget all schemas, so they will be fetched again """
+    with schemasLock:
+        schemas.clear()
@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from Missing import MV
+from collective.solr.cache import resultCache
+from collective.solr.coalesce import searches
 from collective.solr.exceptions import SolrInactiveException
 from collective.solr.interfaces import ISearch
 from collective.solr.interfaces import ISolrConnectionConfig
@@ -9,11 +11,20 @@ from collective.solr.mangler import mangleQuery
 from collective.solr.mangler import optimizeQueryParameters
 from collective.solr.mangler import subtractQueryParameters
 from collective.solr.parser import SolrResponse
+from collective.solr.pool import PoolExhausted
 from collective.solr.queryparser import quote
+from collective.solr.queryparser import quoteItem
+from collective.solr.solr import SolrException
+from collective.solr.translation import fillTemplate
+from collective.solr.translation import makeTemplate
+from collective.solr.translation import templateKey
+from collective.solr.translation import translations
 from collective.solr.utils import isWildCard
 from collective.solr.utils import prepareData
 from collective.solr.utils import prepare_wildcard
+from httplib import HTTPException
 from logging import getLogger
+from socket import error
 from time import time
 from zope.component import queryUtility
 from zope.interface import implements
@@ -27,6 +38,21 @@ except ImportError:
 logger = getLogger('collective.solr.search')
 
 
+def cacheKey(config, query, parameters):
+    """ build the key for caching the results of a search;  the order of
+        query parts and filter queries doesn't matter and `mangleQuery`
+        already sorts the tokens for `allowedRolesAndUsers`, so users with
+        the same roles share entries when `exclude_user` is set """
+    if isinstance(query, dict):
+        query = ' '.join(value for name, value in sorted(query.items()))
+    params = []
+    for name, value in sorted(parameters.items()):
+        if isinstance(value, (list, tuple)):
+            value = tuple(name == 'fq' and sorted(value) or value)
+        params.append((name, value))
+    return config.host, config.port, config.base, query, tuple(params)
+
+
 class Search(object):
     """ a search utility for solr """
     implements(ISearch)
@@ -51,50 +77,96 @@ class Search(object):
         config = queryUtility(ISolrConnectionConfig)
         manager = self.getManager()
         manager.setSearchTimeout()
-        connection = manager.getConnection()
+        connection = manager.getSearchConnection()
         if connection is None:
             raise SolrInactiveException
-        if 'rows' not in parameters:
-            parameters['rows'] = config.max_results or 10000000
-            # Check if rows param is 0 for backwards compatibility. Before
-            # Solr 4 'rows = 0' meant that there is no limitation. Solr 4
-            # always expects a rows param > 0 though:
-            # http://wiki.apache.org/solr/CommonQueryParameters#rows
-            if parameters['rows'] == 0:
-                parameters['rows'] = 10000000
-            logger.debug(
-                'falling back to "max_results" (%d) without a "rows" '
-                'parameter: %r (%r)', config.max_results, query, parameters
-            )
-        if getattr(config, 'highlight_fields', None):
-            if parameters.get('hl', 'false') == 'true'\
-                    and 'hl.fl' not in parameters:
-                parameters['hl'] = 'true'
-                parameters['hl.fl'] = config.highlight_fields or []
-                parameters['hl.simple.pre'] =\
-                    config.highlight_formatter_pre or ' '
-                parameters['hl.simple.post'] =\
-                    config.highlight_formatter_post or ' '
-                parameters['hl.fragsize'] =\
-                    getattr(config, 'highlight_fragsize', None) or 100
-        if 'fl' not in parameters:
-            if config.field_list:
-                parameters['fl'] = ' '.join(config.field_list)
+        try:
+            if 'rows' not in parameters:
+                parameters['rows'] = config.max_results or 10000000
+                # Check if rows param is 0 for backwards compatibility. Before
+                # Solr 4 'rows = 0' meant that there is no limitation. Solr 4
+                # always expects a rows param > 0 though:
+                # http://wiki.apache.org/solr/CommonQueryParameters#rows
+                if parameters['rows'] == 0:
+                    parameters['rows'] = 10000000
+                logger.debug(
+                    'falling back to "max_results" (%d) without a "rows" '
+                    'parameter: %r (%r)', config.max_results, query, parameters
+                )
+            if getattr(config, 'highlight_fields', None):
+                if parameters.get('hl', 'false') == 'true'\
+                        and 'hl.fl' not in parameters:
+                    parameters['hl'] = 'true'
+                    parameters['hl.fl'] = config.highlight_fields or []
+                    parameters['hl.simple.pre'] =\
+                        config.highlight_formatter_pre or ' '
+                    parameters['hl.simple.post'] =\
+                        config.highlight_formatter_post or ' '
+                    parameters['hl.fragsize'] =\
+                        getattr(config, 'highlight_fragsize', None) or 100
+            if 'fl' not in parameters:
+                if config.field_list:
+                    parameters['fl'] = ' '.join(config.field_list)
+                else:
+                    parameters['fl'] = '* score'
+            key = data = response = None
+            caching = getattr(config, 'cache_size', 0)
+            coalesce = getattr(config, 'coalesce_timeout', 0)
+            if caching or coalesce:
+                key = cacheKey(config, query, parameters)
+            if caching:
+                resultCache.maxbytes = config.cache_size * 1024
+                resultCache.ttl = getattr(config, 'cache_ttl', 0)
+                data = resultCache.get(key)
+                generation = resultCache.generation
+            if isinstance(query, dict):
+                query = ' '.join(query.values())
+            logger.debug('searching for %r (%r)', query, parameters)
+            if 'sort' in parameters:    # warn about unknown sort indices
+                index, order = parameters['sort'].split()
+                schema = manager.getSchema()
+                if schema is None or index not in schema.stored:
+                    logger.warning('sorting on non-stored attribute "%s"',
+                                   index)
+            wt = parameters.get('wt')
+            if wt == 'json':
+                parameters.setdefault('json.nl', 'map')     # facets as dicts
+                schema = manager.getSchema()    # needed to unmarshal dates
+            if key is None:
+                response, connection = self.send(connection, q=query,
+                                                 **parameters)
+            elif data is None:
+                used = [connection]
+
+                def fetch():
+                    response, used[0] = self.send(used[0], q=query,
+                                                  **parameters)
+                    try:
+                        data = response.read()
+                    finally:
+                        response.close()
+                    if caching:
+                        resultCache.set(key, data, generation)
+                    return data
+                if coalesce:
+                    data = searches(key, fetch, coalesce)
+                else:
+                    data = fetch()
+                connection = used[0]
+            else:
+                logger.debug('using cached results for %r', query)
+            source = response if data is None else data
+            if wt == 'json':
+                results = SolrResponse().parseJSON(source, schema)
+            elif wt == 'javabin':
+                results = SolrResponse().parseJavabin(source)
             else:
-                parameters['fl'] = '* score'
-        if isinstance(query, dict):
-            query = ' '.join(query.values())
-        logger.debug('searching for %r (%r)', query, parameters)
-        if 'sort' in parameters:    # issue warning for unknown sort indices
-            index, order = parameters['sort'].split()
-            schema = manager.getSchema() or {}
-            field = schema.get(index, None)
-            if field is None or not field.stored:
-                logger.warning('sorting on non-stored attribute "%s"', index)
-        response = connection.search(q=query, **parameters)
-        results = SolrResponse(response)
-        response.close()
-        manager.setTimeout(None)
+                results = SolrResponse(source, lazy=True)
+            if response is not None:
+                response.close()
+        finally:
+            connection.release()    # hand the http connection back
+            manager.setTimeout(None)
         elapsed = (time() - start) * 1000
         slow = config.slow_query_threshold
         if slow and elapsed >= slow:
@@ -109,15 +181,71 @@ class Search(object):
 
     __call__ = search
 
+    def send(self, connection, **parameters):
+        """ send a search request, failing over to the next replica if
+            the chosen one doesn't respond;  returns the response along
+            with the connection that was eventually used, which is
+            released if the request fails """
+        manager = self.getManager()
+        balancer = manager.getBalancer()
+        tried = []
+        while True:
+            node = getattr(connection, 'node', None)
+            start = time()
+            try:
+                response = connection.search(**parameters)
+            except PoolExhausted:
+                connection.release()
+                raise               # a local shortage, not the node's fault
+            except (SolrException, HTTPException, error), e:
+                if balancer is None or node is None:
+                    connection.release()
+                    raise
+                if isinstance(e, SolrException) and \
+                        str(e.httpcode).startswith('4'):
+                    connection.release()
+                    raise           # the request is wrong, not the node
+                logger.warning('search request to %r failed: %s', node, e)
+                balancer.failed(node)
+                connection.discard()        # don't reuse the socket
+                tried.append(node)
+                connection = manager.getSearchConnection(exclude=tried)
+                if connection is None:
+                    raise
+                continue
+            if balancer is not None and node is not None:
+                balancer.succeeded(node, time() - start)
+            return response, connection
+
     def buildQueryAndParameters(self, default=None, **args):
-        """ helper to build a querystring for simple use-cases """
+        """ helper to build a querystring for simple use-cases;  the
+            results are cached as templates (see `translation.py`) """
+        languageFilter(args)
+        try:
+            key, values = templateKey(default, args, self.getConfig(),
+                                      self.getManager().getSchema())
+        except TypeError:
+            key = None
+        if key is not None:
+            template = translations.get(key)
+            if template is not None:
+                return fillTemplate(template, values)
+        query, params = self.translateQuery(default, **args)
+        if key is not None and query:
+            template = makeTemplate(query, params, values)
+            if template is not None:
+                translations.set(key, template)
+        return query, params
+
+    def translateQuery(self, default=None, **args):
+        """ build a querystring and parameters for the given (language
+            filtered) catalog arguments """
         schema = self.getManager().getSchema() or {}
         config = self.getConfig()
 
         params = subtractQueryParameters(args)
         params = cleanupQueryParameters(params, schema)
 
-        languageFilter(args)
         prepareData(args)
         mangleQuery(args, config, schema)
 
@@ -125,6 +253,8 @@ class Search(object):
         schema = self.getManager().getSchema() or {}
         defaultSearchField = getattr(schema, 'defaultSearchField', None)
         args[None] = default
+        threshold = getattr(config, 'terms_threshold', 0)
+        terms = {}      # long lists for the terms query parser
         query = {}
 
         for name, value in sorted(args.items()):
@@ -158,16 +288,10 @@ class Search(object):
                     continue                    # skip when "true or false"
                 value = str(value.pop()).lower()
             elif isinstance(value, (tuple, list)):
-                # list items should be treated as literals, but
-                # nevertheless only get quoted when necessary
-                def quoteitem(term):
-                    if isinstance(term, unicode):
-                        term = term.encode('utf-8')
-                    quoted = quote(term)
-                    if not quoted.startswith('"') and not quoted == term:
-                        quoted = quote('"' + term + '"')
-                    return quoted
-                value = '(%s)' % ' OR '.join(map(quoteitem, value))
+                if name is not None and field.class_ == 'solr.StrField' \
+                        and 0 < threshold < len(value):
+                    terms[name] = value
+                value = '(%s)' % ' OR '.join(map(quoteItem, value))
             elif isinstance(value, set):        # sets are taken literally
                 if len(value) == 1:
                     query[name] = ''.join(value)
@@ -201,5 +325,5 @@ class Search(object):
         logger.debug('built query "%s"', query)
 
         if query:
-            optimizeQueryParameters(query, params)
+            optimizeQueryParameters(query, params, schema, terms)
         return query, params
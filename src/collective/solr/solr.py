@@ -30,6 +30,7 @@
 
 import httplib
 import socket
+import zlib
 from xml.etree.cElementTree import fromstring
 from xml.sax.saxutils import escape
 import codecs
@@ -59,10 +60,64 @@ class SolrException(Exception):
         return 'HTTP code=%s, reason=%s' % (self.httpcode, self.reason)
 
 
-class SolrConnection:
+class DecompressingResponse(object):
+    """ a wrapper for compressed http responses, which decompresses the
+        body while it's being read, so that it can be parsed in a streaming
+        fashion;  all other attributes are taken from the wrapped response """
+
+    chunk = 16 * 1024
+
+    def __init__(self, response, encoding):
+        self.response = response
+        if encoding == 'gzip':
+            wbits = 16 + zlib.MAX_WBITS     # expect a gzip header
+        else:
+            wbits = zlib.MAX_WBITS          # deflate with zlib header
+        self.decompressor = zlib.decompressobj(wbits)
+        self.buffer = ''
+
+    def __getattr__(self, name):
+        return getattr(self.response, name)
+
+    def read(self, amt=None):
+        """ return up to `amt` bytes of decompressed data or all of it """
+        while amt is None or len(self.buffer) < amt:
+            data = self.response.read(self.chunk)
+            if not data:
+                self.buffer += self.decompressor.flush()
+                break
+            self.buffer += self.decompressor.decompress(data)
+        if amt is None:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:amt], self.buffer[amt:]
+        return data
+
+
+def decompress(response):
+    """ wrap a response using `gzip` or `deflate` content encoding """
+    encoding = (response.getheader('content-encoding') or '').lower()
+    if encoding in ('gzip', 'x-gzip', 'deflate'):
+        return DecompressingResponse(response, encoding)
+    return response
+
+
+def compress(data):
+    """ gzip-compress the given request body """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
+
+BATCH_BYTES = 1024 * 1024   # maximum size of merged update requests
+
+
+class SolrConnection(object):
+
+    uniqueKey = None        # set once the schema is known, see `manager.py`
 
     def __init__(self, host='localhost:8983', solrBase='/solr',
-                 persistent=True, postHeaders={}, timeout=None):
+                 persistent=True, postHeaders={}, timeout=None, pool=None,
+                 compressThreshold=0, batchSize=0, batchBytes=BATCH_BYTES):
         self.host = host
         self.solrBase = str(solrBase)
         self.persistent = persistent
@@ -70,17 +125,31 @@ class SolrConnection:
         self.encoder = codecs.getencoder('utf-8')
         # responses from Solr will always be in UTF-8
         self.decoder = codecs.getdecoder('utf-8')
-        # a real connection to the server is not opened at this point.
-        self.conn = HTTPConnectionWithTimeout(self.host, timeout=timeout)
+        # a real connection to the server is not opened at this point;
+        # with a pool it isn't even checked out until it's first used
+        self.timeout = timeout
+        self.pool = pool
+        self._conn = None
+        self._pooled = False
+        if pool is None:
+            self._conn = HTTPConnectionWithTimeout(self.host, timeout=timeout)
         # self.conn.set_debuglevel(1000000)
         self.xmlbody = []
+        self.xmlparts = []      # (head, unique key) for mergeable requests
         self.xmlheaders = {'Content-Type': 'text/xml; charset=utf-8'}
         self.xmlheaders.update(postHeaders)
         if not self.persistent:
             self.xmlheaders['Connection'] = 'close'
         self.formheaders = {
-            'Content-Type': 'application/x-www-form-urlencoded; charset=utf-8'
+            'Content-Type': 'application/x-www-form-urlencoded; charset=utf-8',
+            'Accept-Encoding': 'gzip, deflate',
         }
+        # update requests larger than this get sent gzip-compressed
+        self.compressThreshold = compressThreshold
+        # consecutive adds & deletes get merged into requests of up to
+        # this many documents and bytes when flushing
+        self.batchSize = batchSize
+        self.batchBytes = batchBytes
         if not self.persistent:
             self.formheaders['Connection'] = 'close'
 
@@ -96,6 +165,21 @@ class SolrConnection:
             )
         )
 
+    def getConn(self):
+        """ return the http connection, checking one out of the pool
+            if necessary """
+        if self._conn is None:
+            self._conn = self.pool.checkout(self.timeout)
+            self._pooled = True
+        return self._conn
+
+    def setConn(self, conn):
+        """ replace the http connection, returning a pooled one """
+        self.release()
+        self._conn = conn
+
+    conn = property(getConn, setConn)
+
     def __reconnect(self):
         self.reconnects += 1
         self.conn.close()
@@ -103,8 +187,26 @@ class SolrConnection:
 
     reset = __reconnect
 
+    def release(self):
+        """ check a pooled http connection back in;  another one will
+            be checked out with the next request """
+        if self._pooled:
+            conn, self._conn, self._pooled = self._conn, None, False
+            self.pool.checkin(conn)
+
+    def discard(self):
+        """ close a pooled http connection, so its socket isn't reused,
+            and check it back in;  unlike `conn` this never checks out
+            another one """
+        if self._pooled:
+            self._conn.close()
+        self.release()
+
     def close(self):
-        self.conn.close()
+        if self._pooled:
+            self.release()
+        elif self._conn is not None:
+            self._conn.close()
 
     def __errcheck(self, rsp):
         if rsp.status != 200:
@@ -119,7 +221,9 @@ class SolrConnection:
     def setTimeout(self, timeout):
         """ set a timeout value for the currently open connection """
         logger.debug('setting socket timeout on %r: %s', self, timeout)
-        self.conn.setTimeout(timeout)
+        self.timeout = timeout
+        if self._conn is not None:
+            self._conn.setTimeout(timeout)
 
     def doPost(self, url, body, headers):
         return self.doGetOrPost('POST', url, body, headers)
@@ -128,9 +232,10 @@ class SolrConnection:
         return self.doGetOrPost('GET', url, '', headers)
 
     def doGetOrPost(self, method, url, body, headers):
+        conn = self.conn        # check out before catching socket errors
         try:
-            self.conn.request(method, url, body, headers)
-            return self.__errcheck(self.conn.getresponse())
+            conn.request(method, url, body, headers)
+            return self.__errcheck(decompress(conn.getresponse()))
         except (
             socket.error, httplib.CannotSendRequest,
             httplib.ResponseNotReady, httplib.BadStatusLine
@@ -143,38 +248,105 @@ class SolrConnection:
             # might be "ghosted" in the zodb).
             self.__reconnect()
             self.conn.request(method, url, body, headers)
-            return self.__errcheck(self.conn.getresponse())
+            return self.__errcheck(decompress(self.conn.getresponse()))
 
-    def doUpdateXML(self, request):
+    def doUpdateXML(self, request, head=None, key=None):
         # solr will support abort/rollback only from version 1.4, so
         # for now we delay sending the xml until the commit...
         # see http://issues.apache.org/jira/browse/SOLR-670
         logger.debug('storing xml request for later: %r', request)
         self.xmlbody.append(request)
+        self.xmlparts.append(head and (head, key))
+
+    def batches(self):
+        """ return the stored requests, merging consecutive ones with the
+            same opening tag like `<add>` or `<delete>` into batches;  for
+            the same unique key only the last update is kept, i.e. unless
+            there's another request (a commit or delete by query) between
+            them;  yields the request along with the originals it replaces
+            or `None` if it wasn't merged """
+        latest = {}
+        skip = set()
+        for pos, part in enumerate(self.batchSize and self.xmlparts or ()):
+            if part is None:
+                latest.clear()
+            elif part[1] is not None:
+                if part[1] in latest:
+                    skip.add(latest[part[1]])
+                latest[part[1]] = pos
+        batch, head, size = [], None, 0
+        for pos, request in enumerate(self.xmlbody):
+            if pos in skip:
+                continue
+            part = self.xmlparts[pos]
+            if batch and (part is None or part[0] != head or
+                          len(batch) >= self.batchSize or
+                          size + len(request) > self.batchBytes):
+                yield self.merge(head, batch)
+                batch, head, size = [], None, 0
+            if part is None or not self.batchSize:
+                yield request, None
+            else:
+                batch.append(request)
+                head = part[0]
+                size += len(request)
+        if batch:
+            yield self.merge(head, batch)
+
+    def merge(self, head, requests):
+        """ merge update requests with the given opening tag """
+        if len(requests) == 1:
+            return requests[0], None
+        tail = '</%s>' % head[1:-1].split(' ', 1)[0]
+        body = [request[len(head):-len(tail)] for request in requests]
+        return head + ''.join(body) + tail, requests
 
     def flush(self):
-        """ send out the stored requests to solr """
+        """ send out the stored requests to solr, merging them into
+            batches where possible """
         count = 0
+        sent = 0
         responses = []
-        for request in self.xmlbody:
+        for request, originals in self.batches():
             try:
                 responses.append(self.doSendXML(request))
             except (SolrException, socket.error):
-                logger.exception('exception during request %r', request)
+                if originals is None:
+                    logger.exception('exception during request %r',
+                                     request)
+                else:
+                    # a single bad document shouldn't make the whole batch
+                    # fail, so its requests are retried one by one
+                    logger.warning('batch of %d requests failed, retrying '
+                                   'them separately', len(originals))
+                    for original in originals:
+                        try:
+                            responses.append(self.doSendXML(original))
+                        except (SolrException, socket.error):
+                            logger.exception('exception during request %r',
+                                             original)
+                        sent += 1
+                    count += len(request)
+                    continue
             count += len(request)
+            sent += 1
         logger.debug(
-            'flushed out %d bytes in %d requests',
-            count, len(self.xmlbody)
+            'flushed out %d bytes of %d updates in %d requests',
+            count, len(self.xmlbody), sent
         )
         del self.xmlbody[:]
+        del self.xmlparts[:]
+        self.release()
         return responses
 
     def doSendXML(self, request):
+        headers = self.xmlheaders
+        if self.compressThreshold and len(request) > self.compressThreshold:
+            request = compress(request)
+            headers = dict(headers)
+            headers['Content-Encoding'] = 'gzip'
         try:
-            rsp = self.doPost(
-                self.solrBase + '/update', request,
-                self.xmlheaders
-            )
+            rsp = self.doPost(self.solrBase + '/update', request, headers)
             data = rsp.read()
         finally:
             if not self.persistent:
@@ -205,8 +377,9 @@ class SolrConnection:
         return key
 
     def delete(self, id):
-        xstr = '<delete><id>%s</id></delete>' % self.escapeVal(id)
-        return self.doUpdateXML(xstr)
+        id = self.escapeVal(id)
+        xstr = '<delete><id>%s</id></delete>' % id
+        return self.doUpdateXML(xstr, head='<delete>', key=id)
 
     def deleteByQuery(self, query):
         xstr = '<delete><query>%s</query></delete>' % self.escapeVal(query)
@@ -215,9 +388,10 @@ class SolrConnection:
     def add(self, boost_values=None, **fields):
         within = fields.pop('commitWithin', None)
         if within:
-            lst = ['<add commitWithin="%s">' % str(within)]
+            head = '<add commitWithin="%s">' % str(within)
         else:
-            lst = ['<add>']
+            head = '<add>'
+        lst = [head]
         if boost_values is None:
             boost_values = {}
         if '' in boost_values:      # boost value for the entire document
@@ -238,7 +412,41 @@ class SolrConnection:
         lst.append('</doc>')
         lst.append('</add>')
         xstr = ''.join(lst)
-        return self.doUpdateXML(xstr)
+        key = fields.get(self.uniqueKey) if self.uniqueKey else None
+        if key is not None:
+            key = self.escapeVal(key)
+        return self.doUpdateXML(xstr, head=head, key=key)
+
+    def update(self, uniqueKey, **fields):
+        """ partially update the document identified by the given unique
+            key, replacing the values of the given fields using an atomic
+            update, see http://wiki.apache.org/solr/Atomic_Updates """
+        within = fields.pop('commitWithin', None)
+        if within:
+            head = '<add commitWithin="%s">' % str(within)
+        else:
+            head = '<add>'
+        lst = [head, '<doc>']
+        for f, v in fields.items():
+            name = self.escapeKey(f)
+            if f in (uniqueKey, '_version_'):
+                lst.append('<field name="%s">%s</field>' % (
+                    name, self.escapeVal(v)))
+                continue
+            if not isinstance(v, (list, tuple)):
+                v = [v]
+            elif not v:         # clear the field
+                lst.append('<field name="%s" update="set" null="true"/>' %
+                           name)
+            for value in v:
+                lst.append('<field name="%s" update="set">%s</field>' % (
+                    name, self.escapeVal(value)))
+        lst.append('</doc>')
+        lst.append('</add>')
+        xstr = ''.join(lst)
+        # partial updates mustn't replace earlier (full) ones, so there's
+        # no unique key for merging them
+        return self.doUpdateXML(xstr, head=head)
 
     def commit(self, waitFlush=True, waitSearcher=True, optimize=False):
         data = {
@@ -251,6 +459,15 @@ class SolrConnection:
         self.doUpdateXML(xstr)
         return self.flush()
 
+    def popUpdates(self):
+        """ return the stored requests as `(request, head, key)` tuples,
+            see `doUpdateXML`, and remove them """
+        updates = [(request, part and part[0], part and part[1])
+                   for request, part in zip(self.xmlbody, self.xmlparts)]
+        del self.xmlbody[:]
+        del self.xmlparts[:]
+        return updates
+
     def abort(self):
         # solr will support abort/rollback only from version 1.4, so
         # for now we delay sending the xml until the commit (see above),
@@ -262,6 +479,7 @@ class SolrConnection:
             self.xmlbody
         )
         del self.xmlbody[:]
+        del self.xmlparts[:]
 
     def search(self, **params):
         request = urllib.urlencode(params, doseq=True)
@@ -276,8 +494,27 @@ class SolrConnection:
                 self.conn.close()
         return response
 
+    def get(self, *ids, **params):
+        """ fetch the documents with the given unique keys using solr's
+            real-time get handler, which also returns updates that haven't
+            been committed yet """
+        ids = [id.replace('\\', '\\\\').replace(',', '\\,') for id in ids]
+        params['ids'] = ','.join(ids)
+        request = urllib.urlencode(params, doseq=True)
+        logger.debug('sending request: %s' % request)
+        try:
+            response = self.doPost(
+                '%s/get' % self.solrBase, request,
+                self.formheaders
+            )
+        finally:
+            if not self.persistent:
+                self.conn.close()
+        return response
+
     def getSchema(self):
         schema_urls = (
+            '%s/schema?wt=json',                      # solr 4.2, schema api
             '%s/admin/file/?file=schema.xml',         # solr 1.3
             '%s/admin/get-file.jsp?file=schema.xml')  # solr 1.2
         for url in schema_urls:
@@ -294,7 +531,8 @@ class SolrConnection:
                 self.conn.request('GET', url % self.solrBase)
                 response = self.conn.getresponse()
             if response.status == 200:
-                xml = response.read()
-                return SolrSchema(xml.strip())
+                data = response.read()
+                self.release()
+                return SolrSchema(data.strip())
             self.__reconnect()          # force a new connection for each url
         self.__errcheck(response)       # raise a solrexception
@@ -1,11 +1,28 @@
-# simple benchmarking tests for measuring raw xml parsing speed
+# simple benchmarking tests for measuring raw xml, json & javabin parsing speed
+# as well as the conversion of dates, the quoting of search terms and the
+# building of queries for long lists of values
 # usage:
 # $ wget -O parts/test/data.xml 'http://localhost:8983/solr/select/?q=foo&rows=...'  # noqa
+# $ wget -O parts/test/data.json 'http://localhost:8983/solr/select/?q=foo&rows=...&wt=json&json.nl=map'  # noqa
+# $ wget -O parts/test/data.javabin 'http://localhost:8983/solr/select/?q=foo&rows=...&wt=javabin'  # noqa
 # $ bin/test --tests-pattern=benchmark -v -v
 
 from unittest import TestCase, defaultTestLoader
+from DateTime import DateTime
 from collective.solr.parser import SolrResponse
+from collective.solr.parser import dateCache
+from collective.solr.parser import parseDate
+from collective.solr.parser import parse_date_as_datetime
+from collective.solr.interfaces import ISolrConnectionConfig
 from collective.solr.iterparse import source
+from collective.solr.manager import SolrConnectionConfig
+from collective.solr.manager import SolrConnectionManager
+from collective.solr.queryparser import quote
+from collective.solr.search import Search
+from collective.solr.tests import treequote
+from collective.solr.tests.utils import getData, fakehttp
+from zope.component import getGlobalSiteManager
+from zope.component import provideUtility
 
 
 print 'Using `iterparse` from `%s`...' % source
@@ -31,5 +48,129 @@ class ParserBenchmarks(TestCase):
         SolrResponse(self.data)
 
 
+class JSONParserBenchmarks(TestCase):
+
+    data = open('data.json', 'r').read()
+
+    def test1(self):
+        SolrResponse().parseJSON(self.data)
+
+    def test2(self):
+        SolrResponse().parseJSON(self.data)
+
+    def test3(self):
+        SolrResponse().parseJSON(self.data)
+
+    def test4(self):
+        SolrResponse().parseJSON(self.data)
+
+    def test5(self):
+        SolrResponse().parseJSON(self.data)
+
+
+class JavabinParserBenchmarks(TestCase):
+
+    data = open('data.javabin', 'rb').read()
+
+    def test1(self):
+        SolrResponse().parseJavabin(self.data)
+
+    def test2(self):
+        SolrResponse().parseJavabin(self.data)
+
+    def test3(self):
+        SolrResponse().parseJavabin(self.data)
+
+    def test4(self):
+        SolrResponse().parseJavabin(self.data)
+
+    def test5(self):
+        SolrResponse().parseJavabin(self.data)
+
+
+class DateParsingBenchmarks(TestCase):
+
+    # 1000 dates with only 100 different values, like `effective` dates
+    # rounded by `effective_steps` or the default `expires` date
+    dates = ['20%02d-%02d-%02dT%02d:00:00.000Z' % (
+        i % 10, i % 12 + 1, i % 28 + 1, i % 24) for i in range(100)] * 10
+
+    def setUp(self):
+        dateCache.clear()
+
+    def test1DateTime(self):
+        for value in self.dates:
+            DateTime(value)
+
+    def test2ParseDateUncached(self):
+        for value in self.dates:
+            dateCache.clear()
+            parseDate(value)
+
+    def test3ParseDate(self):
+        for value in self.dates:
+            parseDate(value)
+
+    def test4ParseDateAsDatetime(self):
+        for value in self.dates:
+            parse_date_as_datetime(value)
+
+
+class QuotingBenchmarks(TestCase):
+
+    # typical input from search forms, repeated 100 times
+    terms = [
+        'foo', 'foo bar', '"foo bar" baz', 'foo* -bar +"baz qux"~2',
+        '(foo OR bar) AND baz', 'title:foo^2 [2008 TO 2015]', 'user$joe',
+        'P|This&That', 'roam~0.8 "jakarta apache"~10', 'foo-bar? baz!',
+    ] * 100
+
+    def test1TreeQuote(self):
+        for term in self.terms:
+            treequote.quote(term, textfield=True)
+
+    def test2Quote(self):
+        for term in self.terms:
+            quote(term, textfield=True)
+
+
+class TermsQueryBenchmarks(TestCase):
+
+    # queries for 1000 UIDs, like those of a big collection or a reference
+    # catalog lookup;  building them costs about the same, but the terms
+    # query parser saves solr from parsing and scoring 1000 boolean clauses
+    # (close to the default `maxBooleanClauses` of 1024) and lets it cache
+    # the filter, which needs to be measured against a running server
+    uids = ['%032x' % (i * 7919) for i in range(1000)]
+
+    def setUp(self):
+        self.config = SolrConnectionConfig()
+        self.config.auto_filter_queries = True
+        provideUtility(self.config, ISolrConnectionConfig)
+        self.addCleanup(getGlobalSiteManager().unregisterUtility,
+                        self.config, ISolrConnectionConfig)
+        self.mngr = SolrConnectionManager()
+        self.mngr.setHost(active=True)
+        fakehttp(self.mngr.getConnection(), getData('catalog_schema.xml'))
+        self.mngr.getSchema()
+        self.search = Search()
+        self.search.manager = self.mngr
+
+    def tearDown(self):
+        self.mngr.closeConnection()
+        self.mngr.setHost(active=False)
+
+    def build(self):
+        for i in range(100):
+            self.search.translateQuery(UID=self.uids, portal_type='File')
+
+    def test1BooleanQuery(self):
+        self.build()
+
+    def test2TermsQuery(self):
+        self.config.terms_threshold = 100
+        self.build()
+
+
 def test_suite():
     return defaultTestLoader.loadTestsFromName(__name__)
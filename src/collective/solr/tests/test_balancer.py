@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+from socket import error
+from unittest import TestCase, defaultTestLoader
+from zope.component import provideUtility
+
+from collective.solr.balancer import LoadBalancer
+from collective.solr.balancer import clearBalancer
+from collective.solr.balancer import parseNode
+from collective.solr.interfaces import ISolrConnectionConfig
+from collective.solr.manager import SolrConnectionConfig
+from collective.solr.manager import SolrConnectionManager
+from collective.solr.pool import PoolExhausted
+from collective.solr.search import Search
+from collective.solr.tests.utils import getData, fakehttp
+
+
+class NodeParsingTests(TestCase):
+
+    def testParseNode(self):
+        self.assertEqual(parseNode('foo:8983/solr'), ('foo:8983', '/solr'))
+        self.assertEqual(parseNode('foo:8983/solr/core1/'),
+                         ('foo:8983', '/solr/core1'))
+        self.assertEqual(parseNode('foo:8983', '/bar'), ('foo:8983', '/bar'))
+        self.assertEqual(parseNode(' http://foo:8983/solr '),
+                         ('foo:8983', '/solr'))
+
+
+class LoadBalancerTests(TestCase):
+
+    def setUp(self):
+        self.alive = set()
+        self.balancer = LoadBalancer(
+            [('foo:8983', '/solr'), ('bar:8983', '/solr')],
+            ping=lambda node: node.host in self.alive)
+        self.foo, self.bar = self.balancer.nodes
+
+    def testFastestNodeIsChosen(self):
+        self.balancer.succeeded(self.foo, 0.5)
+        self.balancer.succeeded(self.bar, 0.1)
+        self.assertEqual(self.balancer.choose(), self.bar)
+        for i in range(10):     # bar is getting slow...
+            self.balancer.succeeded(self.bar, 1.0)
+        self.assertEqual(self.balancer.choose(), self.foo)
+        self.assertEqual(self.balancer.choose(exclude=[self.foo]), self.bar)
+        self.assertEqual(self.balancer.choose(exclude=[self.foo, self.bar]),
+                         None)
+
+    def testSlowNodesAreChosenAgain(self):
+        self.alive.update(['foo:8983', 'bar:8983'])
+        self.balancer.succeeded(self.foo, 0.1)
+        self.balancer.succeeded(self.bar, 5.0)   # e.g. a gc pause
+        self.assertEqual(self.balancer.choose(), self.foo)
+        for i in range(20):     # searches go to foo while bar answers pings
+            self.balancer.succeeded(self.foo, 0.1)
+            self.balancer.check()
+        # bar's latency decays towards the average, but not to its much
+        # faster pings, so routing doesn't swing over to it...
+        self.failUnless(0.1 < self.bar.latency < 0.2, self.bar)
+        self.failUnless(self.bar.rtt < 0.1, self.bar)
+        self.assertEqual(self.balancer.choose(), self.foo)
+        # ...until foo gets slower
+        self.balancer.succeeded(self.foo, 0.5)
+        self.assertEqual(self.balancer.choose(), self.bar)
+
+    def testFailingNodesAreEjected(self):
+        self.balancer.failed(self.foo)
+        self.failUnless(self.foo.healthy)
+        self.balancer.failed(self.foo)
+        self.failIf(self.foo.healthy)
+        self.assertEqual(self.balancer.choose(), self.bar)
+        self.balancer.failed(self.bar)
+        self.balancer.failed(self.bar)
+        self.balancer.failed(self.bar)
+        # with all nodes ejected the one failing less is tried anyway
+        self.assertEqual(self.balancer.choose(), self.foo)
+
+    def testHealthChecks(self):
+        self.alive.add('foo:8983')
+        self.balancer.failed(self.foo)
+        self.balancer.failed(self.foo)
+        self.balancer.check()   # foo answers pings again, bar doesn't
+        self.failUnless(self.foo.healthy)
+        self.assertEqual(self.foo.errors, 0.0)
+        self.failIf(self.bar.healthy)
+        self.assertEqual(self.balancer.choose(), self.foo)
+
+
+class ReplicaSearchTests(TestCase):
+
+    def setUp(self):
+        config = SolrConnectionConfig()
+        config.replicas = ['localhost:8984/solr', 'localhost:8985']
+        provideUtility(config, ISolrConnectionConfig)
+        self.mngr = SolrConnectionManager()
+        self.mngr.setHost(active=True)
+        self.search = Search()
+        self.search.manager = self.mngr
+        self.balancer = self.mngr.getBalancer()
+
+    def tearDown(self):
+        clearBalancer()
+        self.mngr.closeConnection()
+        self.mngr.setHost(active=False)
+
+    def testNodes(self):
+        self.assertEqual(self.balancer.config, (
+            ('localhost:8984', '/solr'), ('localhost:8985', '/solr')))
+        self.assertEqual(self.mngr.getBalancer(), self.balancer)
+
+    def testSearchConnections(self):
+        first, second = self.balancer.nodes
+        self.balancer.succeeded(first, 1.0)
+        conn = self.mngr.getSearchConnection()
+        self.assertEqual(conn.node, second)
+        self.assertEqual(conn.host, 'localhost:8985')
+        self.assertNotEqual(conn, self.mngr.getConnection())
+        self.assertEqual(self.mngr.getSearchConnection(), conn)
+        conn = self.mngr.getSearchConnection(exclude=[second])
+        self.assertEqual(conn.node, first)
+        # the master is only used once all replicas have failed
+        conn = self.mngr.getSearchConnection(exclude=[first, second])
+        self.assertEqual(conn, self.mngr.getConnection())
+
+    def testFailover(self):
+        first, second = self.balancer.nodes
+        self.balancer.succeeded(first, 1.0)
+        broken = self.mngr.getSearchConnection()
+        self.assertEqual(broken.node, second)
+
+        def refuse(*args, **kw):
+            raise error(111, 'Connection refused')
+        broken.search = refuse
+        conn = self.mngr.getSearchConnection(exclude=[second])
+        output = fakehttp(conn, getData('search_response.txt'))
+        response, used = self.search.send(broken, q='id:[* TO *]')
+        self.assertEqual(used, conn)
+        self.failUnless(output.get().startswith('POST /solr/select'))
+        self.failUnless(second.errors > 0)
+        self.failUnless(first.latency < 1.0)
+
+    def testFallbackToMaster(self):
+        def refuse(*args, **kw):
+            raise error(111, 'Connection refused')
+        for node in self.balancer.nodes:
+            self.mngr.getSearchConnection(exclude=[node]).search = refuse
+        master = self.mngr.getConnection()
+        output = fakehttp(master, getData('search_response.txt'))
+        conn = self.mngr.getSearchConnection()
+        response, used = self.search.send(conn, q='id:[* TO *]')
+        self.assertEqual(used, master)
+        self.failUnless(output.get().startswith('POST /solr/select'))
+
+    def testConnectionsAreReleasedOnErrors(self):
+        released = []
+
+        def refuse(*args, **kw):
+            raise error(111, 'Connection refused')
+        conns = [self.mngr.getSearchConnection(exclude=[node])
+                 for node in self.balancer.nodes]
+        conns.append(self.mngr.getConnection())
+        for conn in conns:
+            conn.search = refuse
+            conn.release = lambda conn=conn: released.append(conn)
+        self.assertRaises(error, self.search, 'id:[* TO *]', rows=10)
+        self.assertEqual(set(released), set(conns))
+
+    def testPoolExhaustionIsNoNodeFailure(self):
+        first, second = self.balancer.nodes
+        self.balancer.succeeded(first, 1.0)
+        conn = self.mngr.getSearchConnection()
+
+        def exhausted(*args, **kw):
+            raise PoolExhausted('no connection available')
+
+        class Pool(object):
+            def checkout(self, timeout=None):
+                raise AssertionError('checked out again')
+        conn.search = exhausted
+        conn.pool = Pool()
+        self.assertRaises(PoolExhausted, self.search.send, conn, q='*:*')
+        self.assertEqual(second.errors, 0)
+        self.assertEqual(self.balancer.choose(), second)
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
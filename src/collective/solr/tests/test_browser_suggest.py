@@ -61,12 +61,18 @@ class MockConnection():
     def doGet(self, url, bar):
         return MockResponse()
 
+    def release(self):
+        pass
+
 
 class MockSolrConnectionManager():
 
     def getConnection(self):
         return MockConnection()
 
+    def getSearchConnection(self):
+        return MockConnection()
+
 
 class SuggestTermsViewIntegrationTest(unittest.TestCase):
 
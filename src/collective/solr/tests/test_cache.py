@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+from time import sleep
+from unittest import TestCase, defaultTestLoader
+
+from collective.solr.cache import LRUCache
+from collective.solr.cache import ResultCache
+from collective.solr.cache import SEARCHER_DELAY
+from collective.solr.cache import documentDigest
+from collective.solr.cache import visibilityDelay
+
+
+class LRUCacheTests(TestCase):
+
+    def testGetAndSet(self):
+        cache = LRUCache(maxsize=10)
+        self.assertEqual(cache.get('foo'), None)
+        self.assertEqual(cache.get('foo', 42), 42)
+        self.assertEqual(cache.set('foo', 'bar'), 'bar')
+        self.assertEqual(cache.get('foo'), 'bar')
+        self.failUnless('foo' in cache)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual((cache.hits, cache.misses), (1, 2))
+        cache.clear()
+        self.assertEqual(len(cache), 0)
+        self.assertEqual((cache.hits, cache.misses), (0, 0))
+
+    def testLeastRecentlyUsedEntriesAreDiscarded(self):
+        cache = LRUCache(maxsize=2)
+        cache.set('foo', 1)
+        cache.set('bar', 2)
+        cache.get('foo')            # foo is now more recent than bar...
+        cache.set('baz', 3)
+        self.assertEqual(len(cache), 2)
+        self.failUnless('foo' in cache)
+        self.failIf('bar' in cache)  # ...so bar got discarded
+        cache.set('foo', 4)
+        cache.set('qux', 5)
+        self.assertEqual(cache.get('foo'), 4)
+        self.failIf('baz' in cache)
+
+
+class DigestTests(TestCase):
+
+    def testDocumentDigest(self):
+        data = dict(id='500', name=u'f\xf6\xf6', cat=['a', 'b'])
+        digest = documentDigest(data)
+        self.assertEqual(documentDigest(dict(data)), digest)
+        self.assertEqual(documentDigest(data, boost={}), digest)
+        self.assertNotEqual(documentDigest(data, dict(name=2.0)), digest)
+        self.assertNotEqual(documentDigest(dict(data, cat=['b', 'a'])),
+                            digest)
+        self.assertNotEqual(documentDigest(dict(data, price=0)), digest)
+        # the order of dictionary (and set) items doesn't matter
+        items = dict(('f%d' % idx, set([idx, -idx])) for idx in range(99))
+        self.assertEqual(documentDigest(items), documentDigest(
+            dict(reversed(items.items()))))
+
+
+class ResultCacheTests(TestCase):
+
+    def testGetAndSet(self):
+        cache = ResultCache(maxbytes=10)
+        self.assertEqual(cache.get('foo'), None)
+        self.assertEqual(cache.set('foo', 'bar', cache.generation), 'bar')
+        self.assertEqual(cache.get('foo'), 'bar')
+        self.assertEqual((len(cache), cache.size), (1, 3))
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def testSizeLimit(self):
+        cache = ResultCache(maxbytes=10)
+        cache.set('foo', 'x' * 4, cache.generation)
+        cache.set('bar', 'x' * 4, cache.generation)
+        cache.get('foo')
+        cache.set('baz', 'x' * 4, cache.generation)
+        self.assertEqual(cache.size, 8)
+        self.failUnless('foo' in cache)
+        self.failIf('bar' in cache)
+        cache.set('qux', 'x' * 11, cache.generation)    # too large
+        self.failIf('qux' in cache)
+        self.assertEqual(cache.size, 8)
+
+    def testExpiry(self):
+        cache = ResultCache(maxbytes=10, ttl=0.01)
+        cache.set('foo', 'bar', cache.generation)
+        self.assertEqual(cache.get('foo'), 'bar')
+        sleep(0.02)
+        self.assertEqual(cache.get('foo'), None)
+        self.assertEqual((len(cache), cache.size), (0, 0))
+
+    def testInvalidation(self):
+        cache = ResultCache(maxbytes=10)
+        generation = cache.generation
+        cache.set('foo', 'bar', generation)
+        cache.invalidate()
+        self.assertEqual(cache.get('foo'), None)
+        # results fetched before a commit aren't stored afterwards
+        cache.set('foo', 'bar', generation)
+        self.failIf('foo' in cache)
+
+    def testPendingChanges(self):
+        cache = ResultCache(maxbytes=10)
+        cache.invalidate(delay=0.05)
+        # nothing is cached until the changes have become visible...
+        generation = cache.generation
+        cache.set('foo', 'bar', generation)
+        self.failIf('foo' in cache)
+        sleep(0.06)
+        # ...and results fetched while they were pending are outdated
+        self.assertEqual(cache.get('foo'), None)
+        cache.set('foo', 'bar', generation)
+        self.failIf('foo' in cache)
+        cache.set('foo', 'bar', cache.generation)
+        self.assertEqual(cache.get('foo'), 'bar')
+
+    def testVisibilityDelay(self):
+        class Config:
+            auto_commit = True
+            commit_within = 0
+        config = Config()
+        self.assertEqual(visibilityDelay(config), 0)
+        self.assertEqual(visibilityDelay(config, wait=False), SEARCHER_DELAY)
+        config.commit_within = 5000
+        self.assertEqual(visibilityDelay(config), 5 + SEARCHER_DELAY)
+        config.commit_within = 0
+        config.auto_commit = False
+        self.failUnless(visibilityDelay(config) > SEARCHER_DELAY)
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from threading import Event, Thread
+from time import sleep
+from unittest import TestCase, defaultTestLoader
+
+from collective.solr.coalesce import SingleFlight
+
+
+class SingleFlightTests(TestCase):
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.release = Event()
+        self.calls = []
+        self.results = []
+
+    def call(self, value='foo'):
+        self.calls.append(value)
+        self.release.wait()
+        if isinstance(value, Exception):
+            raise value
+        return value
+
+    def start(self, count, value='foo', timeout=None):
+        def run():
+            try:
+                result = self.flight('key', lambda: self.call(value), timeout)
+            except Exception, e:
+                result = e
+            self.results.append(result)
+        threads = [Thread(target=run) for i in range(count)]
+        for thread in threads:
+            thread.start()
+            sleep(0.01)         # make sure the first one is leading
+        return threads
+
+    def finish(self, threads):
+        self.release.set()
+        for thread in threads:
+            thread.join()
+
+    def testIdenticalCallsAreCoalesced(self):
+        threads = self.start(5)
+        self.assertEqual(len(self.calls), 1)
+        self.finish(threads)
+        self.assertEqual(self.results, ['foo'] * 5)
+        self.assertEqual((self.flight.calls, self.flight.shared), (1, 4))
+        self.assertEqual(self.flight.flights, {})
+        # once the call has finished, the next one is made again
+        self.assertEqual(self.flight('key', lambda: 'bar'), 'bar')
+
+    def testErrorsAreShared(self):
+        error = ValueError('oops')
+        threads = self.start(3, value=error)
+        self.finish(threads)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.results, [error] * 3)
+        self.assertEqual(self.flight.flights, {})
+
+    def testWaitingTimesOut(self):
+        threads = self.start(2, timeout=0.01)
+        sleep(0.05)             # the second thread gave up waiting...
+        self.assertEqual(len(self.calls), 2)
+        self.finish(threads)
+        self.assertEqual(self.results, ['foo'] * 2)
+        self.assertEqual(self.flight.shared, 0)
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, defaultTestLoader
+from zope.component import provideUtility
+
+from collective.solr.dispatcher import solrSearchResults
+from collective.solr.interfaces import ISearch
+from collective.solr.interfaces import ISolrConnectionConfig
+from collective.solr.manager import SolrConnectionConfig
+from collective.solr.parser import SolrResponse
+from collective.solr.parser import SolrResults
+
+
+class Manager(object):
+
+    def getSchema(self):
+        return None         # solr couldn't be reached
+
+
+class Search(object):
+
+    """ dummy search utility returning plain dictionaries as results """
+
+    def getManager(self):
+        return Manager()
+
+    def buildQueryAndParameters(self, **args):
+        return {'SearchableText': '+SearchableText:foo'}, {}
+
+    def __call__(self, query, **params):
+        results = SolrResults([dict(id='foo'), dict(id='bar')])
+        results.numFound = '2'
+        response = SolrResponse()
+        response.response = results
+        return response
+
+
+class DispatcherTests(TestCase):
+
+    def setUp(self):
+        provideUtility(SolrConnectionConfig(), ISolrConnectionConfig)
+        provideUtility(Search(), ISearch)
+
+    def testResultsWithoutSchema(self):
+        results = solrSearchResults(dict(SearchableText='foo'))
+        self.assertEqual(len(results), 2)
+        self.assertEqual([result['id'] for result in results],
+                         ['foo', 'bar'])
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
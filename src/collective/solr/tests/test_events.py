@@ -0,0 +1,141 @@
+from unittest import TestCase, defaultTestLoader
+from zope.component import provideUtility
+from Products.CMFCore.CMFCatalogAware import CMFCatalogAware
+
+from collective.solr.events import indexedPositions
+from collective.solr.events import reorderedEvent
+from collective.solr.interfaces import ISearch
+from collective.solr.interfaces import ISolrConnectionConfig
+from collective.solr.interfaces import ISolrConnectionManager
+from collective.solr.manager import SolrConnectionConfig
+from collective.solr.manager import SolrConnectionManager
+from collective.solr.parser import SolrField
+from collective.solr.search import Search
+from collective.solr.tests.utils import getData, fakehttp
+from collective.solr.tests.utils import searchResponse
+
+
+class Child(CMFCatalogAware):
+
+    """ dummy content object """
+
+    def __init__(self):
+        self.reindexed = []
+
+    def reindexObject(self, idxs=[]):
+        self.reindexed.append(idxs)
+
+
+class Membership(object):
+
+    def checkPermission(self, permission, context):
+        return True
+
+
+class Folder(object):
+
+    """ dummy folder """
+
+    portal_membership = Membership()
+
+    def __init__(self, *ids):
+        self.ids = ids
+        self.children = dict((id, Child()) for id in ids)
+
+    def getPhysicalPath(self):
+        return ('', 'plone', 'folder')
+
+    def objectIds(self):
+        return list(self.ids)
+
+    def _getOb(self, id):
+        return self.children[id]
+
+    def reindexed(self):
+        return sorted(id for id, child in self.children.items()
+                      if child.reindexed)
+
+
+class Event(object):
+
+    def __init__(self, object):
+        self.object = object
+
+
+class ReorderTests(TestCase):
+
+    def setUp(self):
+        self.config = SolrConnectionConfig()
+        provideUtility(self.config, ISolrConnectionConfig)
+        self.mngr = SolrConnectionManager()
+        self.mngr.setHost(active=True)
+        provideUtility(self.mngr, ISolrConnectionManager)
+        provideUtility(Search(), ISearch)
+        conn = self.mngr.getConnection()
+        fakehttp(conn, getData('plone_schema.xml'))     # fake schema response
+        schema = self.mngr.getSchema()
+        schema['getObjPositionInParent'] = SolrField(
+            name='getObjPositionInParent', stored=True,
+            class_='solr.IntField')
+        schema.prepare()
+
+    def tearDown(self):
+        self.mngr.closeConnection()
+        self.mngr.setHost(active=False)
+
+    def reorder(self, folder, *positions):
+        docs = [dict(id=id, getObjPositionInParent=position)
+                for id, position in positions]
+        output = fakehttp(self.mngr.getConnection(), searchResponse(*docs))
+        reorderedEvent(Event(folder))
+        return output
+
+    def testMovedChildrenAreReindexed(self):
+        folder = Folder('a', 'b', 'c')
+        output = self.reorder(folder, ('a', 0), ('c', 1), ('b', 2))
+        self.assertEqual(folder.reindexed(), ['b', 'c'])
+        self.assertEqual(folder.children['b'].reindexed,
+                         [['getObjPositionInParent']])
+        # the positions were looked up in a single search on the master
+        request = str(output)
+        self.failUnless(request.startswith('POST /solr/select'), request)
+        self.failUnless('path_parents' in request, request)
+
+    def testUnmovedChildrenAreSkipped(self):
+        folder = Folder('a', 'b', 'c')
+        self.reorder(folder, ('a', 0), ('b', 1), ('c', 2))
+        self.assertEqual(folder.reindexed(), [])
+
+    def testNeverIndexedChildrenAreReindexed(self):
+        folder = Folder('a', 'b', 'c')
+        self.reorder(folder, ('a', 0), ('c', 2))
+        self.assertEqual(folder.reindexed(), ['b'])
+
+    def testPositionsMightNotBeVisibleYet(self):
+        # with `commitWithin` other updates might not have shown up yet,
+        # so solr isn't asked and all children are reindexed
+        self.config.commit_within = 5000
+        folder = Folder('a', 'b', 'c')
+        output = self.reorder(folder, ('a', 0), ('b', 1), ('c', 2))
+        self.assertEqual(folder.reindexed(), ['a', 'b', 'c'])
+        self.assertEqual(len(output), 0)
+
+    def testAsyncCommits(self):
+        # solr doesn't wait for a new searcher with asynchronous commits
+        self.config.async = True
+        folder = Folder('a', 'b', 'c')
+        output = self.reorder(folder, ('a', 0), ('b', 1), ('c', 2))
+        self.assertEqual(folder.reindexed(), ['a', 'b', 'c'])
+        self.assertEqual(len(output), 0)
+
+    def testPositionsNotStored(self):
+        del self.mngr.getSchema()['getObjPositionInParent']
+        self.mngr.getSchema().prepare()
+        folder = Folder('a', 'b')
+        self.assertEqual(indexedPositions(folder, 2), None)
+        reorderedEvent(Event(folder))
+        self.assertEqual(folder.reindexed(), ['a', 'b'])
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
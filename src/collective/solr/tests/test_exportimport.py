@@ -19,16 +19,27 @@ class SetupToolTests(TestCase, TarballTester):
         config.host = 'foo'
         config.port = 23
         config.base = '/bar'
+        config.replicas = ('foo2:23/bar', )
         config.async = False
         config.auto_commit = True
         config.commit_within = 1000
         config.index_timeout = 7
         config.search_timeout = 3.1415
+        config.pool_size = 20
+        config.compression_threshold = 65536
+        config.update_batch_size = 250
+        config.atomic_updates = True
+        config.skip_unchanged = True
+        config.cache_size = 4096
+        config.cache_ttl = 300
+        config.coalesce_timeout = 2.5
         config.max_results = 42
         config.required = ('foo', 'bar')
         config.search_pattern = 'foo:{value}'
         config.facets = ('type', 'state')
         config.filter_queries = ('type', )
+        config.auto_filter_queries = True
+        config.terms_threshold = 100
         config.slow_query_threshold = 2342
         config.effective_steps = 900
         config.exclude_user = True
@@ -46,15 +57,26 @@ class SetupToolTests(TestCase, TarballTester):
         self.assertEqual(config.host, '127.0.0.1')
         self.assertEqual(config.port, 8983)
         self.assertEqual(config.base, '/solr')
+        self.assertEqual(config.replicas, ())
         self.assertEqual(config.async, False)
         self.assertEqual(config.auto_commit, True)
         self.assertEqual(config.commit_within, 1000)
         self.assertEqual(config.index_timeout, 0)
         self.assertEqual(config.search_timeout, 0)
+        self.assertEqual(config.pool_size, 0)
+        self.assertEqual(config.compression_threshold, 0)
+        self.assertEqual(config.update_batch_size, 100)
+        self.assertEqual(config.atomic_updates, False)
+        self.assertEqual(config.skip_unchanged, False)
+        self.assertEqual(config.cache_size, 0)
+        self.assertEqual(config.cache_ttl, 60)
+        self.assertEqual(config.coalesce_timeout, 0.0)
         self.assertEqual(config.max_results, 10000000)
         self.assertEqual(config.required, ('SearchableText', ))
         self.assertEqual(config.facets, ('portal_type', 'review_state'))
         self.assertEqual(config.filter_queries, ('portal_type', ))
+        self.assertEqual(config.auto_filter_queries, True)
+        self.assertEqual(config.terms_threshold, 0)
         self.assertEqual(config.slow_query_threshold, 0)
         self.assertEqual(config.effective_steps, 1)
         self.assertEqual(config.exclude_user, False)
@@ -99,6 +121,9 @@ SOLR_XML = """\
     <host value="foo" />
     <port value="23" />
     <base value="/bar" />
+    <replicas>
+      <parameter name="foo2:23/bar" />
+    </replicas>
   </connection>
   <settings>
     <async value="False" />
@@ -106,6 +131,14 @@ SOLR_XML = """\
     <commit-within value="1000" />
     <index-timeout value="7" />
     <search-timeout value="3.1415" />
+    <pool-size value="20" />
+    <compression-threshold value="65536" />
+    <update-batch-size value="250" />
+    <atomic-updates value="True" />
+    <skip-unchanged value="True" />
+    <cache-size value="4096" />
+    <cache-ttl value="300" />
+    <coalesce-timeout value="2.5" />
     <max-results value="42" />
     <required-query-parameters>
       <parameter name="foo" />
@@ -119,6 +152,8 @@ SOLR_XML = """\
     <filter-query-parameters>
       <parameter name="type" />
     </filter-query-parameters>
+    <auto-filter-queries value="True" />
+    <terms-threshold value="100" />
     <slow-query-threshold value="2342" />
     <effective-steps value="900" />
     <exclude-user value="True" />
@@ -13,3 +13,14 @@ class FlareTests(TestCase):
         self.assertEqual(score(score=0.04567), '4.6')
         self.assertEqual(score(score='0.04567'), '4.6')
         self.assertEqual(score(score='0.1'), '10.0')
+
+    def testDataIsShared(self):
+        flare = SolrFlare(id='foo', path_string='/plone/foo')
+        plone = PloneFlare(flare)
+        self.assertEqual(plone.id, 'foo')
+        self.assertEqual(plone.getPath(), '/plone/foo')
+        self.assertEqual(plone.context, flare)
+        flare['title'] = 'Foo'
+        self.assertEqual(plone['title'], 'Foo')
+        plone.fill(['title', 'review_state'], None)
+        self.assertEqual(flare['review_state'], None)
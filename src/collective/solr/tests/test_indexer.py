@@ -4,6 +4,7 @@ from re import search, findall, DOTALL
 from DateTime import DateTime
 from datetime import datetime
 from datetime import date
+from zope.component import getUtility
 from zope.component import provideUtility
 from zope.interface import implements
 from Products.CMFCore.CMFCatalogAware import CMFCatalogAware
@@ -12,9 +13,12 @@ from collective.solr.interfaces import ISolrConnectionConfig
 from collective.solr.interfaces import ICheckIndexable
 from collective.solr.manager import SolrConnectionConfig
 from collective.solr.manager import SolrConnectionManager
+from collective.solr.indexer import DIGEST_FIELD
 from collective.solr.indexer import SolrIndexProcessor
 from collective.solr.indexer import logger as logger_indexer
+from collective.solr.parser import SolrField
 from collective.solr.tests.utils import getData, fakehttp, fakemore
+from collective.solr.tests.utils import searchResponse
 from collective.solr.solr import SolrConnection
 from collective.solr.utils import prepareData
 
@@ -129,6 +133,154 @@ class QueueIndexerTests(TestCase):
             '"price" data not found'
         )
 
+    def testAtomicPartialIndexObject(self):
+        config = getUtility(ISolrConnectionConfig)
+        config.atomic_updates = True
+        schema = self.mngr.getSchema()
+        foo = Foo(id='500', name='foo', price=42.0, popularity=7)
+        # without `_version_` the schema doesn't allow atomic updates...
+        output = fakehttp(self.mngr.getConnection(),
+                          getData('add_response.txt'))
+        self.proc.index(foo, attributes=['price'])
+        self.assert_(str(output).find('<field name="name">foo</field>') > 0)
+        # but with it only the given attributes are sent...
+        schema['_version_'] = SolrField(name='_version_', stored=True)
+        schema.prepare()
+        output = fakehttp(self.mngr.getConnection(),
+                          getData('add_response.txt'))
+        self.proc.index(foo, attributes=['price', 'popularity', 'weight'])
+        output = str(output)
+        self.assertEqual(output.find('name="name"'), -1, '"name" found?')
+        self.assert_(output.find(
+            '<field name="price" update="set">42.0</field>') > 0)
+        self.assert_(output.find(
+            '<field name="popularity" update="set">7</field>') > 0)
+        self.assert_(output.find(
+            '<field name="weight" update="set" null="true"/>') > 0)
+        self.assert_(output.find('<field name="id">500</field>') > 0)
+        self.assert_(output.find('<field name="_version_">1</field>') > 0)
+        # unless text fields are involved
+        output = fakehttp(self.mngr.getConnection(),
+                          getData('add_response.txt'))
+        self.proc.index(foo, attributes=['price', 'name'])
+        output = str(output)
+        self.assertEqual(output.find('update="set"'), -1)
+        self.assert_(output.find('<field name="price">42.0</field>') > 0)
+
+    def storeDigests(self):
+        """ enable skipping unchanged documents with a schema that has a
+            stored field for their digests """
+        config = getUtility(ISolrConnectionConfig)
+        config.skip_unchanged = True
+        schema = self.mngr.getSchema()
+        schema[DIGEST_FIELD] = SolrField(name=DIGEST_FIELD, stored=True,
+                                         class_='solr.StrField')
+        schema.prepare()
+
+        def cleanup():
+            schema.pop(DIGEST_FIELD, None)
+            schema.prepare()
+        self.addCleanup(cleanup)
+        return schema
+
+    def requests(self, output):
+        """ return the bodies of the requests sent """
+        return [request.split('\n\n', 1)[1] for request in
+                (''.join(item).replace('\r', '') for item in output)]
+
+    def testSkipUnchangedDocuments(self):
+        schema = self.storeDigests()
+        add = getData('add_response.txt')
+        commit = getData('commit_response.txt')
+
+        def index(obj, *responses):
+            output = fakehttp(self.mngr.getConnection(), *responses)
+            self.proc.index(obj)
+            self.proc.commit()
+            return self.requests(output)
+        foo = Foo(id='500', name='foo', price=42.0)
+        requests = index(foo, searchResponse(), add, commit)
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(sorted(requests[0].split('&')),
+                         ['fl=id+_digest_', 'ids=500'])
+        digest = findall(r'<field name="_digest_">(\w+)</field>',
+                         requests[1])[0]
+        stored = searchResponse(dict(id='500', _digest_=digest))
+        # sending the same document again is skipped...
+        self.assertEqual(len(index(foo, stored, commit)), 2)
+        self.assertEqual(self.proc.skipped, 1)
+        # unlike sending a changed one
+        foo.price = 23.0
+        requests = index(foo, stored, add, commit)
+        self.assertEqual(len(requests), 3)
+        self.failIf(digest in requests[1])
+        # solr is asked every time, so documents are sent again when it
+        # doesn't know them (anymore), e.g. after a failed update or when
+        # the index was cleared by another client
+        foo.price = 42.0
+        self.assertEqual(len(index(foo, searchResponse(), add, commit)), 3)
+        self.assertEqual(self.proc.skipped, 1)
+        # without a stored field for the digests nothing is skipped
+        del schema[DIGEST_FIELD]
+        schema.prepare()
+        requests = index(foo, add, commit)
+        self.assertEqual(len(requests), 2)
+        self.failIf(DIGEST_FIELD in requests[0])
+
+    def testDigestsAreLookedUpAtOnce(self):
+        self.storeDigests()
+        output = fakehttp(self.mngr.getConnection(), searchResponse(
+            dict(id='500', _digest_='foo')), getData('add_response.txt'),
+            getData('add_response.txt'), getData('commit_response.txt'))
+        foo = Foo(id='500', name='foo', price=42.0)
+        bar = Foo(id='501', name='bar', price=23.0)
+        self.proc.index(foo)
+        self.proc.index(bar)
+        self.proc.index(foo)        # documents are only deferred once
+        self.proc.commit()
+        requests = self.requests(output)
+        self.assertEqual(len(requests), 4)
+        self.failUnless('ids=501%2C500' in requests[0], requests[0])
+        self.failUnless('<field name="id">501</field>' in requests[1])
+        self.failUnless('<field name="id">500</field>' in requests[2])
+
+    def testSkipUnchangedDocumentsWithinTransaction(self):
+        self.storeDigests()
+        output = fakehttp(self.mngr.getConnection(),
+                          getData('delete_response.txt'),
+                          getData('add_response.txt'),
+                          getData('commit_response.txt'))
+        foo = Foo(id='500', name='foo', price=42.0)
+        self.proc.index(foo)
+        # documents changed by other updates aren't looked up...
+        self.proc.unindex(foo)
+        self.proc.index(foo)
+        self.proc.commit()
+        requests = self.requests(output)
+        self.assertEqual(len(requests), 3)
+        self.failUnless(requests[0].startswith('<delete>'))
+        self.failUnless(requests[1].startswith('<add>'))
+        self.assertEqual(self.proc.skipped, 0)
+
+    def testFailingDigestLookups(self):
+        self.storeDigests()
+        foo = Foo(id='500', name='foo', price=42.0)
+        output = fakehttp(self.mngr.getConnection(),
+                          'HTTP/1.1 404 Not Found\nContent-Length: 0\n\n',
+                          getData('add_response.txt'),
+                          getData('commit_response.txt'))
+        self.proc.index(foo)
+        self.proc.commit()
+        self.assertEqual(len(output), 3)
+        self.assertEqual(self.proc.lookups, False)
+        # documents are sent right away for the rest of the run, but
+        # still store their digest
+        output = fakehttp(self.mngr.getConnection(),
+                          getData('add_response.txt'))
+        self.proc.index(foo)
+        self.failUnless('<field name="_digest_">' in str(output))
+        self.assertEqual(len(output), 1)
+
     def testDateIndexing(self):
         foo = Foo(id='zeidler', name='andi', cat='nerd',
                   timestamp=DateTime('May 11 1972 03:45 GMT'))
@@ -267,7 +419,7 @@ class FakeHTTPConnectionTests(TestCase):
     def setUp(self):
         provideUtility(SolrConnectionConfig(), ISolrConnectionConfig)
         self.foo = Foo(id='500', name='python test doc')
-        self.schema_request = 'GET /solr/admin/file/?file=schema.xml'
+        self.schema_request = 'GET /solr/schema?wt=json'
 
     def testSingleRequest(self):
         mngr = SolrConnectionManager(active=True)
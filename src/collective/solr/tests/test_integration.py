@@ -202,7 +202,11 @@ class SiteSearchTests(TestCase):
         config.active = True
         config.port = 55555        # random port so the real solr can still run
 
-        def notfound(handler):     # set up fake 404 response
+        def noapi(handler):        # set up fake 404 responses
+            self.assertEqual(handler.path, '/solr/schema?wt=json')
+            handler.send_response(404, getData('not_found.txt'))
+
+        def notfound(handler):
             self.assertEqual(handler.path,
                              '/solr/admin/file/?file=schema.xml')
             handler.send_response(404, getData('not_found.txt'))
@@ -211,12 +215,12 @@ class SiteSearchTests(TestCase):
             self.assertEqual(handler.path,
                              '/solr/admin/get-file.jsp?file=schema.xml')
             handler.send_response(200, getData('schema.xml'))
-        responses = [notfound, solr12]
+        responses = [noapi, notfound, solr12]
         thread = fakeServer(responses, config.port)
         schema = queryUtility(ISolrConnectionManager).getSchema()
         thread.join()               # the server thread must always be joined
         self.assertEqual(responses, [])
-        self.assertEqual(len(schema), 21)   # 21 items defined in schema.xml
+        self.assertEqual(len(schema), 22)   # 22 items defined in schema.xml
 
 
 class ZCMLSetupTests(TestCase):
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from StringIO import StringIO
+from datetime import datetime
+from unittest import TestCase, defaultTestLoader
+
+from collective.solr.javabin import JavabinDecoder
+from collective.solr.javabin import JavabinError
+from collective.solr.javabin import decode
+from collective.solr.javabin import formatDate
+from collective.solr.tests.utils import getData
+
+
+class JavabinDecoderTests(TestCase):
+
+    def testSimpleValues(self):
+        self.assertEqual(decode('\x02\x00'), None)
+        self.assertEqual(decode('\x02\x01'), True)
+        self.assertEqual(decode('\x02\x02'), False)
+        self.assertEqual(decode('\x02\x03\xff'), -1)                # byte
+        self.assertEqual(decode('\x02\x04\x01\x00'), 256)           # short
+        self.assertEqual(decode('\x02\x06\xff\xff\xff\xfe'), -2)    # int
+        self.assertEqual(decode('\x02\x07' + '\x7f' + '\xff' * 7),
+                         2 ** 63 - 1)                               # long
+        self.assertEqual(decode('\x02\x05?\xf8\x00\x00\x00\x00\x00\x00'),
+                         1.5)                                       # double
+        self.assertEqual(decode('\x02\x08=\xcc\xcc\xcd'), 0.1)      # float
+        self.assertEqual(decode('\x02\x09\x00\x00\x00\x00\x00\x00\x03\xe8'),
+                         datetime(1970, 1, 1, 0, 0, 1))             # date
+
+    def testCompactValues(self):
+        self.assertEqual(decode('\x02\x45'), 5)             # small int
+        self.assertEqual(decode('\x02\x52\x01'), 18)        # int + vint
+        self.assertEqual(decode('\x02\x7f\xff\x01'), 4095)
+        self.assertEqual(decode('\x02\x70\x80\x01'), 2048)  # long + vint
+        self.assertEqual(decode('\x02\x23foo'), u'foo')     # string
+        self.assertEqual(decode('\x02\x22\xc3\xa9'), u'\xe9')
+        long = 'x' * 40                             # size exceeding 5 bits
+        self.assertEqual(decode('\x02\x3f\x09' + long), long)
+        self.assertEqual(decode('\x02\x82\x41\x42'), [1, 2])    # array
+
+    def testContainers(self):
+        # named list using "extern" strings for repeated names
+        data = '\x02\xa2\xe0\x21a\x41\xe1\x42'
+        self.assertEqual(decode(data), {'a': 2})
+        self.assertEqual(decode(data, namedlist=list), [('a', 1), ('a', 2)])
+        self.assertEqual(decode('\x02\x0a\x01\x21a\x41'), {'a': 1})   # map
+        self.assertEqual(decode('\x02\x0e\x41\x42\x0f'), [1, 2])  # iterator
+        self.assertEqual(decode('\x02\x0d\x02ab'), 'ab')        # byte array
+
+    def testDocuments(self):
+        data = ('\x02\x0c'                      # document list
+                '\x83\x62\x60\x00'              # numFound, start, maxScore
+                '\x81\x0b\xa2'                  # one document, two fields
+                '\xe0\x22id\x21x'
+                '\xe0\x23cat\x82\x21a\x21b')
+        docs = decode(data)
+        self.assertEqual(docs, [{'id': 'x', 'cat': ['a', 'b']}])
+        info = decode(data, doclist=lambda info, docs: info)
+        self.assertEqual(info, [2, 0, None])
+
+    def testStream(self):
+        data = ('\x02\xa2'                      # named list with two items
+                '\xe0\x26header\x41'
+                '\xe0\x28response\x0c\x83\x62\x60\x00'
+                '\x82\x0b\xa1\xe0\x22id\x21x\x0b\xa1\xe3\x21y')
+        values = []
+        setter = lambda name, value: values.append((name, value))
+        decoder = JavabinDecoder(doclist=lambda info, docs: info)
+        docs = decoder.stream(data, setter)
+        self.assertEqual(docs.next(), {'id': 'x'})
+        self.assertEqual(values, [('header', 1), ('response', [2, 0, None])])
+        self.assertEqual(list(docs), [{'id': 'y'}])
+        self.assertRaises(JavabinError, list, decoder.stream('\x02\x41', 0))
+
+    def testStreamFromFile(self):
+        data = getData('complex_javabin_response.bin')
+        expected = decode(data)['response']
+        decoder = JavabinDecoder()
+        decoder.chunk, decoder.margin = 16, 8   # force lots of refills
+        buffered = []
+        docs = []
+        for doc in decoder.stream(StringIO(data), lambda name, value: 0):
+            buffered.append(len(decoder.data))
+            docs.append(doc)
+        self.assertEqual(docs, expected)
+        # only about one document is buffered at a time
+        data = ('\x02\xa1\xe0\x28response\x0c\x83\x58\x0c\x60\x00'
+                '\x9f\xa9\x01\x0b\xa1\xe0\x22id\x26doc000' +
+                ''.join('\x0b\xa1\xe2\x26doc%03d' % i for i in range(1, 200)))
+        docs = decoder.stream(StringIO(data), lambda name, value: 0)
+        self.assertEqual([doc['id'] for doc in docs],
+                         ['doc%03d' % i for i in range(200)])
+        self.failUnless(len(decoder.data) < 40)
+        # truncated data is still detected
+        stream = decoder.stream(StringIO(data[:-3]), lambda name, value: 0)
+        self.assertRaises(JavabinError, list, stream)
+
+    def testErrors(self):
+        self.assertRaises(JavabinError, decode, '')
+        self.assertRaises(JavabinError, decode, '\x01\x00')     # version
+        self.assertRaises(JavabinError, decode, '\x02\x30abc')  # truncated
+        self.assertRaises(JavabinError, decode, '\x02\x07\x00')
+        self.assertRaises(JavabinError, decode, '\x02\x1f')     # unknown tag
+
+    def testFormatDate(self):
+        self.assertEqual(formatDate(0), '1970-01-01T00:00:00.000Z')
+        self.assertEqual(formatDate(1204330391767),
+                         '2008-03-01T00:13:11.767Z')
+        self.assertEqual(formatDate(-62135596800000),
+                         '0001-01-01T00:00:00.000Z')
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+from os.path import getsize, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, defaultTestLoader
+
+from collective.solr.journal import Journal
+from collective.solr.solr import SolrConnection
+from collective.solr.tests.utils import getData, fakehttp
+
+error = 'HTTP/1.1 %d Oops\nContent-Length: 0\n\n'
+
+
+class JournalTests(TestCase):
+
+    def setUp(self):
+        self.tmp = mkdtemp()
+        self.path = join(self.tmp, 'journal')
+        self.journal = self.create()
+
+    def tearDown(self):
+        rmtree(self.tmp)
+
+    def create(self):
+        journal = Journal(self.path, 'localhost:8983', '/solr')
+        journal.start = lambda: None        # updates are sent explicitly
+        journal.configure(batchSize=10, commit=False)
+        return journal
+
+    def updates(self, *keys):
+        conn = SolrConnection(host='localhost:8983', persistent=True)
+        conn.uniqueKey = 'id'
+        for key in keys:
+            if key.startswith('-'):
+                conn.delete(key[1:])
+            else:
+                conn.add(id=key, name=u'f\xf6\xf6 %s' % key)
+        return conn.popUpdates()
+
+    def respond(self, *responses):
+        """ set up the connection used for sending updates """
+        conn = SolrConnection(host='localhost:8983', persistent=True,
+                              batchSize=self.journal.batchSize)
+        self.output = fakehttp(conn, *responses)
+        self.journal.connect = lambda: conn
+
+    def bodies(self):
+        return [''.join(request).replace('\r', '').split('\n\n', 1)[1]
+                for request in self.output]
+
+    def testUpdatesAreSentInBatches(self):
+        self.journal.append(self.updates('1', '2', '1', '-3'))
+        self.failUnless(self.journal.backlog() > 0)
+        self.respond(*[getData('add_response.txt')] * 2)
+        self.assertEqual(self.journal.drain(), True)
+        self.assertEqual(self.bodies(), [
+            '<add><doc><field name="id">2</field><field name="name">'
+            'f\xc3\xb6\xc3\xb6 2</field></doc><doc><field name="id">1</field>'
+            '<field name="name">f\xc3\xb6\xc3\xb6 1</field></doc></add>',
+            '<delete><id>3</id></delete>'])
+        self.assertEqual(self.journal.backlog(), 0)
+        self.assertEqual(self.journal.sent, 3)
+        # once everything has been sent, the journal starts over...
+        self.assertEqual(self.journal.drain(), False)
+        self.assertEqual(getsize(self.path), 0)
+        self.assertEqual(self.journal.offset, 0)
+
+    def testUpdatesAreRetried(self):
+        self.journal.append(self.updates('1'))
+        self.respond(error % 503)
+        self.assertRaises(Exception, self.journal.drain)
+        size = self.journal.backlog()
+        self.failUnless(size > 0)
+        # the backlog survives restarts and is sent once solr is back
+        self.journal = self.create()
+        self.assertEqual(self.journal.backlog(), size)
+        self.journal.append(self.updates('2'))
+        self.respond(getData('add_response.txt'))
+        self.assertEqual(self.journal.drain(), True)
+        self.assertEqual(len(self.output), 1)
+        self.failUnless('<doc><field name="id">1</field>' in self.bodies()[0])
+        self.failUnless('<doc><field name="id">2</field>' in self.bodies()[0])
+        self.assertEqual(self.journal.backlog(), 0)
+
+    def testRejectedUpdatesAreDropped(self):
+        self.journal.append(self.updates('1', '2'))
+        response = getData('add_response.txt')
+        self.respond(error % 400, error % 400, response)
+        self.assertEqual(self.journal.drain(), True)
+        self.assertEqual(len(self.output), 3)   # the batch and two retries
+        self.assertEqual((self.journal.sent, self.journal.dropped), (1, 1))
+        self.assertEqual(self.journal.backlog(), 0)
+
+    def testIncompleteEntriesAreDropped(self):
+        self.journal.append(self.updates('1'))
+        size = getsize(self.path)
+        with open(self.path, 'ab') as journal:
+            journal.write('["<add><doc>')       # crashed while appending
+        self.journal = self.create()
+        self.assertEqual(getsize(self.path), size)
+        self.assertEqual(self.journal.backlog(), size)
+
+    def testCommit(self):
+        self.journal.configure(commit=True)
+        self.journal.append(self.updates('-1'))
+        self.respond(*[getData('add_response.txt')] * 2)
+        self.journal.drain()
+        self.assertEqual(self.bodies(), ['<delete><id>1</id></delete>',
+                                         '<commit waitSearcher="false"/>'])
+
+    def testSharedJournal(self):
+        # journals of several processes sharing a file send each update
+        # just once, no matter which one gets to send it
+        other = self.create()
+        self.journal.append(self.updates('1'))
+        other.append(self.updates('2'))
+        self.assertEqual(self.journal.backlog(), other.backlog())
+        self.respond(getData('add_response.txt'))
+        self.assertEqual(self.journal.drain(), True)
+        self.assertEqual(len(self.output), 1)
+        self.failUnless('<field name="id">2</field>' in self.bodies()[0])
+        self.assertEqual(other.backlog(), 0)
+        self.journal = other
+        self.respond()
+        self.assertEqual(other.drain(), False)
+        self.assertEqual(len(self.output), 0)
+        # the file is started over, and new updates are picked up
+        self.assertEqual(getsize(self.path), 0)
+        other.append(self.updates('3'))
+        self.respond(getData('add_response.txt'))
+        self.assertEqual(other.drain(), True)
+        self.assertEqual(len(self.output), 1)
+        self.failUnless('<field name="id">3</field>' in self.bodies()[0])
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
@@ -7,6 +7,7 @@ from collective.solr.mangler import cleanupQueryParameters
 from collective.solr.mangler import mangleQuery
 from collective.solr.mangler import optimizeQueryParameters
 from collective.solr.mangler import subtractQueryParameters
+from collective.solr.mangler import termsQuery
 from collective.solr.parser import SolrField
 from collective.solr.parser import SolrSchema
 from unittest import TestCase
@@ -271,6 +272,17 @@ class QueryParameterTests(TestCase):
         params = extract({'sort_order': 'reverse', 'sort_limit': 5})
         self.assertEqual(params, dict(rows=5))
 
+    def testSortLimitWithBatch(self):
+        extract = subtractQueryParameters
+        params = extract({'sort_limit': 20, 'b_start': 5, 'b_size': 10})
+        self.assertEqual(params, dict(start=5, rows=10))
+        params = extract({'sort_limit': 20, 'b_start': 15, 'b_size': 10})
+        self.assertEqual(params, dict(start=15, rows=5))
+        params = extract({'sort_limit': '20', 'b_start': '30'})
+        self.assertEqual(params, dict(start=30, rows=0))
+        params = extract({'sort_limit': 5, 'b_size': 10})
+        self.assertEqual(params, dict(rows=5))
+
     def testAllowFacetParameters(self):
         extract = subtractQueryParameters
         # 'facet' and 'facet.*' should be passed on...
@@ -401,6 +413,72 @@ class QueryParameterTests(TestCase):
             (dict(a='a:23', c='c:(23 42)'), dict(fq=['b:42']))
         )
 
+    def testAutomaticFilterQueries(self):
+        schema = SolrSchema()
+        schema['a'] = SolrField(indexed=True, class_='solr.StrField')
+        schema['b'] = SolrField(indexed=True, class_='solr.TextField')
+        schema['c'] = SolrField(indexed=True, class_='solr.TrieDateField')
+        schema['d'] = SolrField(indexed=False, class_='solr.StrField')
+
+        def optimize(**params):
+            query = {'a': '+a:23', 'b': '+b:foo', 'c': '+c:[* TO NOW]',
+                     'd': '+d:42', None: '+bar'}
+            optimizeQueryParameters(query, params, schema)
+            return query, params
+        config = SolrConnectionConfig()
+        provideUtility(config, ISolrConnectionConfig)
+        self.addCleanup(getGlobalSiteManager().unregisterUtility,
+                        config, ISolrConnectionConfig)
+        self.assertEqual(optimize(), ({'a': '+a:23', 'b': '+b:foo',
+                                       'c': '+c:[* TO NOW]', 'd': '+d:42',
+                                       None: '+bar'}, {}))
+        # only clauses for indexed, non-text fields become filter queries
+        config.auto_filter_queries = True
+        self.assertEqual(optimize(fq='x:13'), (
+            {'b': '+b:foo', 'd': '+d:42', None: '+bar'},
+            dict(fq=['x:13', '+a:23', '+c:[* TO NOW]'])))
+        # configured filter queries are still combined as before
+        config.filter_queries = ['c a']
+        self.assertEqual(optimize(), (
+            {'b': '+b:foo', 'd': '+d:42', None: '+bar'},
+            dict(fq=['+a:23 +c:[* TO NOW]'])))
+        config.filter_queries = ['b']
+        self.assertEqual(optimize(), (
+            {'d': '+d:42', None: '+bar'},
+            dict(fq=['+b:foo', '+a:23', '+c:[* TO NOW]'])))
+
+    def testTermsQueryParser(self):
+        schema = SolrSchema()
+        schema['a'] = SolrField(indexed=True, class_='solr.StrField')
+        schema['b'] = SolrField(indexed=True, class_='solr.StrField')
+        terms = {'a': ['x', 'y', 'z'], 'b': ['1', '2', '3']}
+
+        def optimize():
+            query = {'a': '+a:(x OR y OR z)', 'b': '+b:(1 OR 2 OR 3)'}
+            params = {}
+            optimizeQueryParameters(query, params, schema, terms)
+            return params['fq']
+        config = SolrConnectionConfig()
+        config.auto_filter_queries = True
+        provideUtility(config, ISolrConnectionConfig)
+        self.addCleanup(getGlobalSiteManager().unregisterUtility,
+                        config, ISolrConnectionConfig)
+        self.assertEqual(optimize(),
+                         ['{!terms f=a}x,y,z', '{!terms f=b}1,2,3'])
+        # clauses combined with others can't use the parser
+        config.filter_queries = ['a b']
+        self.assertEqual(optimize(), ['+a:(x OR y OR z) +b:(1 OR 2 OR 3)'])
+        config.filter_queries = ['b']
+        self.assertEqual(optimize(),
+                         ['{!terms f=b}1,2,3', '{!terms f=a}x,y,z'])
+        # values that can't be separated by commas fall back to the
+        # regular syntax
+        self.assertEqual(termsQuery('a', [u'f\xf6\xf6', 'bar']),
+                         '{!terms f=a}f\xc3\xb6\xc3\xb6,bar')
+        self.assertEqual(termsQuery('a', ['foo', 'bar,baz']), None)
+        self.assertEqual(termsQuery('a', ['foo', '']), None)
+        self.assertEqual(termsQuery('a', ['foo', 42]), None)
+
     def testFilterFacetDependencies(self):
         extract = subtractQueryParameters
         # any info about facet dependencies must not be passed on to solr
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, defaultTestLoader
+
+from collective.solr.paging import PagedResults
+from collective.solr.parser import SolrResponse
+from collective.solr.parser import SolrResults
+from collective.solr.parser import Unparsed
+from collective.solr.tests.utils import getData
+
+
+class PagedResultsTests(TestCase):
+
+    def setUp(self):
+        self.fetched = []
+
+    def fetch(self, start, rows):
+        self.fetched.append((start, rows))
+        return ['row%d' % pos for pos in range(start, start + rows)]
+
+    def results(self, start=0, rows=10, found=1000, **kw):
+        results = SolrResults(self.fetch(start, rows))
+        results.numFound = str(found)
+        self.fetched = []
+        return PagedResults(self.fetch, results, start, **kw)
+
+    def testLength(self):
+        results = self.results()
+        self.assertEqual(len(results), 1000)
+        self.assertEqual(results.numFound, '1000')
+        self.failUnless(results)
+        self.failIf(self.results(rows=0, found=0))
+        self.assertEqual(repr(self.results(rows=0, found=0)),
+                         '<PagedResults numFound=0, loaded=0, limit=0>')
+
+    def testLoadedRows(self):
+        results = self.results(start=20)
+        self.assertEqual(results[20], 'row20')
+        self.assertEqual(results[25:30], ['row25', 'row26', 'row27',
+                                          'row28', 'row29'])
+        self.assertEqual(self.fetched, [])
+
+    def testRowsAreFetchedByPage(self):
+        results = self.results(page_size=10)
+        self.assertEqual(results[15], 'row15')
+        self.assertEqual(self.fetched, [(10, 10)])
+        self.assertEqual(results[19], 'row19')
+        self.assertEqual(results[-1], 'row999')
+        self.assertEqual(self.fetched, [(10, 10), (990, 10)])
+        self.assertRaises(IndexError, lambda: results[1000])
+        self.assertRaises(IndexError, lambda: results[-1001])
+
+    def testSlicesOnlyFetchMissingRows(self):
+        results = self.results()
+        self.assertEqual(results[5:15], ['row%d' % i for i in range(5, 15)])
+        self.assertEqual(self.fetched, [(10, 5)])
+        self.assertEqual(results[-3:], ['row997', 'row998', 'row999'])
+        self.assertEqual(results[14:10], [])
+        self.assertEqual(self.fetched, [(10, 5), (997, 3)])
+
+    def testLimit(self):
+        results = self.results(rows=5, limit=5)
+        self.assertEqual(len(results), 1000)
+        self.assertEqual(results[4], 'row4')
+        self.assertEqual(results[5], None)
+        self.assertEqual(results[3:7], ['row3', 'row4', None, None])
+        self.assertEqual(self.fetched, [])
+        self.assertEqual(list(results)[4:6], ['row4', None])
+
+    def testIteration(self):
+        results = self.results(found=25, page_size=10)
+        self.assertEqual(list(results), ['row%d' % i for i in range(25)])
+        self.assertEqual(self.fetched, [(10, 15)])
+        # the pages grow while iterating, saving round-trips
+        results = self.results(found=100, page_size=10)
+        self.assertEqual(len(list(results)), 100)
+        self.assertEqual(self.fetched, [(10, 20), (30, 40), (70, 30)])
+
+    def testSequentialAccess(self):
+        # pages also grow when rows are accessed one after the other
+        results = self.results(found=100, page_size=10)
+        self.assertEqual([results[i] for i in range(100)],
+                         ['row%d' % i for i in range(100)])
+        self.assertEqual(self.fetched, [(10, 20), (30, 40), (70, 30)])
+        # but not for random access
+        results = self.results(found=100, page_size=10)
+        self.assertEqual(results[50], 'row50')
+        self.assertEqual(results[20], 'row20')
+        self.assertEqual(self.fetched, [(50, 10), (20, 10)])
+
+    def testIteratingResponse(self):
+        # catalog callers iterate the response itself
+        response = SolrResponse()
+        response.response = self.results(rows=100, found=5000)
+        self.assertEqual(len(list(response)), 5000)
+        self.assertEqual(self.fetched, [(100, 200), (300, 400), (700, 800),
+                                        (1500, 1600), (3100, 1900)])
+
+    def testLazyWrapping(self):
+        wrapped = []
+
+        def wrap(row):
+            wrapped.append(row)
+            return row.upper()
+        results = self.results(wrap=wrap)
+        self.assertEqual(wrapped, [])
+        self.assertEqual(results[1], 'ROW1')
+        self.assertEqual(results[1:4], ['ROW1', 'ROW2', 'ROW3'])
+        self.assertEqual(wrapped, ['row1', 'row2', 'row3'])
+        self.assertEqual(results[50], 'ROW50')
+        self.assertEqual(wrapped, ['row1', 'row2', 'row3', 'row50'])
+
+    def testLazyParsing(self):
+        response = SolrResponse(getData('quirky_response.txt'), lazy=True)
+        results = PagedResults(self.fetch, response.response)
+        self.assertEqual(len(results), 1204)
+        self.failUnless(isinstance(list.__getitem__(response.response, 5),
+                                   Unparsed))
+        self.assertEqual(results[5].UID, '3adc833655f7555ef613f74f67784607')
+        self.failIf(isinstance(list.__getitem__(response.response, 5),
+                               Unparsed))
+        self.failUnless(isinstance(list.__getitem__(response.response, 6),
+                                   Unparsed))
+
+    def testChangedIndex(self):
+        results = self.results(found=30)
+        self.fetch = lambda start, rows: ['new']
+        results.fetch = self.fetch
+        self.assertEqual(results[10:13], ['new', None, None])
+        self.assertEqual(results[12], None)     # not fetched again
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
@@ -1,9 +1,20 @@
+from cPickle import dumps, loads
+from datetime import datetime
 from unittest import TestCase
 from DateTime import DateTime
 
+from collective.solr.parser import Fields
+from collective.solr.parser import LazySolrResults
+from collective.solr.parser import SolrFlare
 from collective.solr.parser import SolrResponse
+from collective.solr.parser import SolrResults
+from collective.solr.parser import SolrField
 from collective.solr.parser import SolrSchema
+from collective.solr.parser import Unparsed
+from collective.solr.parser import dateCache
 from collective.solr.parser import parseDate
+from collective.solr.parser import parse_date_as_datetime
+from collective.solr.parser import unmarshallers
 from collective.solr.tests.utils import getData
 
 
@@ -125,11 +136,14 @@ class ParserTests(TestCase):
     def testParseConfig(self):
         schema_xml = getData('schema.xml')
         schema = SolrSchema(schema_xml.split('\n\n', 1)[1])
-        self.assertEqual(len(schema), 21)  # 21 items defined in schema.xml
+        self.assertEqual(len(schema), 22)  # 22 items defined in schema.xml
         self.assertEqual(schema['defaultSearchField'], 'text')
         self.assertEqual(schema['uniqueKey'], 'id')
         self.assertEqual(schema['solrQueryParser'].defaultOperator, 'OR')
         self.assertEqual(schema['requiredFields'], ['id', 'name'])
+        self.assertEqual(schema['copyFields'], ['sku', 'incubationdate_s',
+                         'text', 'text', 'nameSort', 'alphaNameSort', 'text',
+                         'text', 'text', 'manu_exact'])
         self.assertEqual(schema['id'].type, 'string')
         self.assertEqual(schema['id'].class_, 'solr.StrField')
         self.assertEqual(schema['id'].required, True)
@@ -155,6 +169,63 @@ class ParserTests(TestCase):
         self.assertEqual(len([f for f in fields if
                               getattr(f, 'multiValued', False)]), 3)
 
+    def testSchemaLookups(self):
+        schema_xml = getData('plone_schema.xml')
+        schema = SolrSchema(schema_xml.split('\n\n', 1)[1])
+        self.assertEqual(len(schema.names), 10)
+        self.assertEqual(schema.stored, frozenset([
+            'Subject', 'Title', 'UID', 'id', 'path_string', 'review_state']))
+        self.failUnless('path_parents' in schema.indexed)
+        self.failIf('path_string' in schema.indexed)
+        self.assertEqual(schema.required, frozenset(['UID', 'id']))
+        self.assertEqual(schema.classes['solr.IntField'],
+                         frozenset(['path_depth']))
+        self.assertEqual(schema.epiIndexes, frozenset(['path']))
+        self.assertEqual(schema.copied, frozenset(['default']))
+        self.assertEqual(schema.atomic, False)
+        # fields added later on need to be prepared explicitly
+        schema['foo'] = SolrField(name='foo', stored=True, class_='Foo')
+        self.failIf('foo' in schema.stored)
+        schema.prepare()
+        self.failUnless('foo' in schema.stored)
+        self.assertEqual(schema.classes['Foo'], frozenset(['foo']))
+        empty = SolrSchema()
+        self.assertEqual(empty.stored, frozenset())
+        self.assertEqual(empty.epiIndexes, frozenset())
+
+    def testAtomicUpdatesSupport(self):
+        schema_xml = getData('schema.xml')
+        schema = SolrSchema(schema_xml.split('\n\n', 1)[1])
+        # all fields not stored are copies, but there's no `_version_`
+        self.assertEqual(schema.names - schema.stored,
+                         frozenset(['nameSort', 'alphaNameSort', 'text',
+                                    'manu_exact']))
+        self.assertEqual(schema.atomic, False)
+        schema['_version_'] = SolrField(name='_version_', stored=True)
+        schema.prepare()
+        self.assertEqual(schema.atomic, True)
+        schema['foo'] = SolrField(name='foo', stored=False)
+        schema.prepare()
+        self.assertEqual(schema.atomic, False)
+
+    def testParseJSONSchema(self):
+        xml = SolrSchema(getData('plone_schema.xml').split('\n\n', 1)[1])
+        json = SolrSchema(getData('plone_schema_json.txt').split('\n\n', 1)[1])
+        self.assertEqual(sorted(json.keys()), sorted(xml.keys()))
+        for name in xml.names:
+            self.assertEqual(json[name], xml[name])
+        self.assertEqual(json.uniqueKey, 'UID')
+        self.assertEqual(json.requiredFields, ['id', 'UID'])
+        self.assertEqual(json.stored, xml.stored)
+        self.assertEqual(json.indexed, xml.indexed)
+        self.assertEqual(json.classes, xml.classes)
+        self.assertEqual(json.epiIndexes, frozenset(['path']))
+        self.assertEqual(json.copied, xml.copied)
+        self.assertEqual(json.default.positionIncrementGap, '100')
+        self.failIf('analyzer' in json.default)
+        self.assertNotEqual(json.digest, xml.digest)
+        self.assertEqual(SolrSchema(json.source).digest, json.digest)
+
     def testParseQuirkyResponse(self):
         quirky_response = getData('quirky_response.txt')
         response = SolrResponse(quirky_response)
@@ -163,6 +234,273 @@ class ParserTests(TestCase):
         self.assertEqual(empty_uid, [])
 
 
+class LazyParserTests(TestCase):
+
+    def testDocumentsAreConvertedOnAccess(self):
+        complex_xml_response = getData('complex_xml_response.txt')
+        response = SolrResponse(complex_xml_response, lazy=True)
+        results = response.response
+        self.failUnless(isinstance(results, LazySolrResults))
+        self.assertEqual(results.numFound, '2')
+        self.assertEqual(response.actual_result_count, 2)
+        self.assertEqual(response.responseHeader['params']['rows'], '10')
+        self.assertEqual(len(results), 2)
+        raw = list.__getitem__
+        self.failUnless(isinstance(raw(results, 0), Unparsed))
+        first = results[0]
+        self.failUnless(isinstance(first, SolrFlare))
+        self.failUnless(raw(results, 0) is first)   # converted only once
+        self.failUnless(isinstance(raw(results, 1), Unparsed))
+        self.assertEqual(first.cat, ['software', 'search'])
+        self.assertEqual(first.incubationdate_dt.ISO8601(),
+                         DateTime('2006/01/17 GMT').ISO8601())
+        self.assertEqual(results[-1].id, '3007WFP')
+
+    def testSameResultsAsEagerParsing(self):
+        complex_xml_response = getData('complex_xml_response.txt')
+        eager = SolrResponse(complex_xml_response).results()
+        lazy = SolrResponse(complex_xml_response, lazy=True).results()
+        self.assertEqual(list(lazy), eager)
+        lazy = SolrResponse(complex_xml_response, lazy=True).results()
+        self.assertEqual(lazy[:1], eager[:1])
+        self.assertEqual(lazy[1:], eager[1:])
+        self.assertEqual(list(reversed(lazy)), list(reversed(eager)))
+        self.assertEqual(lazy + [None], eager + [None])
+
+    def testPaddingAndPickling(self):
+        complex_xml_response = getData('complex_xml_response.txt')
+        results = SolrResponse(complex_xml_response, lazy=True).results()
+        results[0:0] = [None] * 3
+        results.extend([None])
+        self.assertEqual([r and r.id for r in results],
+                         [None, None, None, 'SOLR1000', '3007WFP', None])
+        results = SolrResponse(complex_xml_response, lazy=True).results()
+        copy = loads(dumps(results))
+        self.assertEqual(type(copy), SolrResults)
+        self.assertEqual(copy.numFound, '2')
+        self.assertEqual(copy, list(results))
+
+
+class StreamingParserTests(TestCase):
+
+    def testStream(self):
+        complex_xml_response = getData('complex_xml_response.txt')
+        response = SolrResponse()
+        flares = response.stream(complex_xml_response)
+        first = flares.next()
+        self.failUnless(isinstance(first, SolrFlare))
+        self.assertEqual(first.id, 'SOLR1000')
+        self.assertEqual(first.incubationdate_dt.ISO8601(),
+                         DateTime('2006/01/17 GMT').ISO8601())
+        self.assertEqual(response.responseHeader['params']['rows'], '10')
+        self.assertEqual([flare.id for flare in flares], ['3007WFP'])
+        results = response.results()    # documents weren't collected...
+        self.assertEqual(len(results), 0)
+        self.assertEqual(results.numFound, '2')
+        self.assertEqual(response.actual_result_count, 2)
+
+    def testStreamFacets(self):
+        facet_xml_response = getData('facet_xml_response.txt')
+        response = SolrResponse()
+        self.assertEqual(list(response.stream(facet_xml_response)), [])
+        counts = response.facet_counts
+        self.assertEqual(counts['facet_fields']['cat']['software'], 1)
+
+    def testStreamJavabin(self):
+        data = getData('complex_javabin_response.bin')
+        response = SolrResponse()
+        flares = list(response.streamJavabin(data))
+        self.assertEqual([flare.id for flare in flares],
+                         ['SOLR1000', '3007WFP'])
+        self.assertEqual(flares[0].incubationdate_dt.ISO8601(),
+                         DateTime('2006/01/17 GMT').ISO8601())
+        self.assertEqual(len(response.results()), 0)
+        self.assertEqual(response.results().numFound, '2')
+        counts = response.facet_counts
+        self.assertEqual(counts['facet_fields']['cat']['software'], 1)
+
+
+class JSONParserTests(TestCase):
+
+    def setUp(self):
+        schema = getData('schema.xml')
+        self.schema = SolrSchema(schema.split('\n\n', 1)[1])
+
+    def testParseComplexSearchResults(self):
+        complex_json_response = getData('complex_json_response.txt')
+        response = SolrResponse().parseJSON(complex_json_response,
+                                            self.schema)
+        results = response.response     # the result set is named 'response'
+        self.failUnless(isinstance(results, SolrResults))
+        self.assertEqual(results.numFound, '2')
+        self.assertEqual(response.actual_result_count, 2)
+        self.assertEqual(results.start, '0')
+        self.assertEqual(len(results), 2)
+        first = results[0]
+        self.failUnless(isinstance(first, SolrFlare))
+        self.assertEqual(first.cat, ['software', 'search'])
+        self.assertEqual(len(first.features), 7)
+        self.assertEqual(first.id, 'SOLR1000')
+        self.assertEqual(first.inStock, True)
+        self.assertEqual(first.incubationdate_dt.ISO8601(),
+                         DateTime('2006/01/17 GMT').ISO8601())
+        self.assertEqual(first.popularity, 10)
+        self.assertEqual(first.price, 0.0)
+        self.assertEqual(first.timestamp.ISO8601(),
+                         DateTime('2008-03-01 00:13:11.767 GMT').ISO8601())
+        # `sku` is a text field, so its value is kept as is
+        self.assertEqual(results[1].sku, '2008-03-01T00:13:11.814Z')
+        headers = response.responseHeader
+        self.assertEqual(headers['status'], 0)
+        self.assertEqual(headers['params']['rows'], '10')
+        self.assertEqual(headers['params']['q'], 'id:[* TO *]')
+
+    def testParseWithoutSchema(self):
+        complex_json_response = getData('complex_json_response.txt')
+        response = SolrResponse().parseJSON(complex_json_response)
+        self.assertEqual(response.results()[1].sku.ISO8601(),
+                         DateTime('2008-03-01 00:13:11.814 GMT').ISO8601())
+
+    def testParseDateFacetSearchResults(self):
+        facet_json_response = getData('date_facet_json_response.txt')
+        response = SolrResponse().parseJSON(facet_json_response, self.schema)
+        results = response.response
+        self.assertEqual(results.numFound, '42')
+        self.assertEqual(len(results), 0)
+        self.assertEqual(response.responseHeader['params']['q'], '*:*')
+        counts = response.facet_counts
+        self.assertEqual(counts['facet_queries'], {})
+        self.assertEqual(counts['facet_fields'], {})
+        timestamps = counts['facet_dates']['timestamp']
+        self.assertEqual(timestamps['2007-08-11T00:00:00.000Z'], 1)
+        self.assertEqual(timestamps['2007-08-16T00:00:00.000Z'], 16)
+        self.assertEqual(timestamps['gap'], '+1DAY')
+        self.assertEqual(timestamps['end'].ISO8601(),
+                         DateTime('2007-08-17 GMT').ISO8601())
+
+    def testSameResultsAsXML(self):
+        xml = SolrResponse(getData('complex_xml_response.txt'))
+        json = SolrResponse().parseJSON(
+            getData('complex_json_response.txt'), self.schema)
+        first, second = xml.results()[0], json.results()[0]
+        self.assertEqual(sorted(first.keys()), sorted(second.keys()))
+        for key in first:
+            self.assertEqual(first[key], second[key])
+
+
+class JavabinParserTests(TestCase):
+
+    def testParseComplexSearchResults(self):
+        data = getData('complex_javabin_response.bin')
+        response = SolrResponse().parseJavabin(data)
+        results = response.response     # the result set is named 'response'
+        self.failUnless(isinstance(results, SolrResults))
+        self.assertEqual(results.numFound, '2')
+        self.assertEqual(results.start, '0')
+        self.assertEqual(response.actual_result_count, 2)
+        self.failIf(hasattr(results, 'maxScore'))
+        self.assertEqual(len(results), 2)
+        first = results[0]
+        self.failUnless(isinstance(first, SolrFlare))
+        self.assertEqual(first.cat, ['software', 'search'])
+        self.assertEqual(len(first.features), 7)
+        self.assertEqual(first.id, 'SOLR1000')
+        self.assertEqual(first.inStock, True)
+        self.assertEqual(first.incubationdate_dt.ISO8601(),
+                         DateTime('2006/01/17 GMT').ISO8601())
+        self.assertEqual(first.popularity, 10)
+        self.assertEqual(first.price, 0.0)
+        self.assertEqual(results[1].weight, 401.6)
+        headers = response.responseHeader
+        self.assertEqual(headers['status'], 0)
+        self.assertEqual(headers['params']['rows'], '10')
+        self.assertEqual(headers['params']['q'], 'id:[* TO *]')
+        counts = response.facet_counts
+        self.assertEqual(counts['facet_queries'], {})
+        self.assertEqual(counts['facet_fields']['cat']['software'], 1)
+        timestamps = counts['facet_dates']['timestamp']
+        self.assertEqual(timestamps['2008-03-01T00:00:00.000Z'], 2)
+        self.assertEqual(timestamps['gap'], '+1DAY')
+        self.assertEqual(timestamps['end'].ISO8601(),
+                         DateTime('2008-03-02 GMT').ISO8601())
+
+    def testSameResultsAsXML(self):
+        xml = SolrResponse(getData('complex_xml_response.txt'))
+        javabin = SolrResponse().parseJavabin(
+            getData('complex_javabin_response.bin'))
+        for first, second in zip(xml.results(), javabin.results()):
+            self.assertEqual(sorted(first.keys()), sorted(second.keys()))
+            for key in first:
+                self.assertEqual(first[key], second[key])
+
+    def testCustomUnmarshallers(self):
+        simple = unmarshallers.copy()
+        simple['date'] = parse_date_as_datetime
+        response = SolrResponse(None, simple).parseJavabin(
+            getData('complex_javabin_response.bin'))
+        self.assertEqual(response.results()[0].timestamp,
+                         datetime(2008, 3, 1, 0, 13, 11, 767000))
+
+
+class FlareTests(TestCase):
+
+    def testMappingAndAttributeAccess(self):
+        flare = SolrFlare(id='foo', cat=['a', 'b'])
+        self.assertEqual(flare['id'], 'foo')
+        self.assertEqual(flare.cat, ['a', 'b'])
+        self.assertEqual(flare.get('name'), None)
+        self.assertRaises(KeyError, lambda: flare['name'])
+        self.assertRaises(AttributeError, getattr, flare, 'name')
+        self.failUnless('id' in flare)
+        self.failIf('name' in flare)
+        flare['name'] = 'Foo'
+        self.assertEqual(sorted(flare), ['cat', 'id', 'name'])
+        self.assertEqual(len(flare), 3)
+        del flare['cat']
+        self.assertEqual(flare, dict(id='foo', name='Foo'))
+        self.assertEqual(flare.pop('name'), 'Foo')
+        self.assertEqual(flare.pop('name', None), None)
+        self.assertEqual(flare.items(), [('id', 'foo')])
+        self.failIf(hasattr(flare, '__dict__'))
+
+    def testSharedFields(self):
+        fields = Fields()
+        first = SolrFlare.create(fields, [('id', '1'), ('name', 'foo')])
+        second = SolrFlare.create(fields, [('id', '2')])
+        self.assertEqual(fields.names, ['id', 'name'])
+        self.assertEqual(second._values, ['2'])
+        self.assertEqual(second, dict(id='2'))
+        self.failIf('name' in second)
+        second['score'] = 1.0
+        self.assertEqual(fields.names, ['id', 'name', 'score'])
+        self.assertEqual(len(second._values), 3)
+        self.assertEqual(second, dict(id='2', score=1.0))
+        self.assertEqual(first, dict(id='1', name='foo'))
+
+    def testFillDefaults(self):
+        fields = Fields()
+        first = SolrFlare.create(fields, [('id', '1'), ('name', 'foo')])
+        second = SolrFlare.create(fields, [('id', '2')])
+        stored = ['id', 'name', 'title']
+        first.fill(stored, None)
+        second.fill(stored, None)
+        self.assertEqual(first, dict(id='1', name='foo', title=None))
+        self.assertEqual(second, dict(id='2', name=None, title=None))
+        self.assertEqual(second.name, None)
+        del second['title']
+        self.failIf('title' in second)
+        self.failUnless('title' in first)
+
+    def testPickling(self):
+        fields = Fields()
+        flare = SolrFlare.create(fields, [('id', '1'), ('name', 'foo')])
+        flare.fill(['title'], None)
+        copy = loads(dumps(flare))
+        self.assertEqual(copy, flare)
+        self.assertEqual(copy.title, None)
+        self.assertEqual(flare.copy(), flare)
+
+
 class ParseDateHelperTests(TestCase):
 
     def testParseDateHelper(self):
@@ -174,3 +512,27 @@ class ParseDateHelperTests(TestCase):
                          DateTime(999, 12, 31, 0, 0, 0, 'GMT').ISO8601())
         self.assertEqual(parseDate('99-12-31T00:00:00.000Z').ISO8601(),
                          DateTime('0099-12-31T00:00:00.000Z').ISO8601())
+
+    def testParseDateIsCached(self):
+        dateCache.clear()
+        first = parseDate('2007-08-11T00:00:00.000Z')
+        self.failUnless(parseDate('2007-08-11T00:00:00.000Z') is first)
+        self.assertEqual((dateCache.hits, dateCache.misses), (1, 1))
+
+    def testParseDateFormats(self):
+        for value in ('2007-08-11T13:14:15Z', '2007-08-11T13:14:15.1Z',
+                      '2007-08-11T13:14:15.123Z', '1969-12-31T23:59:59.999Z',
+                      '0999-12-31T00:00:00Z', '1582-10-04T12:00:00Z',
+                      '2499-12-31T00:00:00Z', '2007-08-11 13:14:15 GMT+2'):
+            date = parseDate(value)
+            self.assertEqual(date, DateTime(value))
+            self.assertEqual(date.ISO8601(), DateTime(value).ISO8601())
+            self.assertEqual(date.timezone(), DateTime(value).timezone())
+
+    def testParseDateAsDatetime(self):
+        self.assertEqual(parse_date_as_datetime('2007-08-11T13:14:15Z'),
+                         datetime(2007, 8, 11, 13, 14, 15))
+        self.assertEqual(parse_date_as_datetime('2007-08-11T13:14:15.1Z'),
+                         datetime(2007, 8, 11, 13, 14, 15, 100000))
+        self.assertEqual(parse_date_as_datetime('99-12-31T00:00:00.123Z'),
+                         datetime(99, 12, 31, 0, 0, 0, 123000))
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+from socket import socketpair
+from threading import Thread
+from unittest import TestCase, defaultTestLoader
+
+from collective.solr.pool import ConnectionPool
+from collective.solr.pool import PoolExhausted
+from collective.solr.pool import getPool
+from collective.solr.pool import clearPools
+from collective.solr.pool import isUsable
+from collective.solr.solr import SolrConnection
+from collective.solr.timeout import HTTPConnectionWithTimeout
+from collective.solr.tests.utils import getData, fakehttp
+
+
+class ConnectionPoolTests(TestCase):
+
+    def testCheckoutCreatesConnections(self):
+        pool = ConnectionPool('localhost:8983')
+        conn = pool.checkout()
+        self.failUnless(isinstance(conn, HTTPConnectionWithTimeout))
+        self.assertEqual(conn.host, 'localhost')
+        self.assertEqual(conn.port, 8983)
+        self.assertEqual(pool.active, 1)
+        self.assertNotEqual(pool.checkout(), conn)
+        self.assertEqual(pool.active, 2)
+
+    def testCheckinAllowsReuse(self):
+        pool = ConnectionPool('localhost:8983')
+        conn = pool.checkout()
+        pool.checkin(conn)
+        self.assertEqual(pool.active, 0)
+        self.assertEqual(len(pool.idle), 1)
+        self.assertEqual(pool.checkout(), conn)
+        self.assertEqual(len(pool.idle), 0)
+
+    def testCheckoutSetsTimeout(self):
+        pool = ConnectionPool('localhost:8983')
+        conn = pool.checkout(timeout=3)
+        self.assertEqual(conn.timeout, 3)
+        pool.checkin(conn)
+        self.assertEqual(pool.checkout(timeout=None).timeout, None)
+
+    def testIdleEviction(self):
+        pool = ConnectionPool('localhost:8983', idle_timeout=60)
+        old, new = pool.checkout(), pool.checkout()
+        pool.checkin(old)
+        pool.checkin(new)
+        pool.idle[0] = (old, pool.idle[0][1] - 61)  # pretend it's stale
+        self.assertEqual(pool.checkout(), new)
+        self.assertEqual(pool.idle, [])
+        self.assertNotEqual(pool.checkout(), old)
+
+    def testMaximumSize(self):
+        pool = ConnectionPool('localhost:8983', maxsize=1)
+        conn = pool.checkout()
+        self.assertRaises(PoolExhausted, pool.checkout, timeout=0.01)
+        log = []
+        thread = Thread(target=lambda: log.append(pool.checkout()))
+        thread.start()
+        pool.checkin(conn)          # a waiting thread gets the connection
+        thread.join()
+        self.assertEqual(log, [conn])
+        self.assertEqual(pool.active, 1)
+
+    def testWaitingIsBounded(self):
+        pool = ConnectionPool('localhost:8983', maxsize=1, wait_timeout=0.01)
+        pool.checkout()
+        self.assertRaises(PoolExhausted, pool.checkout)
+        self.assertRaises(PoolExhausted, pool.checkout, timeout=None)
+        self.assertEqual(pool.active, 1)
+
+    def testHealthCheck(self):
+        conn = HTTPConnectionWithTimeout('localhost:8983')
+        self.failUnless(isUsable(conn))
+        conn.sock, server = socketpair()
+        self.failUnless(isUsable(conn))
+        server.close()              # the server closed the connection...
+        self.failIf(isUsable(conn))
+        conn.close()
+        self.failUnless(isUsable(conn))
+        pool = ConnectionPool('localhost:8983')
+        conn = pool.checkout()
+        conn.sock, server = socketpair()
+        pool.checkin(conn)
+        server.close()
+        self.assertNotEqual(pool.checkout(), conn)  # ...so it's dropped
+        self.assertEqual(conn.sock, None)
+
+    def testSharedPools(self):
+        clearPools()
+        pool = getPool('localhost:8983')
+        self.assertEqual(getPool('localhost:8983'), pool)
+        self.assertNotEqual(getPool('localhost:8984'), pool)
+        self.assertEqual(getPool('localhost:8983', maxsize=5).maxsize, 5)
+        clearPools()
+        self.assertNotEqual(getPool('localhost:8983'), pool)
+
+
+class PooledSolrConnectionTests(TestCase):
+
+    def testConnectionIsCheckedOutLazily(self):
+        pool = ConnectionPool('localhost:8983')
+        c = SolrConnection(host='localhost:8983', pool=pool)
+        self.assertEqual(pool.active, 0)
+        c.setTimeout(5)
+        self.assertEqual(pool.active, 0)
+        self.assertEqual(c.conn.timeout, 5)
+        self.assertEqual(pool.active, 1)
+        c.close()
+        self.assertEqual(pool.active, 0)
+        self.assertEqual(len(pool.idle), 1)
+
+    def testFakedConnectionIsNotPooled(self):
+        pool = ConnectionPool('localhost:8983')
+        c = SolrConnection(host='localhost:8983', pool=pool)
+        output = fakehttp(c, getData('add_response.txt'))
+        self.assertEqual(pool.active, 0)    # the replaced one was checked in
+        self.assertEqual(len(pool.idle), 1)
+        c.add(id='500', name='python test doc')
+        self.assertEqual(len(c.flush()), 1)
+        self.assertEqual(str(output), getData('add_request.txt'))
+        c.close()
+        self.assertEqual(len(pool.idle), 1)
+
+    def testReleaseReturnsConnection(self):
+        pool = ConnectionPool('localhost:8983')
+        c = SolrConnection(host='localhost:8983', pool=pool)
+        conn = c.conn
+        c.release()
+        self.assertEqual(pool.active, 0)
+        self.assertEqual(c.conn, conn)      # checked out again
+        self.assertEqual(pool.active, 1)
+        c.conn = HTTPConnectionWithTimeout('localhost:8983')
+        self.assertEqual(pool.active, 0)    # replaced, so checked in
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
@@ -2,15 +2,21 @@
 
 from DateTime import DateTime
 from Missing import MV
+from collective.solr.cache import resultCache
+from collective.solr.coalesce import searches
 from collective.solr.interfaces import ISolrConnectionConfig
 from collective.solr.manager import SolrConnectionConfig
 from collective.solr.manager import SolrConnectionManager
 from collective.solr.queryparser import quote
 from collective.solr.search import Search
+from collective.solr.search import cacheKey
 from collective.solr.tests.utils import fakehttp
 from collective.solr.tests.utils import getData
+from collective.solr.tests import treequote
+from random import Random
 from unittest import TestCase
 from zope.component import provideUtility
+from zope.component import queryUtility
 
 
 class QuoteTests(TestCase):
@@ -170,6 +176,28 @@ class QuoteTests(TestCase):
                          '1976-03-06T23:59:59.999Z]')
 
 
+class QuoteFuzzTests(TestCase):
+
+    # characters, words and snippets to build random queries from
+    pieces = list(' \t&|+-!(){}[]^"~*?:\\/') + [
+        'foo', 'bar', 'TO', ' TO ', 'AND', 'OR', '0', '1', '0.8', 'nan',
+        '&&', '||', '[* TO *]', '"foo bar"', '\xc3\xa4', '  ']
+
+    def testQuotingMatchesReference(self):
+        # the single-pass implementation must produce exactly the same
+        # output as the original one building a tree of groups
+        random = Random(42)
+        for i in xrange(10000):
+            term = ''.join(random.choice(self.pieces)
+                           for j in xrange(random.randint(0, 12)))
+            if i % 10 == 0:
+                term = term.decode('utf-8')
+            for textfield in False, True:
+                self.assertEqual(quote(term, textfield),
+                                 treequote.quote(term, textfield),
+                                 'quoting %r (%r)' % (term, textfield))
+
+
 class QueryTests(TestCase):
 
     def setUp(self):
@@ -343,6 +371,8 @@ class SearchTests(TestCase):
     def tearDown(self):
         self.mngr.closeConnection()
         self.mngr.setHost(active=False)
+        resultCache.invalidate()
+        resultCache.clear()
 
     def testSimpleSearch(self):
         schema = getData('schema.xml')
@@ -362,3 +392,68 @@ class SearchTests(TestCase):
         self.assertEqual(match.sku, '500')
         self.assertEqual(match.timestamp.ISO8601(),
                          DateTime('2008-02-29 16:11:46.998 GMT').ISO8601())
+
+    def testJSONSearch(self):
+        schema = getData('schema.xml')
+        body = getData('complex_json_response.txt')
+        search = 'HTTP/1.1 200 OK\nContent-Type: application/json\n' \
+                 'Content-Length: %d\n\n%s' % (len(body), body)
+        output = fakehttp(self.conn, schema, search)    # fake responses
+        results = self.search('id:[* TO *]', wt='json').results()
+        request = output.get(skip=1)
+        self.failUnless('wt=json' in request)
+        self.failUnless('json.nl=map' in request)
+        self.assertEqual(results.numFound, '2')
+        self.assertEqual(results[0].id, 'SOLR1000')
+        self.assertEqual(results[0].timestamp.ISO8601(),
+                         DateTime('2008-03-01 00:13:11.767 GMT').ISO8601())
+        self.assertEqual(results[1].sku, '2008-03-01T00:13:11.814Z')
+
+    def testJavabinSearch(self):
+        body = getData('complex_javabin_response.bin')
+        search = 'HTTP/1.1 200 OK\nContent-Type: application/octet-stream\n' \
+                 'Content-Length: %d\n\n%s' % (len(body), body)
+        output = fakehttp(self.conn, search)
+        results = self.search('id:[* TO *]', wt='javabin').results()
+        self.failUnless('wt=javabin' in output.get())
+        self.assertEqual(results.numFound, '2')
+        self.assertEqual(results[0].id, 'SOLR1000')
+        self.assertEqual(results[0].timestamp.ISO8601(),
+                         DateTime('2008-03-01 00:13:11.767 GMT').ISO8601())
+
+    def testCachedSearch(self):
+        config = queryUtility(ISolrConnectionConfig)
+        config.cache_size = 64
+        search = getData('search_response.txt')
+        output = fakehttp(self.conn, search, search)
+        results = self.search('id:[* TO *]', rows=10, wt='xml').results()
+        self.assertEqual(results[0].id, '500')
+        self.failUnless(output.get().startswith('POST /solr/select'))
+        results = self.search('id:[* TO *]', rows=10, wt='xml').results()
+        self.assertEqual(results[0].id, '500')
+        self.assertEqual(len(output), 0)        # no request was sent
+        self.assertEqual((resultCache.hits, resultCache.misses), (1, 1))
+        resultCache.invalidate()    # i.e. changes have been committed
+        results = self.search('id:[* TO *]', rows=10, wt='xml').results()
+        self.failUnless(output.get().startswith('POST /solr/select'))
+
+    def testCoalescedSearch(self):
+        config = queryUtility(ISolrConnectionConfig)
+        config.coalesce_timeout = 1.0
+        calls = searches.calls
+        output = fakehttp(self.conn, getData('search_response.txt'))
+        results = self.search('id:[* TO *]', rows=10, wt='xml').results()
+        self.failUnless(output.get().startswith('POST /solr/select'))
+        self.assertEqual(results[0].id, '500')
+        self.assertEqual(searches.calls, calls + 1)
+        self.assertEqual(searches.flights, {})
+
+    def testCacheKey(self):
+        config = SolrConnectionConfig()
+        query = {'a': '+a:1', 'b': '+b:2'}
+        key = cacheKey(config, query, dict(fq=['+c:3', '+d:4'], rows=10))
+        self.assertEqual(key, cacheKey(
+            config, '+a:1 +b:2', dict(rows=10, fq=['+d:4', '+c:3'])))
+        self.assertNotEqual(key, cacheKey(
+            config, '+a:1 +b:2', dict(rows=20, fq=['+d:4', '+c:3'])))
+        hash(key)
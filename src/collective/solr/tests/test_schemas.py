@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+from os.path import exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from unittest import TestCase, defaultTestLoader
+
+from collective.solr import schemas
+from collective.solr.parser import SolrSchema
+from collective.solr.schemas import clearSchemas
+from collective.solr.schemas import getSchema
+from collective.solr.tests.utils import getData
+
+
+def schemaData(name='plone_schema.xml'):
+    return getData(name).split('\n\n', 1)[1]
+
+
+class SchemaCacheTests(TestCase):
+
+    def setUp(self):
+        clearSchemas()
+        self.fetched = []
+        self.data = schemaData()
+        self.tmp = mkdtemp()
+
+    def tearDown(self):
+        clearSchemas()
+        rmtree(self.tmp)
+
+    def fetch(self):
+        self.fetched.append(self.data)
+        return self.data and SolrSchema(self.data) or None
+
+    def expire(self, key='foo'):
+        schema, expires = schemas.schemas[key]
+        schemas.schemas[key] = (schema, 0)
+
+    def testSchemaIsShared(self):
+        schema = getSchema('foo', self.fetch)
+        self.assertEqual(schema.uniqueKey, 'UID')
+        self.failUnless(getSchema('foo', self.fetch) is schema)
+        self.assertEqual(len(self.fetched), 1)
+        self.failIf(getSchema('bar', self.fetch) is schema)
+        self.assertEqual(len(self.fetched), 2)
+        clearSchemas()
+        self.failIf(getSchema('foo', self.fetch) is schema)
+        self.assertEqual(len(self.fetched), 3)
+
+    def testUnchangedSchemaIsKept(self):
+        schema = getSchema('foo', self.fetch)
+        self.expire()
+        self.failUnless(getSchema('foo', self.fetch) is schema)
+        self.assertEqual(len(self.fetched), 2)
+        self.data = schemaData('plone_schema_json.txt')
+        self.expire()
+        changed = getSchema('foo', self.fetch)
+        self.failIf(changed is schema)
+        self.assertEqual(changed.digest, SolrSchema(self.data).digest)
+
+    def testNoExpiry(self):
+        schema = getSchema('foo', self.fetch, ttl=0)
+        self.assertEqual(schemas.schemas['foo'], (schema, None))
+
+    def testFailingFetch(self):
+        self.data = None
+        self.assertEqual(getSchema('foo', self.fetch), None)
+        self.assertEqual(getSchema('foo', self.fetch), None)
+        self.assertEqual(len(self.fetched), 2)      # not cached
+        self.data = schemaData()
+        schema = getSchema('foo', self.fetch)
+        self.data = None
+        self.expire()
+        self.failUnless(getSchema('foo', self.fetch) is schema)  # stale
+        self.failUnless(getSchema('foo', self.fetch) is schema)
+        self.assertEqual(len(self.fetched), 4)      # retried later
+
+    def testSnapshot(self):
+        snapshot = join(self.tmp, 'schema')
+        schema = getSchema('foo', self.fetch, snapshot=snapshot)
+        self.assertEqual(open(snapshot).read(), schema.source)
+        self.failIf(exists(snapshot + '.tmp'))
+        clearSchemas()              # i.e. restarting while solr is down
+        self.data = None
+        restored = getSchema('foo', self.fetch, snapshot=snapshot)
+        self.assertEqual(restored.digest, schema.digest)
+        self.assertEqual(restored.uniqueKey, 'UID')
+        self.assertEqual(len(self.fetched), 1)      # solr wasn't asked
+        self.data = schemaData()
+        self.expire()
+        self.failUnless(getSchema('foo', self.fetch) is restored)
+        self.assertEqual(len(self.fetched), 2)
+
+    def testBrokenSnapshot(self):
+        snapshot = join(self.tmp, 'schema')
+        open(snapshot, 'w').write('<broken')
+        schema = getSchema('foo', self.fetch, snapshot=snapshot)
+        self.assertEqual(len(self.fetched), 1)
+        self.assertEqual(open(snapshot).read(), schema.source)
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
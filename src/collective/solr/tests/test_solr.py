@@ -1,9 +1,22 @@
 from unittest import TestCase
 from xml.etree.cElementTree import fromstring
+from zlib import compress, decompress, MAX_WBITS
+from collective.solr.parser import SolrResponse
 from collective.solr.solr import SolrConnection
+from collective.solr.solr import logger as logger_solr
+from collective.solr.solr import compress as gzip
 from collective.solr.tests.utils import getData, fakehttp
 
 
+def compressed(response, encoding='gzip'):
+    """ return a compressed version of the given http response """
+    head, body = response.split('\n\n', 1)
+    data = encoding == 'gzip' and gzip(body) or compress(body)
+    head = head.replace('Content-Length: %d' % len(body),
+                        'Content-Length: %d' % len(data))
+    return '%s\nContent-Encoding: %s\n\n%s' % (head, encoding, data)
+
+
 class TestSolr(TestCase):
 
     def test_add(self):
@@ -120,3 +133,144 @@ class TestSolr(TestCase):
         self.failUnlessEqual(node.attrib['name'], 'QTime')
         self.failUnlessEqual(node.text, '0')
         res.find('QTime')
+
+    def test_compressed_search_response(self):
+        for encoding in 'gzip', 'deflate':
+            c = SolrConnection(host='localhost:8983', persistent=True)
+            fakehttp(c, compressed(getData('search_response.txt'), encoding))
+            res = c.search(q='+id:[* TO *]', wt='xml')
+            results = SolrResponse(res).results()
+            self.assertEqual(results.numFound, '1')
+            self.assertEqual(results[0].id, '500')
+
+    def test_compressed_update(self):
+        c = SolrConnection(host='localhost:8983', persistent=True,
+                           compressThreshold=100)
+        output = fakehttp(c, getData('add_response.txt'),
+                          getData('add_response.txt'))
+        c.add(id='500', name='python test doc')
+        c.flush()                           # small enough to be sent as is
+        self.failIf('Content-Encoding' in output.get())
+        c.add(id='500', name='python test doc' * 10)
+        res = c.flush()
+        head, body = output.get().split('\n\n', 1)
+        self.failUnless('Content-Encoding: gzip' in head)
+        self.assertEqual(decompress(body, 16 + MAX_WBITS),
+                         '<add><doc><field name="id">500</field><field '
+                         'name="name">%s</field></doc></add>' % (
+                             'python test doc' * 10))
+        self.assertEqual(len(res), 1)
+
+    def test_batched_updates(self):
+        c = SolrConnection(host='localhost:8983', persistent=True,
+                           batchSize=2)
+        c.uniqueKey = 'id'
+        response = getData('add_response.txt')
+        output = fakehttp(c, *[response] * 4)
+        c.add(id='1', name='foo')
+        c.add(id='2', name='bar')
+        c.add(id='1', name='foo bar')       # replaces the first update
+        c.add(id='3', name='baz')
+        c.delete('4')
+        c.delete('5')
+        c.deleteByQuery('name:foo')
+        res = c.flush()
+        self.assertEqual(len(res), 4)
+        body = lambda: output.get().split('\n\n', 1)[1]
+        self.assertEqual(body(), '<add>'
+                         '<doc><field name="id">2</field>'
+                         '<field name="name">bar</field></doc>'
+                         '<doc><field name="id">1</field>'
+                         '<field name="name">foo bar</field></doc></add>')
+        self.assertEqual(body(), '<add><doc><field name="id">3</field>'
+                         '<field name="name">baz</field></doc></add>')
+        self.assertEqual(body(), '<delete><id>4</id><id>5</id></delete>')
+        self.assertEqual(body(), '<delete><query>name:foo</query></delete>')
+        self.assertEqual(c.xmlbody, [])
+        self.assertEqual(c.xmlparts, [])
+
+    def test_batched_updates_keep_order(self):
+        c = SolrConnection(host='localhost:8983', persistent=True,
+                           batchSize=10, batchBytes=100)
+        c.uniqueKey = 'id'
+        response = getData('add_response.txt')
+        output = fakehttp(c, *[response] * 5)
+        c.add(id='1', name='foo')
+        c.deleteByQuery('name:foo')         # updates aren't merged across
+        c.add(id='1', name='foo')
+        c.add(id='2', name='bar', commitWithin='1000')
+        c.delete('1')                       # replaces the second add
+        c.add(id='3', name='x' * 50)        # too big for the batch
+        c.flush()
+        body = lambda: output.get().split('\n\n', 1)[1]
+        self.failUnless(body().startswith('<add><doc><field name="id">1<'))
+        self.assertEqual(body(), '<delete><query>name:foo</query></delete>')
+        self.failUnless(body().startswith('<add commitWithin="1000"><doc>'))
+        self.assertEqual(body(), '<delete><id>1</id></delete>')
+        self.failUnless(body().startswith('<add><doc><field name="id">3<'))
+
+    def test_failed_batch_is_retried(self):
+        c = SolrConnection(host='localhost:8983', persistent=True,
+                           batchSize=10)
+        error = 'HTTP/1.1 400 Bad Request\nContent-Length: 0\n\n'
+        response = getData('add_response.txt')
+        output = fakehttp(c, error, response, error, response)
+        c.add(id='1', name='foo')
+        c.add(id='2', name='bar')
+        c.add(id='3', name='baz')
+        res = c.flush()
+        self.assertEqual(len(res), 2)
+        self.assertEqual(len(output), 4)
+        self.assertEqual(output.get(1).count('<doc>'), 1)
+
+    def test_retried_batch_requests_are_counted_once(self):
+        c = SolrConnection(host='localhost:8983', persistent=True,
+                           batchSize=10)
+        error = 'HTTP/1.1 400 Bad Request\nContent-Length: 0\n\n'
+        response = getData('add_response.txt')
+        output = fakehttp(c, error, response, response, response)
+        c.add(id='1', name='foo')
+        c.add(id='2', name='bar')
+        c.add(id='3', name='baz')
+        log = []
+        logger_solr.debug = lambda *args: log.append(args)
+        try:
+            c.flush()
+        finally:
+            del logger_solr.debug
+        self.assertEqual(len(output), 4)
+        self.assertEqual(log[-1][-1], 3)    # retries, not the failed batch
+
+    def test_update(self):
+        c = SolrConnection(host='localhost:8983', persistent=True)
+        output = fakehttp(c, getData('add_response.txt'))
+        c.update('id', id='500', _version_=1, cat=[], features=['a', 'b'],
+                 commitWithin='1000')
+        res = c.flush()
+        self.assertEqual(len(res), 1)
+        body = output.get().split('\n\n', 1)[1]
+        self.failUnless(body.startswith('<add commitWithin="1000"><doc>'))
+        self.failUnless('<field name="id">500</field>' in body)
+        self.failUnless('<field name="_version_">1</field>' in body)
+        self.failUnless('<field name="cat" update="set" null="true"/>' in body)
+        self.failUnless('<field name="features" update="set">a</field>'
+                        '<field name="features" update="set">b</field>'
+                        in body)
+
+    def test_realtime_get(self):
+        c = SolrConnection(host='localhost:8983', persistent=True)
+        output = fakehttp(c, getData('search_response.txt'))
+        res = c.get('500', 'a,b', fl='id')
+        self.assertEqual(SolrResponse(res).results()[0].id, '500')
+        request = output.get()
+        self.failUnless(request.startswith('POST /solr/get HTTP/1.1'))
+        self.assertEqual(sorted(request.split('\n\n', 1)[1].split('&')),
+                         ['fl=id', 'ids=500%2Ca%5C%2Cb'])
+
+    def test_schema_api(self):
+        c = SolrConnection(host='localhost:8983', persistent=True)
+        output = fakehttp(c, getData('plone_schema_json.txt'))
+        schema = c.getSchema()
+        self.failUnless(output.get().startswith('GET /solr/schema?wt=json'))
+        self.assertEqual(schema.uniqueKey, 'UID')
+        self.assertEqual(schema['path_depth'].class_, 'solr.IntField')
@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+from AccessControl.SecurityManagement import newSecurityManager
+from AccessControl.SecurityManagement import noSecurityManager
+from AccessControl.User import SimpleUser
+from DateTime import DateTime
+from copy import deepcopy
+from unittest import TestCase, defaultTestLoader
+from zope.component import provideUtility
+
+from collective.solr.interfaces import ISolrConnectionConfig
+from collective.solr.manager import SolrConnectionConfig
+from collective.solr.manager import SolrConnectionManager
+from collective.solr.search import Search
+from collective.solr.tests.utils import getData, fakehttp
+from collective.solr.translation import EFFECTIVE
+from collective.solr.translation import TOKEN
+from collective.solr.translation import USER
+from collective.solr.translation import freeze
+from collective.solr.translation import templateKey
+from collective.solr.translation import translations
+
+now = DateTime('2015/05/05 12:34:56.789 GMT+0')
+
+queries = [
+    dict(SearchableText='foo'),
+    dict(SearchableText=u'f\xf6\xf6 bar*', portal_type='Document'),
+    dict(portal_type=['Document', 'News Item'], sort_on='sortable_title',
+         sort_order='reverse', sort_limit=5),
+    dict(path={'query': '/plone/news', 'depth': 1}, b_start=10, b_size=5),
+    dict(path=['/plone/foo', '/plone/bar']),
+    dict(created={'query': [DateTime('2015/01/01 GMT+0'), now],
+                  'range': 'min:max'}),
+    dict(Subject={'query': ['foo', 'bar'], 'operator': 'and'}),
+    dict(is_folderish=True, review_state='published'),
+    dict(Title='foo "bar"', Language=['en', '']),
+    dict(UID='8a3f0b7c', facet='true', facet_field=['portal_type']),
+    dict(review_state='published', effectiveRange=now,
+         allowedRolesAndUsers=['Anonymous']),
+    dict(SearchableText='foo', effectiveRange=now,
+         allowedRolesAndUsers=['Member', 'Authenticated', 'user:joe',
+                               'user:Reviewers', 'Anonymous']),
+    dict(effectiveRange=now, allowedRolesAndUsers=['user:joe', 'Member'],
+         portal_type='Event', sort_on='effective'),
+]
+
+
+class TranslationTests(TestCase):
+
+    def setUp(self):
+        self.config = SolrConnectionConfig()
+        self.config.filter_queries = ['portal_type', 'review_state']
+        provideUtility(self.config, ISolrConnectionConfig)
+        self.mngr = SolrConnectionManager()
+        self.mngr.setHost(active=True)
+        conn = self.mngr.getConnection()
+        fakehttp(conn, getData('catalog_schema.xml'))
+        self.mngr.getSchema()                   # read and cache the schema
+        self.search = Search()
+        self.search.manager = self.mngr
+        translations.clear()
+
+    def tearDown(self):
+        noSecurityManager()
+        self.mngr.closeConnection()
+        self.mngr.setHost(active=False)
+        translations.clear()
+
+    def login(self, userid, roles=('Member',)):
+        newSecurityManager(None, SimpleUser(userid, '', roles, []))
+
+    def compare(self, args):
+        """ translate the arguments with and without caching """
+        expected = self.search.translateQuery(**deepcopy(args))
+        result = self.search.buildQueryAndParameters(**deepcopy(args))
+        self.assertEqual(result, expected)
+        return result
+
+    def testSameResults(self):
+        self.login('joe')
+        for args in queries:
+            self.compare(args)
+        self.assertEqual(translations.hits, 0)
+        for args in queries:
+            self.compare(args)
+        self.assertEqual(translations.hits, len(queries))
+
+    def testAutomaticFilterQueries(self):
+        self.config.auto_filter_queries = True
+        self.login('joe')
+        for args in queries + queries:
+            self.compare(args)
+        self.assertEqual(translations.hits, len(queries))
+        self.login('zoe')
+        args = deepcopy(queries[-2])
+        args['allowedRolesAndUsers'][2] = 'user:zoe'
+        query, params = self.compare(args)
+        self.assertEqual(query.keys(), ['SearchableText'])
+        self.assertEqual(params['fq'], [
+            '+allowedRolesAndUsers:(user$zoe OR Anonymous OR Authenticated '
+            'OR Member OR user$Reviewers)',
+            '+effective:[* TO 2015-05-05T12:34:56.789Z]',
+            '+expires:[2015-05-05T12:34:56.789Z TO *]'])
+        self.assertEqual(translations.hits, len(queries) + 1)
+
+    def testTermsQueryParser(self):
+        self.config.auto_filter_queries = True
+        self.config.terms_threshold = 3
+        uids = ['uid%03d' % idx for idx in range(10)]
+        for userid in 'joe', 'zoe', 'john doe', 'jane doe', 'a(b)', 'aaron':
+            self.login(userid)
+            token = 'user:%s' % userid
+            args = dict(UID=uids, effectiveRange=now,
+                        allowedRolesAndUsers=[token, 'Member', 'Anonymous',
+                                              'user:Reviewers'])
+            query, params = self.compare(args)
+            self.assertEqual(params['fq'][:2], [
+                '{!terms f=UID}%s' % ','.join(uids),
+                '{!terms f=allowedRolesAndUsers}user$%s,Anonymous,Member,'
+                'user$Reviewers' % userid])
+            # below the threshold the values get quoted as needed
+            args['allowedRolesAndUsers'] = [token, 'Member']
+            query, params = self.compare(args)
+            self.failUnless(params['fq'][0].startswith('{!terms f=UID}'))
+            self.failIf(params['fq'][1].startswith('{!terms'))
+        # tokens with and without the need for quotes use separate templates
+        self.assertEqual(len(translations), 4)
+        self.assertEqual(translations.hits, 8)
+
+    def testTemplatesAreCopied(self):
+        query, params = self.compare(queries[2])
+        query.clear()
+        params.clear()
+        self.compare(queries[2])
+        self.assertEqual(translations.hits, 1)
+
+    def testEffectiveRangeIsParameterized(self):
+        self.login('joe')
+        args = queries[-1]
+        self.compare(args)
+        for seconds in range(1, 1000, 33):
+            self.compare(dict(args, effectiveRange=now + seconds / 86400.0))
+        self.assertEqual(len(translations), 1)
+        self.config.effective_steps = 300
+        self.compare(dict(args, effectiveRange=now + 0.5))
+        self.compare(dict(args, effectiveRange=now + 0.6))
+        self.assertEqual(len(translations), 2)
+
+    def testUserTokenIsParameterized(self):
+        args = queries[-2]
+        for userid in 'joe', 'aaron', 'zoe', 'j\xc3\xb6rg-m\xc3\xbcller':
+            self.login(userid)
+            token = 'user:%s' % userid
+            allowed = [token if item == 'user:joe' else item
+                       for item in args['allowedRolesAndUsers']]
+            query, params = self.compare(
+                dict(args, allowedRolesAndUsers=allowed))
+            self.failUnless(token.replace(':', '$') in
+                            query['allowedRolesAndUsers'])
+        self.assertEqual(len(translations), 1)
+        self.assertEqual(translations.hits, 3)
+
+    def testUserTokenExcluded(self):
+        self.config.exclude_user = True
+        self.login('joe')
+        query, params = self.compare(queries[-2])
+        self.failIf('joe' in query['allowedRolesAndUsers'])
+        self.login('zoe')
+        args = deepcopy(queries[-2])
+        args['allowedRolesAndUsers'][2] = 'user:zoe'
+        self.assertEqual(self.compare(args), (query, params))
+
+    def testAmbiguousTokensAreNotCached(self):
+        self.login('joe')
+        args = dict(allowedRolesAndUsers=['user:joe', 'user:joey'])
+        self.compare(args)
+        self.compare(args)
+        self.assertEqual(len(translations), 0)
+
+    def testKeys(self):
+        self.login('joe')
+        schema = self.mngr.getSchema()
+        key, values = templateKey(None, queries[-1], self.config, schema)
+        self.assertEqual(values, {EFFECTIVE: '2015-05-05T12:34:56.789Z',
+                                  USER: 'user$joe'})
+        self.login('john doe')
+        args = dict(queries[-1], allowedRolesAndUsers=['user:john doe'])
+        self.assertEqual(templateKey(None, args, self.config, schema)[1],
+                         {EFFECTIVE: '2015-05-05T12:34:56.789Z',
+                          USER: '"user$john doe"', TOKEN: 'user$john doe'})
+        self.login('joe')
+        self.assertEqual(key, templateKey(None, dict(queries[-1],
+            effectiveRange=now + 1), self.config, schema)[0])
+        # the types of values matter, e.g. `True` and `1`...
+        self.assertNotEqual(freeze(True, []), freeze(1, []))
+        self.assertNotEqual(freeze(['a'], []), freeze(('a',), []))
+        self.assertRaises(TypeError, freeze, object(), [])
+        self.assertRaises(TypeError, templateKey, None,
+                          dict(SearchableText='2015-05-05T12:34:56.789Z',
+                               effectiveRange=now), self.config, schema)
+
+
+def test_suite():
+    return defaultTestLoader.loadTestsFromName(__name__)
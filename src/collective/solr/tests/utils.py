@@ -117,6 +117,24 @@ def fakemore(solrconn, *fakedata):
     solrconn.conn.fakedata.extend(fakedata)
 
 
+def searchResponse(*docs):
+    """ helper to build a fake http response with a result set containing
+        the given documents, which are passed as dictionaries """
+    types = {int: 'int', float: 'float', bool: 'bool'}
+    body = []
+    for doc in docs:
+        body.append('<doc>')
+        for name, value in sorted(doc.items()):
+            tag = types.get(type(value), 'str')
+            body.append('<%s name="%s">%s</%s>' % (tag, name, value, tag))
+        body.append('</doc>')
+    body = ('<?xml version="1.0" encoding="UTF-8"?>\n<response>'
+            '<result name="response" numFound="%d" start="0">%s</result>'
+            '</response>' % (len(docs), ''.join(body)))
+    return ('HTTP/1.1 200 OK\nContent-Type: text/xml; charset=utf-8\n'
+            'Content-Length: %d\n\n%s' % (len(body), body))
+
+
 def fakeServer(actions, port=55555):
     """ helper to set up and activate a fake http server used for testing
         purposes; <actions> must be a list of handler functions, which will
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+# caching of query translations, i.e. the results of
+# `Search.buildQueryAndParameters`;  the translations are stored as templates
+# keyed by a hashable form of the catalog arguments, with the parts varying
+# between otherwise identical queries -- the (rounded) date used for
+# "effectiveRange" and the token of the current user -- replaced by
+# placeholders, which are filled in again when the template is used.  the
+# token is usually quoted, but used as is with the terms query parser, so
+# tokens needing quotes get a second placeholder for their raw form.
+
+from DateTime import DateTime
+from collective.solr.cache import LRUCache
+from collective.solr.mangler import effectiveDate
+from collective.solr.mangler import iso8601date
+from collective.solr.mangler import userToken
+from collective.solr.queryparser import quoteItem
+
+EFFECTIVE = '\0effective\0'
+USER = '\0user\0'
+TOKEN = '\0token\0'
+
+translations = LRUCache(maxsize=1000)
+
+
+def freeze(value, texts):
+    """ return a hashable version of the given value, keeping the types
+        involved as they matter for the translation;  all strings (and
+        dates) are collected in `texts`;  a `TypeError` is raised for
+        values that can't be handled """
+    if isinstance(value, basestring):
+        texts.append(value)
+        return value.__class__, value
+    elif value is None or isinstance(value, (bool, int, long, float)):
+        return value.__class__, value
+    elif isinstance(value, DateTime):
+        texts.append(iso8601date(value))
+        return DateTime, value.timeTime()
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        items = tuple(freeze(item, texts) for item in value)
+        if isinstance(value, (set, frozenset)):
+            items = frozenset(items)
+        return value.__class__, items
+    elif isinstance(value, dict):
+        return dict, tuple(sorted((freeze(key, texts), freeze(item, texts))
+                                  for key, item in value.items()))
+    elif getattr(value, 'query', None):       # i.e. `ZPublisher` records
+        return value.__class__, freeze(vars(value), texts)
+    raise TypeError('unsupported value: %r' % (value,))
+
+
+def templateKey(default, args, config, schema):
+    """ return the key for looking up the translation of the given
+        arguments along with the values to fill into the template;  a
+        `TypeError` is raised if the arguments can't be cached """
+    digest = getattr(schema, 'digest', None)
+    if digest is None:
+        raise TypeError('no schema')
+    args = dict(args)
+    values = {}
+    effective = args.get('effectiveRange')
+    if isinstance(effective, DateTime):
+        values[EFFECTIVE] = effectiveDate(effective, config)
+        args['effectiveRange'] = EFFECTIVE
+    token = userToken()
+    allowed = args.get('allowedRolesAndUsers')
+    if token is not None and isinstance(allowed, (list, tuple)):
+        allowed = [USER if item.replace(':', '$') == token else item
+                   for item in allowed]
+        if USER in allowed:
+            values[USER] = quoteItem(token)
+            if values[USER] != token:
+                values[TOKEN] = token
+            args['allowedRolesAndUsers'] = allowed
+    texts = []
+    key = (
+        freeze(default, texts),
+        freeze(args, texts),
+        digest,
+        getattr(config, 'search_pattern', None),
+        getattr(config, 'levenshtein_distance', 0),
+        getattr(config, 'exclude_user', False),
+        getattr(config, 'effective_steps', 1),
+        tuple(getattr(config, 'filter_queries', ())),
+        getattr(config, 'auto_filter_queries', False),
+        getattr(config, 'terms_threshold', 0),
+        tuple(sorted(values)),
+    )
+    # the values replaced by placeholders mustn't appear anywhere else
+    for text in texts:
+        if '\0' in text and text not in values:
+            raise TypeError('unsupported value: %r' % text)
+        for value in values.values():
+            if value in text:
+                raise TypeError('ambiguous value: %r' % value)
+    return key, values
+
+
+def replace(value, pairs):
+    """ replace strings in the given (nested) query or parameters,
+        returning a copy """
+    if isinstance(value, basestring):
+        for old, new in pairs:
+            value = value.replace(old, new)
+        return value
+    elif isinstance(value, (list, tuple)):
+        return value.__class__(replace(item, pairs) for item in value)
+    elif isinstance(value, dict):
+        return dict((key, replace(item, pairs))
+                    for key, item in value.items())
+    return value
+
+
+def count(value, text):
+    """ count the occurrences of `text` in the given query or parameters """
+    if isinstance(value, basestring):
+        return value.count(text)
+    elif isinstance(value, (list, tuple)):
+        return sum(count(item, text) for item in value)
+    elif isinstance(value, dict):
+        return sum(count(item, text) for item in value.values())
+    return 0
+
+
+def makeTemplate(query, params, values):
+    """ turn a translation into a template by replacing the given values
+        by their placeholders;  `None` is returned if that's not possible
+        unambiguously """
+    if USER in values:
+        forms = set([values[USER], values.get(TOKEN, values[USER])])
+        if len(forms) == 2 and values[TOKEN] in values[USER]:
+            forms.remove(values[USER])      # counted via the raw form
+        found = sum(count(query, form) + count(params, form)
+                    for form in forms)
+        if found > 1:
+            return None     # the token is part of another one, e.g. a group
+    # longer values first, so the quoted token is replaced before its
+    # raw form contained in it
+    pairs = sorted(((value, name) for name, value in values.items()),
+                   key=lambda pair: -len(pair[0]))
+    return replace(query, pairs), replace(params, pairs)
+
+
+def fillTemplate(template, values):
+    """ return the query and parameters for a template, using the given
+        values for its placeholders """
+    query, params = template
+    pairs = values.items()
+    return replace(query, pairs), replace(params, pairs)
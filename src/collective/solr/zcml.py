@@ -2,9 +2,13 @@
 from zope.interface import Interface
 from zope import schema
 from zope.component.zcml import utility
+from zope.configuration.fields import Path
+from zope.configuration.fields import Tokens
 
 from collective.solr.interfaces import IZCMLSolrConnectionConfig
+from collective.solr.journal import getJournal
 from collective.solr.manager import ZCMLSolrConnectionConfig
+from collective.solr.schemas import SCHEMA_TTL
 
 
 class ISolrConnectionConfigDirective(Interface):
@@ -28,9 +32,52 @@ class ISolrConnectionConfigDirective(Interface):
         required=True,
     )
 
+    replicas = Tokens(
+        title=u"Replicas",
+        description=u"Solr instances replicating the above one, which "
+                    u"should be used for searching instead, given as "
+                    u"space-separated list of \"host:port/base\" entries.",
+        value_type=schema.ASCIILine(),
+        required=False,
+    )
+
+    schema_ttl = schema.Int(
+        title=u"Schema TTL",
+        description=u"The number of seconds after which the schema is "
+                    u"fetched again to pick up changes, or 0 to never "
+                    u"refresh it.",
+        required=False,
+    )
+
+    schema_snapshot = Path(
+        title=u"Schema snapshot",
+        description=u"A file to keep a copy of the last schema fetched "
+                    u"in, which is used after restarts until the Solr "
+                    u"server has been reached.",
+        required=False,
+    )
+
+    journal = Path(
+        title=u"Journal",
+        description=u"A file index updates are written to at the end of "
+                    u"each transaction instead of sending them to Solr "
+                    u"right away.  They are sent by a background thread, "
+                    u"which retries them until Solr can be reached.  "
+                    u"Instances may share the file where `flock` is "
+                    u"available.",
+        required=False,
+    )
+
 
-def solrConnectionConfigDirective(_context, host, port, base):
+def solrConnectionConfigDirective(_context, host, port, base, replicas=(),
+                                  schema_ttl=SCHEMA_TTL, schema_snapshot=None,
+                                  journal=None):
 
+    config = ZCMLSolrConnectionConfig(host, port, base, replicas,
+                                      schema_ttl, schema_snapshot, journal)
     utility(_context,
             provides=IZCMLSolrConnectionConfig,
-            component=ZCMLSolrConnectionConfig(host, port, base))
+            component=config)
+    if journal is not None:     # send updates left over from the last run
+        _context.action(discriminator=None, callable=getJournal,
+                        args=(journal, config.host, config.base))